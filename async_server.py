@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+
+# Configurar las direcciones
+HOST = '127.0.0.1'  # localhost
+PORT = 55559
+
+# Mensajes pendientes por cliente antes de considerarlo lento y desconectarlo
+QUEUE_SIZE = 256
+
+# Cliente conectado: lector, escritor y su cola de salida
+class Client:
+    def __init__(self, reader, writer, nickname):
+        self.reader = reader
+        self.writer = writer
+        self.nickname = nickname
+        # Cola acotada que vacía una tarea escritora propia del cliente
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.writer_task = None
+
+# Clientes registrados (ya con nickname)
+clients = set()
+
+# Función para eliminar y desconectar clientes
+def remove(client):
+    if client in clients:
+        clients.discard(client)
+        print(f"Cliente {client.nickname} ha desconectado")
+    if client.writer_task is not None:
+        client.writer_task.cancel()
+    client.writer.close()
+
+# Difundir mensajes a todos los clientes (anuncio)
+def broadcast(message, sender=None):
+    # Lista de clientes problemáticos
+    clients_to_remove = []
+
+    # Encolar sin esperar: un destinatario lento nunca frena a los demás
+    for client in clients:
+        if client is not sender:
+            try:
+                client.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                print(f"Cola llena para {client.nickname}, desconectando")
+                clients_to_remove.append(client)
+
+    # Eliminar clientes problemáticos
+    for client in clients_to_remove:
+        remove(client)
+        broadcast(f"{client.nickname} salió del chat.".encode('utf-8'))
+
+# Tarea escritora: vacía la cola de salida de un cliente
+async def write(client):
+    try:
+        while True:
+            message = await client.queue.get()
+            client.writer.write(message)
+            await client.writer.drain()
+    except (ConnectionError, OSError) as error:
+        print(f"Error enviando mensaje a {client.nickname}: {error}")
+        if client in clients:
+            remove(client)
+            broadcast(f"{client.nickname} salió del chat.".encode('utf-8'))
+
+# Manejar recepción y transmisión de mensajes de un cliente
+async def handle(client):
+    try:
+        while True:
+            message = await client.reader.read(1024)
+            if not message:
+                break
+            broadcast(message, client)
+    except (ConnectionError, OSError) as error:
+        print(f"Error recibiendo datos de {client.nickname}: {error}")
+
+    # El cliente salió (limpiamente o no)
+    if client in clients:
+        remove(client)
+        broadcast(f"{client.nickname} salió del chat.".encode('utf-8'))
+
+# Aceptar nuevas conexiones (una corrutina por cliente)
+async def accept(reader, writer):
+    address = writer.get_extra_info('peername')
+    print(f"Dirección {str(address)} conectada")
+
+    # Solicitar el nickname del cliente
+    try:
+        writer.write('NICK'.encode('utf-8'))
+        await writer.drain()
+        # Como en server.py: sin espacios ni saltos de línea y sin fallar con bytes que no son UTF-8
+        nickname = (await reader.read(1024)).decode('utf-8', errors='replace').strip()
+    except (ConnectionError, OSError):
+        writer.close()
+        return
+    if not nickname:
+        writer.close()
+        return
+
+    client = Client(reader, writer, nickname)
+    clients.add(client)
+    client.writer_task = asyncio.create_task(write(client))
+
+    # Anunciar la nueva conexión
+    print(f"El nickname del cliente es '{nickname}'.")
+    broadcast(f"{nickname} se unió al chat".encode('utf-8'), client)
+
+    await handle(client)
+
+# Crear el servidor asyncio (port=0 elige un puerto libre)
+async def start(host=HOST, port=PORT):
+    return await asyncio.start_server(accept, host, port, backlog=100, reuse_address=True)
+
+async def main(host=HOST, port=PORT):
+    server = await start(host, port)
+    print(f"-> Servidor asyncio escuchando en {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de chat (asyncio)")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.host, args.port))
@@ -0,0 +1,83 @@
+"""
+Coste y beneficio de la compresión negociada (zlib por conexión).
+
+Simula el flujo de salida de una conexión: mensajes de chat con texto
+realista que se comprimen en el mismo flujo zlib, con un volcado
+(Z_SYNC_FLUSH) por envío como hace el servidor al final de cada vuelta del
+bucle. Para cada tamaño de mensaje y número de mensajes por envío mide los
+bytes en la red por mensaje y el tiempo de CPU por mensaje al comprimir y al
+descomprimir, frente a enviarlo sin comprimir.
+
+Con --spawn mide además el servidor real con el generador de carga, con y
+sin compresión.
+
+Uso:
+    python -m benchmarks.bench_compression [--sizes 32,128,512,2048] [--batches 1,8] [--spawn]
+"""
+import argparse
+import time
+import zlib
+
+from benchmarks import loadgen
+from protocol import CHAT, ZLIB_LEVEL, compressor, decompressor, encode
+
+
+def measure(size, batch, messages, level):
+    """Devuelve (bytes sin comprimir, bytes comprimidos, µs de compresión, µs de descompresión) por mensaje."""
+    corpus = loadgen.chat_text(size * 256)
+    frames = [encode(CHAT, corpus[(number * 7919) % (len(corpus) - size):][:size]) for number in range(messages)]
+
+    deflater = compressor(level)
+    chunks = []
+    start = time.process_time()
+    for offset in range(0, messages, batch):
+        for frame in frames[offset:offset + batch]:
+            chunks.append(deflater.compress(frame))
+        chunks.append(deflater.flush(zlib.Z_SYNC_FLUSH))
+    compress_time = time.process_time() - start
+
+    inflater = decompressor()
+    start = time.process_time()
+    for chunk in chunks:
+        inflater.decompress(chunk)
+    decompress_time = time.process_time() - start
+
+    raw = sum(map(len, frames))
+    compressed = sum(map(len, chunks))
+    return raw / messages, compressed / messages, compress_time / messages * 1e6, decompress_time / messages * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='32,128,512,2048')
+    parser.add_argument('--batches', default='1,8', help="Mensajes por volcado del compresor")
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--level', type=int, default=ZLIB_LEVEL)
+    parser.add_argument('--spawn', action='store_true', help="Medir también el servidor real con loadgen")
+    parser.add_argument('--clients', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'tamaño':>7} {'lote':>5} {'B/msg':>8} {'B/msg zlib':>11} {'ratio':>6} {'µs comp':>8} {'µs desc':>8}")
+    for size in [int(size) for size in args.sizes.split(',')]:
+        for batch in [int(batch) for batch in args.batches.split(',')]:
+            raw, compressed, compress_us, decompress_us = measure(size, batch, args.messages, args.level)
+            print(f"{size:>7} {batch:>5} {raw:8.1f} {compressed:11.1f} {compressed / raw:6.2f} "
+                  f"{compress_us:8.2f} {decompress_us:8.2f}")
+
+    if args.spawn:
+        print()
+        print(f"{'zlib':>5} {'entregas/s':>11} {'B/entrega':>10} {'p50 ms':>8} {'p99 ms':>8}")
+        for compress in (False, True):
+            port = loadgen.free_port()
+            process = loadgen.spawn('server', port)
+            try:
+                result = loadgen.run('127.0.0.1', port, args.clients, 5, 20.0, 256, 3.0, compress=compress)
+            finally:
+                process.terminate()
+                process.wait(5)
+            print(f"{'sí' if compress else 'no':>5} {result['delivered_per_sec']:11.0f} "
+                  f"{result['bytes_per_delivery']:10.1f} {result['p50_ms']:8.2f} {result['p99_ms']:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Mide el coste de una vuelta del bucle de eventos según el número de
+conexiones inactivas.
+
+En cada vuelta hay exactamente un socket listo (un par "activo" que hace eco
+de un byte); el resto de conexiones están registradas pero en silencio.
+Con select.select() el coste crece con el número de sockets vigilados y no
+pasa de FD_SETSIZE (1024); con selectors.DefaultSelector (epoll) se mantiene
+plano.
+
+Uso:
+    python -m benchmarks.bench_loop [--sizes 100,1000,5000,10000,20000] [--iterations 2000]
+"""
+import argparse
+import select
+import selectors
+import socket
+import time
+
+from benchmarks import loadgen
+
+FD_SETSIZE = 1024
+
+
+def open_idle(count):
+    """Crea `count` conexiones inactivas (cada una es un par de sockets)."""
+    pairs = [socket.socketpair() for _ in range(count)]
+    for a, b in pairs:
+        a.setblocking(False)
+    return pairs
+
+
+def bench_selector(idle, iterations):
+    sel = selectors.DefaultSelector()
+    for a, _ in idle:
+        sel.register(a, selectors.EVENT_READ)
+    active, peer = socket.socketpair()
+    sel.register(active, selectors.EVENT_READ)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        peer.send(b'x')
+        for key, mask in sel.select():
+            key.fileobj.recv(1)
+    elapsed = time.perf_counter() - start
+
+    sel.close()
+    active.close()
+    peer.close()
+    return elapsed / iterations
+
+
+def bench_select(idle, iterations):
+    active, peer = socket.socketpair()
+    watched = [a for a, _ in idle] + [active]
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        peer.send(b'x')
+        readable, _, _ = select.select(watched, [], watched)
+        for sock in readable:
+            sock.recv(1)
+    elapsed = time.perf_counter() - start
+
+    active.close()
+    peer.close()
+    return elapsed / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,1000,5000,10000,20000')
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    limit = loadgen.raise_fd_limit()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    print(f"{'inactivas':>10} {'selectors (us/vuelta)':>22} {'select (us/vuelta)':>20}")
+    for size in sizes:
+        # Dos descriptores por conexión más un margen para el par activo
+        if size * 2 + 64 > limit:
+            print(f"{size:>10} {'omitido: límite de descriptores ' + str(limit):>43}")
+            continue
+
+        idle = open_idle(size)
+        try:
+            with_selector = bench_selector(idle, args.iterations) * 1e6
+            # select() rechaza cualquier descriptor con número >= FD_SETSIZE
+            if size * 2 + 16 < FD_SETSIZE:
+                with_select = f"{bench_select(idle, args.iterations) * 1e6:20.2f}"
+            else:
+                with_select = f"{'fd >= FD_SETSIZE':>20}"
+            print(f"{size:>10} {with_selector:22.2f} {with_select}")
+        finally:
+            for a, b in idle:
+                a.close()
+                b.close()
+
+
+if __name__ == '__main__':
+    main()
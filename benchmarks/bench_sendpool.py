@@ -0,0 +1,80 @@
+"""
+Difusión a salas muy grandes con y sin hilos de envío (ver sendpool.py).
+
+Para cada número de destinatarios registra ese número de clientes en un
+ChatServer del mismo proceso (pares de sockets) y mide cuánto tarda una
+difusión completa: broadcast() encola el mensaje a toda la sala y
+flush_pending() lo envía, en el hilo del bucle (0 hilos) o repartido entre
+los hilos de envío. El resultado es el tiempo por difusión y las entregas
+por segundo.
+
+Con el GIL, los hilos solo ganan mientras sendmsg() está en el kernel: la
+ganancia depende de los núcleos libres y del tamaño del mensaje.
+
+Uso:
+    python -m benchmarks.bench_sendpool [--sizes 1000,10000,50000] [--workers 0,2,4,8] [--rounds 20]
+"""
+import argparse
+import socket
+import time
+
+import server
+from benchmarks import loadgen
+from server import ChatServer
+
+
+def measure(recipients, workers, rounds, size):
+    """Devuelve los segundos por difusión (encolar y enviar) a `recipients` clientes."""
+    chat = ChatServer(port=0, send_workers=workers)
+    pairs = [socket.socketpair() for _ in range(recipients + 1)]
+    for number, (local, _) in enumerate(pairs):
+        chat.register(local, f"c{number}")
+    sender = pairs[0][0]
+    message = b'x' * size
+
+    # Una vuelta sin medir: crea los hilos del pool
+    chat.broadcast(message, sender)
+    chat.flush_pending()
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        chat.broadcast(message, sender)
+        chat.flush_pending()
+    elapsed = time.perf_counter() - start
+
+    chat.close()
+    for _, remote in pairs:
+        remote.close()
+    return elapsed / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,50000', help="Destinatarios por difusión")
+    parser.add_argument('--workers', default='0,2,4,8', help="Hilos de envío (0: en el hilo del bucle)")
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--size', type=int, default=128, help="Bytes de cada mensaje")
+    args = parser.parse_args()
+
+    limit = loadgen.raise_fd_limit()
+    # Sin límite de frecuencia ni presupuesto: se mide solo el envío
+    server.RATE_MESSAGES = server.RATE_BYTES = 0
+    server.POOL_MIN_CLIENTS = 1
+
+    print(f"{'destinatarios':>13} {'hilos':>6} {'ms/difusión':>12} {'entregas/s':>12} {'frente a 0':>11}")
+    for recipients in [int(size) for size in args.sizes.split(',')]:
+        # Dos descriptores por cliente más un margen para el selector y los hilos
+        if recipients * 2 + 64 > limit:
+            print(f"{recipients:>13} {'omitido: límite de descriptores ' + str(limit):>43}")
+            continue
+
+        baseline = None
+        for workers in [int(workers) for workers in args.workers.split(',')]:
+            seconds = measure(recipients, workers, args.rounds, args.size)
+            baseline = baseline or seconds
+            print(f"{recipients:>13} {workers:>6} {seconds * 1e3:12.2f} {recipients / seconds:12.0f} "
+                  f"{baseline / seconds:10.2f}x")
+
+
+if __name__ == '__main__':
+    main()
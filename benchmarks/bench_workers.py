@@ -0,0 +1,49 @@
+"""
+Rendimiento de difusión del modo cluster con 1, 2, 4 y 8 procesos.
+
+Para cada número de procesos lanza `cluster.py` en un puerto libre y ejecuta
+el generador de carga (benchmarks/loadgen.py) contra él. El resultado son
+entregas por segundo (mensajes x destinatarios / tiempo) y la latencia de
+entrega de cada configuración.
+
+Uso:
+    python -m benchmarks.bench_workers [--workers 1,2,4,8] [--clients 200] [--senders 10] [--rate 50]
+"""
+import argparse
+import json
+
+from benchmarks import loadgen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4,8')
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--senders', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=50.0)
+    parser.add_argument('--size', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--output', default=None, help="Archivo JSONL al que añadir los resultados")
+    args = parser.parse_args()
+
+    print(f"{'procesos':>8} {'entregas':>10} {'entregas/s':>12} {'p50 ms':>8} {'p99 ms':>8}")
+    for workers in [int(w) for w in args.workers.split(',')]:
+        port = loadgen.free_port()
+        process = loadgen.spawn(f"cluster:{workers}", port)
+        try:
+            result = loadgen.run('127.0.0.1', port, args.clients, args.senders, args.rate,
+                                 args.size, args.duration)
+        finally:
+            process.terminate()
+            process.wait(5)
+
+        note = '' if result['delivered'] == result['expected'] else f"  (incompleto: {result['delivered']}/{result['expected']})"
+        print(f"{workers:>8} {result['delivered']:>10} {result['delivered_per_sec']:12.0f} "
+              f"{result['p50_ms']:8.2f} {result['p99_ms']:8.2f}{note}")
+        if args.output:
+            with open(args.output, 'a', encoding='utf-8') as output:
+                output.write(json.dumps({'label': f"cluster:{workers}", 'workers': workers, **result}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
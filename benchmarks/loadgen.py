@@ -0,0 +1,346 @@
+"""
+Generador de carga para el servidor de chat.
+
+Abre miles de conexiones desde un único proceso con sockets no bloqueantes,
+completa el saludo NICK, hace que `--senders` de ellas envíen mensajes a un
+ritmo fijo y mide, en los demás clientes, la latencia extremo a extremo de
+cada entrega (p50/p99/p999) y los mensajes entregados por segundo. Cada
+mensaje lleva el instante de envío, así que la latencia incluye el tiempo de
+difusión a todos los destinatarios.
+
+Los resultados se añaden como una línea JSON a `--output` para comparar
+modos del servidor y seguir regresiones. Con `--spawn` lanza el servidor en
+un puerto libre:
+
+    python -m benchmarks.loadgen --spawn server --clients 1000 --senders 20 --rate 5
+    python -m benchmarks.loadgen --spawn cluster:4 --label cluster4 --output results.jsonl
+    python -m benchmarks.loadgen --port 55559 --legacy   # servidor ya en marcha, texto plano
+"""
+import argparse
+import json
+import math
+import random
+import resource
+import selectors
+import socket
+import subprocess
+import sys
+import time
+import zlib
+from collections import Counter
+
+from protocol import CHAT, NICK, PING, PONG, ZLIB, ProtocolError, StreamDecoder, encode, nick_payload
+
+# Precisión del histograma de latencias: cubetas logarítmicas del 1 %
+BUCKET_BASE = math.log(1.01)
+
+# Comandos para lanzar cada modo del servidor (--spawn)
+# (sin límite de frecuencia por cliente: los emisores del generador lo superarían)
+UNLIMITED = ['--rate-messages', '0', '--rate-bytes', '0']
+SPAWN = {
+    'server': ['server.py', '--log-level', 'WARNING'] + UNLIMITED,
+    'async': ['async_server.py'],
+    'cluster': ['cluster.py', '--log-level', 'WARNING'] + UNLIMITED + ['--workers'],
+}
+
+
+# Vocabulario para el texto de relleno: la compresión de 'xxxx...' no dice nada
+WORDS = ('hola que tal el la de en y a los se del las un por con no una su para es al lo como '
+         'mas pero sus le ya o este si porque esta entre cuando muy sin sobre también me hasta '
+         'hay donde quien desde todo nos durante todos uno les ni contra otros ese eso ante '
+         'servidor chat mensaje sala python socket conexión cliente prueba ahora mañana gracias '
+         'vale perfecto jaja alguien sabe cómo funciona esto mirad enlace código error versión').split()
+
+
+def chat_text(size, seed=0):
+    """Texto pseudoaleatorio de `size` bytes con palabras de chat (reproducible)."""
+    rng = random.Random(seed)
+    text = bytearray()
+    while len(text) < size:
+        text += rng.choice(WORDS).encode('utf-8') + (b'. ' if rng.random() < 0.1 else b' ')
+    return bytes(text[:size])
+
+
+class Histogram:
+    """Histograma logarítmico de latencias (en segundos) con percentiles aproximados."""
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, seconds):
+        micros = max(seconds * 1e6, 1.0)
+        self.buckets[int(math.log(micros) / BUCKET_BASE)] += 1
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return math.exp((bucket + 0.5) * BUCKET_BASE) / 1e6
+        return self.max
+
+
+class Client:
+    """Estado de una conexión simulada."""
+
+    __slots__ = ('sock', 'index', 'ready', 'decoder', 'inbuf', 'outbuf', 'seq', 'next_send')
+
+    def __init__(self, sock, index):
+        self.sock = sock
+        self.index = index
+        self.ready = False  # True tras recibir 'NICK' y enviar el nickname
+        self.decoder = StreamDecoder()
+        self.inbuf = b''  # Modo texto plano: resto de línea pendiente
+        self.outbuf = bytearray()
+        self.seq = 0
+        self.next_send = None  # Próximo envío (solo emisores)
+
+
+def raise_fd_limit():
+    """Sube el límite blando de descriptores hasta el límite duro; devuelve el límite resultante."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY and soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        soft = hard
+    return soft
+
+
+def free_port():
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+
+def spawn(mode, port):
+    """Lanza el servidor en el modo indicado ('server', 'async' o 'cluster:N')."""
+    name, _, workers = mode.partition(':')
+    command = [sys.executable] + SPAWN[name] + ([workers or '2'] if name == 'cluster' else [])
+    process = subprocess.Popen(command + ['--port', str(port)], stdout=subprocess.DEVNULL)
+    time.sleep(1)
+    return process
+
+
+def run(host, port, clients=100, senders=10, rate=10.0, size=64, duration=10.0,
+        warmup=1.0, legacy=False, drain=2.0, compress=False):
+    """Ejecuta una prueba de carga y devuelve un diccionario con los resultados."""
+    raise_fd_limit()
+    sel = selectors.DefaultSelector()
+    pool = []
+
+    def write(client):
+        try:
+            sent = client.sock.send(client.outbuf)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        del client.outbuf[:sent]
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.outbuf else 0)
+        sel.modify(client.sock, events, client)
+
+    # Conectar todos los clientes sin esperar a cada uno
+    for index in range(clients):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        sock.connect_ex((host, port))
+        client = Client(sock, index)
+        sel.register(sock, selectors.EVENT_READ, client)
+        pool.append(client)
+
+    latencies = Histogram()
+    delivered = 0
+    sent_messages = 0
+    errors = 0
+    received = 0  # Bytes recibidos (lo que viaja por la red)
+    capabilities = (ZLIB,) if compress else ()
+
+    def receive(client):
+        nonlocal delivered, errors, received
+        try:
+            data = client.sock.recv(1 << 20)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            errors += 1
+            sel.unregister(client.sock)
+            client.sock.close()
+            return
+
+        # Saludo: el servidor pide el nickname en texto plano
+        if not client.ready:
+            if data.startswith(b'NICK'):
+                nickname = f"lg{client.index}"
+                client.outbuf += (nickname.encode('utf-8') if legacy
+                                  else encode(NICK, nick_payload(nickname, capabilities)))
+                client.ready = True
+                write(client)
+            return
+
+        now = time.monotonic_ns()
+        received += len(data)
+        if legacy:
+            lines = (client.inbuf + data).split(b'\n')
+            client.inbuf = lines.pop()
+            messages = lines
+        else:
+            try:
+                frames = client.decoder.feed(data)
+            except (ProtocolError, zlib.error):
+                errors += 1
+                sel.unregister(client.sock)
+                client.sock.close()
+                return
+            messages = [payload for kind, payload in frames if kind == CHAT]
+
+            # Responder a los latidos para que el servidor no dé por muerto al cliente
+            if any(kind == PING for kind, _ in frames):
+                client.outbuf += encode(PONG, b'')
+                write(client)
+
+        # Solo cuentan los mensajes del generador ('lg <emisor> <seq> <instante>')
+        for message in messages:
+            if message.startswith(b'lg '):
+                fields = message.split(b' ', 4)
+                latencies.add((now - int(fields[3])) / 1e9)
+                delivered += 1
+
+    def pump(until):
+        while True:
+            timeout = until - time.monotonic()
+            if timeout <= 0:
+                return
+            for key, mask in sel.select(timeout):
+                if mask & selectors.EVENT_WRITE:
+                    write(key.data)
+                if mask & selectors.EVENT_READ:
+                    receive(key.data)
+
+    # Saludo y calentamiento: esperar a que todos estén dentro y descartar avisos
+    start = time.monotonic()
+    pump(start + warmup)
+    while not all(client.ready for client in pool) and time.monotonic() - start < warmup + 30:
+        pump(time.monotonic() + 0.1)
+    pump(time.monotonic() + warmup)
+    ready = sum(client.ready for client in pool)
+    delivered = 0
+    received = 0
+    latencies = Histogram()
+
+    # Fase de envío: cada emisor envía `rate` mensajes por segundo
+    interval = 1.0 / rate if rate > 0 else None
+    active = [client for client in pool if client.ready][:senders]
+    begin = time.monotonic()
+    for offset, client in enumerate(active):
+        client.next_send = begin + (interval or 0) * offset / max(len(active), 1)
+    # Cada mensaje lleva un tramo distinto de un texto largo
+    corpus = chat_text(max(size, 1) * 256)
+
+    end = begin + duration
+    while time.monotonic() < end:
+        now = time.monotonic()
+        for client in active:
+            while client.next_send <= now:
+                client.seq += 1
+                header = b'lg %d %d %d ' % (client.index, client.seq, time.monotonic_ns())
+                offset = (client.seq * 7919) % (len(corpus) - size) if len(corpus) > size else 0
+                body = header + corpus[offset:offset + max(size - len(header), 0)]
+                client.outbuf += body + b'\n' if legacy else encode(CHAT, body)
+                sent_messages += 1
+                client.next_send = client.next_send + interval if interval else now + 1
+            if client.outbuf and client.sock.fileno() != -1:
+                write(client)
+        next_send = min((client.next_send for client in active), default=end)
+        pump(min(next_send, end))
+
+    # Drenaje: esperar las entregas pendientes
+    elapsed = time.monotonic() - begin
+    expected = sent_messages * (ready - 1)
+    deadline = time.monotonic() + drain
+    while delivered < expected and time.monotonic() < deadline:
+        pump(min(deadline, time.monotonic() + 0.05))
+
+    for client in pool:
+        client.sock.close()
+    sel.close()
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        'clients': clients,
+        'ready': ready,
+        'senders': len(active),
+        'rate': rate,
+        'size': size,
+        'legacy': legacy,
+        'compress': compress,
+        'duration': round(elapsed, 3),
+        'sent': sent_messages,
+        'expected': expected,
+        'delivered': delivered,
+        'errors': errors,
+        'sent_per_sec': round(sent_messages / elapsed, 1),
+        'delivered_per_sec': round(delivered / elapsed, 1),
+        'bytes_received': received,
+        'bytes_per_delivery': round(received / delivered, 1) if delivered else None,
+        'p50_ms': ms(latencies.percentile(0.5)),
+        'p99_ms': ms(latencies.percentile(0.99)),
+        'p999_ms': ms(latencies.percentile(0.999)),
+        'max_ms': ms(latencies.max if latencies.count else None),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=55559)
+    parser.add_argument('--spawn', default=None, help="Lanzar el servidor: server, async o cluster:N")
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--senders', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=10.0, help="Mensajes por segundo de cada emisor")
+    parser.add_argument('--size', type=int, default=64, help="Tamaño de cada mensaje en bytes")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=1.0)
+    parser.add_argument('--legacy', action='store_true',
+                        help="Usar el protocolo antiguo en texto plano (siempre con --spawn async)")
+    parser.add_argument('--compress', action='store_true', help="Negociar compresión zlib en el NICK")
+    parser.add_argument('--label', default=None, help="Etiqueta del resultado (p. ej. el modo del servidor)")
+    parser.add_argument('--output', default=None, help="Archivo JSONL al que añadir el resultado")
+    args = parser.parse_args()
+
+    process = None
+    port = args.port
+    if args.spawn:
+        port = free_port()
+        process = spawn(args.spawn, port)
+        # El servidor asyncio solo habla el protocolo en texto plano
+        if args.spawn == 'async':
+            args.legacy = True
+
+    try:
+        result = run(args.host, port, args.clients, args.senders, args.rate, args.size,
+                     args.duration, args.warmup, args.legacy, compress=args.compress)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(5)
+
+    result = {'ts': round(time.time(), 3), 'label': args.label or args.spawn, **result}
+    line = json.dumps(result)
+    print(line)
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as output:
+            output.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,37 @@
+import argparse
+import errno
+import os
+import random
+import selectors
 import socket
-import threading
 import sys
+import time
+import zlib
+from collections import deque
+
+from protocol import CHAT, MAX_FRAME_SIZE, NICK, PING, PONG, SYSTEM, ZLIB, ProtocolError, StreamDecoder, encode, nick_payload
 
 
 # Lista de nicknames prohibidos
 BANNED_NICKS = ["admin", "moderator", "system", "root"]
 
+# Capacidades que se piden al servidor junto al nickname (ver protocol.py)
+CAPABILITIES = (ZLIB,)
+
+# Dirección del servidor por defecto
+HOST = '127.0.0.1'
+PORT = 55559
+
+# Reconexión con espera exponencial y jitter completo: entre 0 y min(MAX, MIN * 2^intento)
+RECONNECT_MIN = 0.5
+RECONNECT_MAX = 30.0
+
+# Si el servidor envía un aviso y cierra antes de este tiempo tras recibir el nickname, lo ha rechazado
+REJECT_WINDOW = 1.0
+
+# Bytes pendientes de enviar a partir de los cuales se deja de leer la entrada (contrapresión)
+SEND_BUFFER = 256 * 1024
+
 def nickname_checker():
     """
     Solicita al usuario que elija un nickname válido.
@@ -15,7 +41,7 @@ def nickname_checker():
 
     for i in range(3):
         nick = input("Escoge tu nickname: ").strip()
-        
+
         # Comprueba si el nickname está vacío o está prohibido
         if nick == "":
             print("El nickname no puede estar vacío.")
@@ -23,54 +49,317 @@ def nickname_checker():
             print(f"El nickname '{nick}' no está permitido. Por favor, elige un nickname diferente.")
         else:
             return nick  # Devuelve nickname válido
-    
+
     # Si el usuario no logra elegir un nickname válido, sale del programa
     print("No se pudo elegir un nickname válido. Cerrando el programa...")
     sys.exit(0)
 
+# Espera antes del reintento número `attempt` (0, 1, 2...): el jitter reparte
+# en el tiempo las reconexiones de todos los clientes tras reiniciar el servidor
+def backoff(attempt):
+    return random.uniform(0, min(RECONNECT_MAX, RECONNECT_MIN * 2 ** attempt))
+
+# Cliente de chat: un solo bucle de eventos para el socket y la entrada
+class ChatClient:
+    def __init__(self, nickname, host=HOST, port=PORT, source=sys.stdin, output=sys.stdout,
+                 reconnect=True, capabilities=CAPABILITIES):
+        self.nickname = nickname
+        self.address = (host, port)
+        self.source = source  # Líneas a enviar (teclado, tubería o archivo)
+        self.output = output  # Donde se escriben los mensajes recibidos (None: descartarlos)
+        self.reconnect = reconnect
+        self.capabilities = capabilities
+        self.selector = selectors.DefaultSelector()
+
+        self.sock = None
+        self.connected = False  # Conexión TCP establecida
+        self.registered = False  # Nickname enviado: ya se pueden enviar mensajes
+        self.nick_sent_at = None
+        self.notice = False  # Llegó un aviso justo tras el nickname (posible rechazo)
+        self.decoder = None
+        self.attempt = 0  # Reintentos seguidos sin conseguir conectar
+        self.retry_at = None  # Instante del próximo intento de conexión
+
+        self.outbox = deque()  # Tramas pendientes; sobreviven a una reconexión
+        self.outlen = 0
+        self.offset = 0  # Bytes ya enviados de la primera trama
+        self.sent = 0  # Tramas enviadas completas
+        self.closing = False  # Entrada agotada y todo enviado: ya se cerró nuestra mitad de la conexión
+        self.done = False
 
-# Función para recibir mensajes
-def receive():
-    while True:
-        # Intenta recibir mensajes del servidor
+        # La entrada se lee a nivel de descriptor (sin el búfer de Python, que
+        # escondería líneas al selector) y se vigila en el mismo selector; un
+        # archivo normal no admite epoll, pero siempre se puede leer sin esperar
+        self.fd = source.fileno()
+        self.inbuf = b''  # Resto de línea pendiente
+        self.eof = False
+        self.watching = False
         try:
-            message = client.recv(1024).decode('utf-8')
-            if message == 'NICK':  # Si el servidor solicita nuestro nickname
-                client.send(nickname.encode('utf-8'))
+            self.selector.register(self.fd, selectors.EVENT_READ, self.read_input)
+            self.selector.unregister(self.fd)
+            self.pollable = True
+        except (PermissionError, ValueError, OSError):
+            self.pollable = False
+        self.update_input()
+
+    # Escribir un mensaje recibido
+    def show(self, text):
+        if self.output is not None:
+            print(text, file=self.output, flush=True)
+
+    def connect(self):
+        self.retry_at = None
+        self.decoder = None
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(False)
+        error = self.sock.connect_ex(self.address)
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            self.disconnect(os.strerror(error))
+            return
+        # La conexión está lista cuando el socket es escribible
+        self.selector.register(self.sock, selectors.EVENT_WRITE, self.on_socket)
+
+    # Cerrar la conexión y programar la reconexión (o terminar)
+    def disconnect(self, reason):
+        if self.sock is not None:
+            try:
+                self.selector.unregister(self.sock)
+            except (KeyError, ValueError):
+                pass
+            self.sock.close()
+            self.sock = None
+
+        # Aviso y cierre justo tras el nickname: el servidor lo rechazó, reintentar no sirve
+        rejected = (self.notice and self.nick_sent_at is not None
+                    and time.monotonic() - self.nick_sent_at < REJECT_WINDOW)
+        self.connected = self.registered = False
+        self.nick_sent_at = None
+        self.notice = False
+        self.offset = 0  # Una trama a medias se reenvía entera en la siguiente conexión
+
+        if self.closing:
+            self.done = True
+            return
+        if rejected or not self.reconnect:
+            self.show(f"Desconectado: {reason}")
+            self.done = True
+            return
+
+        delay = backoff(self.attempt)
+        self.attempt += 1
+        self.show(f"Desconectado ({reason}). Reintentando en {delay:.1f} s...")
+        self.retry_at = time.monotonic() + delay
+
+    def update_events(self):
+        if self.sock is None:
+            return
+        events = selectors.EVENT_READ
+        if not self.connected or (self.registered and self.outbox and not self.closing):
+            events |= selectors.EVENT_WRITE
+        self.selector.modify(self.sock, events, self.on_socket)
+
+    # Leer la entrada solo mientras lo pendiente de enviar quepa en SEND_BUFFER (contrapresión)
+    def update_input(self):
+        wanted = not self.eof and self.outlen < SEND_BUFFER
+        if self.pollable and wanted != self.watching:
+            if wanted:
+                self.selector.register(self.fd, selectors.EVENT_READ, self.read_input)
             else:
-                print(message)
-        # Si hubo un error al recibir mensajes, cierra la conexión
-        except:
-            print("¡Ocurrió un error!")
-            client.close()
-            break
-
-# Función para enviar mensajes
-def write():
-    while True:
-        message = f'{nickname}: {input("")}'
-        client.send(message.encode('utf-8'))
-        
+                self.selector.unregister(self.fd)
+            self.watching = wanted
+        return wanted
+
+    # Encolar una línea escrita por el usuario o leída de la entrada
+    def enqueue(self, text):
+        # Los comandos (/join, /part, /list, /msg) se envían tal cual, sin el nickname
+        message = (text if text.startswith('/') else f'{self.nickname}: {text}').encode('utf-8')
+        # Una línea que no cabe en una trama se descarta con un aviso, sin cortar el cliente
+        if len(message) > MAX_FRAME_SIZE:
+            self.show(f"Línea demasiado larga ({len(message)} bytes, máximo {MAX_FRAME_SIZE}): no se envía.")
+            return
+        frame = encode(CHAT, message)
+        self.outbox.append(frame)
+        self.outlen += len(frame)
+
+    def read_input(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except (BlockingIOError, InterruptedError):
+            return
+        lines = (self.inbuf + data).split(b'\n')
+        self.inbuf = lines.pop()
+        if not data:
+            self.eof = True
+            lines.append(self.inbuf)
+
+        for line in lines:
+            text = line.decode('utf-8', errors='replace').rstrip('\r')
+            if text:
+                self.enqueue(text)
+
+        self.update_input()
+        self.update_events()
+        self.finish()
+
+    # Entrada agotada y todo enviado: cerrar nuestra mitad y esperar a que el
+    # servidor cierre (así no se pierde nada de lo que aún está en vuelo)
+    def finish(self):
+        if self.eof and self.registered and not self.outbox and not self.closing:
+            self.closing = True
+            self.sock.shutdown(socket.SHUT_WR)
+            self.update_events()
+
+    def on_socket(self, mask):
+        if not self.connected:
+            error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                self.disconnect(os.strerror(error))
+                return
+            self.connected = True
+            self.attempt = 0
+            self.show("Conectado al servidor")
+            self.update_events()
+            return
+
+        if mask & selectors.EVENT_READ and not self.receive():
+            return
+        if mask & selectors.EVENT_WRITE:
+            self.send()
+
+    def receive(self):
+        try:
+            data = self.sock.recv(64 * 1024)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError as error:
+            self.disconnect(str(error))
+            return False
+        if not data:
+            self.disconnect("el servidor cerró la conexión")
+            return False
+
+        # Hasta enviar el nickname el servidor habla en texto plano ('NICK');
+        # después, todo llega en tramas
+        if self.decoder is None:
+            if data.startswith(b'NICK'):
+                self.decoder = StreamDecoder()
+                # Recién conectado: la trama cabe de sobra en el búfer del socket
+                self.sock.send(encode(NICK, nick_payload(self.nickname, self.capabilities)))
+                self.registered = True
+                self.nick_sent_at = time.monotonic()
+                self.update_events()
+                self.finish()
+            else:
+                # Rechazo al aceptar (servidor lleno...): tras el aviso llega el
+                # cierre, y se reintenta con espera creciente
+                self.show(data.decode('utf-8', errors='replace'))
+            return True
+
+        # Una lectura puede traer varias tramas completas (descomprimidas si se negoció zlib)
+        try:
+            frames = self.decoder.feed(data)
+        except (ProtocolError, zlib.error) as error:
+            self.disconnect(str(error))
+            return False
+        for kind, payload in frames:
+            # Latido del servidor: responder sin mostrar nada (la respuesta se adelanta a lo pendiente)
+            if kind == PING:
+                pong = encode(PONG, payload)
+                self.outbox.insert(1 if self.offset else 0, pong)
+                self.outlen += len(pong)
+                self.update_events()
+                continue
+            if kind == PONG:
+                continue
+
+            # Un aviso puede ser el motivo de un rechazo; cualquier otra trama confirma el registro
+            if kind == SYSTEM:
+                self.notice = True
+            else:
+                self.nick_sent_at = None
+            self.show(payload.decode('utf-8', errors='replace'))
+        return True
+
+    # Enviar las tramas pendientes sin bloquear
+    def send(self):
+        while self.outbox:
+            frame = self.outbox[0]
+            try:
+                sent = self.sock.send(memoryview(frame)[self.offset:])
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as error:
+                self.disconnect(str(error))
+                return
+            self.offset += sent
+            if self.offset < len(frame):
+                break
+            self.outbox.popleft()
+            self.outlen -= len(frame)
+            self.offset = 0
+            self.sent += 1
+
+        self.update_input()
+        self.update_events()
+        self.finish()
+
+    def run(self):
+        """Atiende la conexión y la entrada hasta terminar; devuelve las tramas enviadas."""
+        self.connect()
+
+        while not self.done:
+            timeout = None
+            if self.retry_at is not None:
+                timeout = max(self.retry_at - time.monotonic(), 0)
+            # Un archivo normal siempre se puede leer: no esperar si hay sitio
+            if not self.pollable and self.update_input():
+                timeout = 0
+
+            for key, mask in self.selector.select(timeout):
+                if key.fileobj == self.fd:
+                    key.data()
+                else:
+                    key.data(mask)
+                if self.done:
+                    break
+
+            if not self.pollable and self.update_input() and not self.done:
+                self.read_input()
+            if self.retry_at is not None and time.monotonic() >= self.retry_at and not self.done:
+                self.connect()
+
+        if self.sock is not None:
+            self.sock.close()
+        self.selector.close()
+        return self.sent
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cliente de chat")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--nick', default=None, help="Nickname (si no se indica, se pregunta)")
+    parser.add_argument('--file', default=None,
+                        help="Enviar las líneas de un archivo tan rápido como lo admita el servidor y salir")
+    parser.add_argument('--quiet', action='store_true', help="No mostrar los mensajes recibidos")
+    parser.add_argument('--no-reconnect', action='store_true')
+    parser.add_argument('--no-compression', action='store_true')
+    args = parser.parse_args()
 
-    nick = input("Introduce tu nickname: ")
+    if args.nick is not None:
+        if args.nick.strip() == "" or args.nick.lower() in BANNED_NICKS:
+            parser.error(f"El nickname '{args.nick}' no está permitido.")
+        nickname = args.nick.strip()
+    else:
+        nickname = nickname_checker()
 
-    nickname = nickname_checker(nick)
+    # Sin --file se leen las líneas de la entrada estándar: el teclado o una tubería (bots)
+    source = open(args.file, 'rb') if args.file is not None else sys.stdin
 
-    # Conectar al servidor
-    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    client = ChatClient(nickname, args.host, args.port, source,
+                        output=None if args.quiet else sys.stdout,
+                        reconnect=not args.no_reconnect,
+                        capabilities=() if args.no_compression else CAPABILITIES)
     try:
-        client.connect(('127.0.0.1', 55555))
-        print("Conectado al servidor")
-        
-    # Si hubo un error de conexión
-    except ConnectionRefusedError:
-        print("No se pudo conectar al servidor. Asegúrate de que el servidor esté en línea")
-        exit()
-
-    # Crear hilos para las funciones de recibir y escribir
-    receive_thread = threading.Thread(target=receive)
-    receive_thread.start()
-
-    write_thread = threading.Thread(target=write)
-    write_thread.start()
\ No newline at end of file
+        client.run()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,272 @@
+"""
+Modo cluster: un supervisor lanza N procesos del servidor que escuchan en el
+mismo HOST:PORT con SO_REUSEPORT (el kernel reparte las conexiones entre
+ellos). Cada proceso atiende a sus propios clientes y el supervisor hace de
+bus: reenvía cada difusión al resto de procesos y es la autoridad sobre los
+nicknames en uso, para que sigan siendo únicos en todo el cluster.
+
+Uso:
+    python cluster.py --workers 4 [--host 127.0.0.1] [--port 55559]
+"""
+import argparse
+import os
+import selectors
+import signal
+import socket
+import struct
+
+import jsonlog
+import server
+from jsonlog import INFO, WARNING, event
+from metrics import parse_address, worker_address
+from protocol import HEADER, MAX_FRAME_SIZE, FrameDecoder
+
+# Tipos de trama del bus (proceso <-> supervisor)
+PUBLISH = 10  # Difusión: tipo (1 byte) + longitud de la sala (1 byte) + sala + mensaje
+CLAIM = 11  # Reservar nickname: ficha (4 bytes) + nickname
+CLAIM_OK = 12  # Nickname reservado: ficha + nickname
+CLAIM_TAKEN = 13  # Nickname en uso en otro proceso: ficha + nickname
+RELEASE = 14  # Liberar nickname: nickname
+DIRECT = 15  # Mensaje privado: remitente y destinatario (longitud de 1 byte + nickname cada uno) + mensaje
+DIRECT_MISS = 16  # El destinatario no está en ningún proceso: la misma trama, de vuelta al remitente
+BUS_KINDS = (PUBLISH, CLAIM, CLAIM_OK, CLAIM_TAKEN, RELEASE, DIRECT, DIRECT_MISS)
+
+# Un mensaje de cliente (hasta MAX_FRAME_SIZE) más lo que añade el bus: el tipo y
+# la sala de una difusión, o los dos nicknames de un mensaje privado (como mucho
+# MAX_NICK_LENGTH caracteres de hasta 4 bytes cada uno, más su longitud)
+BUS_MAX_FRAME_SIZE = MAX_FRAME_SIZE + 2 * (1 + 4 * server.MAX_NICK_LENGTH)
+
+TOKEN = struct.Struct('!I')
+
+# Codificar una trama del bus
+def bus_frame(kind, payload):
+    return HEADER.pack(len(payload), kind) + payload
+
+# Separar una trama DIRECT en (remitente, destinatario, mensaje)
+def parse_direct(payload):
+    length = payload[0]
+    sender = payload[1:1 + length].decode('utf-8')
+    offset = 1 + length
+    length = payload[offset]
+    target = payload[offset + 1:offset + 1 + length].decode('utf-8')
+    return sender, target, payload[offset + 1 + length:]
+
+# Extremo del bus dentro de cada proceso del servidor
+class Bus:
+    def __init__(self, sock, chat):
+        # Las escrituras bloquean: el supervisor nunca deja de leer, así que
+        # la espera es como mucho lo que tarde en vaciar su socket
+        self.sock = sock
+        self.chat = chat  # ChatServer de este proceso
+        self.decoder = FrameDecoder(BUS_MAX_FRAME_SIZE, BUS_KINDS)
+        self.claims = {}  # ficha -> socket del cliente esperando su nickname
+        self.next_token = 0
+
+    def publish(self, kind, message, room=None):
+        room = room.encode('utf-8') if room is not None else b''
+        self.sock.sendall(bus_frame(PUBLISH, bytes([kind, len(room)]) + room + message))
+
+    def claim(self, client, nickname):
+        self.next_token += 1
+        self.claims[self.next_token] = client
+        self.sock.sendall(bus_frame(CLAIM, TOKEN.pack(self.next_token) + nickname.encode('utf-8')))
+
+    def release(self, nickname):
+        self.sock.sendall(bus_frame(RELEASE, nickname.encode('utf-8')))
+
+    def direct(self, sender, target, message):
+        sender, target = sender.encode('utf-8'), target.encode('utf-8')
+        self.sock.sendall(bus_frame(DIRECT, bytes([len(sender)]) + sender + bytes([len(target)]) + target + message))
+
+    def on_readable(self):
+        data = self.sock.recv(server.RECV_SIZE)
+        if not data:
+            raise SystemExit("El supervisor cerró el bus")
+
+        for kind, payload in self.decoder.feed(data):
+            if kind == PUBLISH:
+                # Difusión de otro proceso: entregar solo a los clientes locales
+                message_kind, length = payload[0], payload[1]
+                room = payload[2:2 + length].decode('utf-8') or None
+                self.chat.fanout(payload[2 + length:], None, message_kind, room)
+            elif kind in (CLAIM_OK, CLAIM_TAKEN):
+                (token,) = TOKEN.unpack_from(payload)
+                self.on_claim(self.claims.pop(token, None), payload[TOKEN.size:].decode('utf-8'), kind == CLAIM_OK)
+            elif kind in (DIRECT, DIRECT_MISS):
+                self.on_direct(*parse_direct(payload), kind == DIRECT)
+
+    def on_direct(self, sender, target, message, found):
+        # Entregar al destinatario local, o avisar al remitente de que no está;
+        # cualquiera de los dos pudo desconectarse mientras la trama viajaba
+        if found:
+            client = self.chat.by_nick.get(server.nick_key(target))
+            if client is not None:
+                self.chat.send_to(client, message)
+        else:
+            client = self.chat.by_nick.get(server.nick_key(sender))
+            if client is not None:
+                self.chat.reply(client, f"No hay nadie conectado con el nickname '{target}'.")
+
+    def on_claim(self, client, nickname, granted):
+        conn = self.chat.connections.get(client)
+
+        # El cliente se fue mientras se confirmaba su nickname
+        if conn is None or conn.state != server.CLAIMING:
+            if granted:
+                self.release(nickname)
+            return
+
+        if not granted:
+            self.chat.reject(conn, f"El nickname '{nickname}' ya está en uso.")
+            self.chat.remove(client)
+        elif not self.chat.complete_handshake(client, nickname, conn.held):
+            self.chat.remove(client)
+
+# Supervisor: lanza los procesos y hace de bus entre ellos
+class Hub:
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.workers = {}  # socket del bus -> pid
+        self.outbufs = {}  # socket del bus -> bytes pendientes de enviar
+        self.decoders = {}
+        self.owners = {}  # nickname en minúsculas -> socket del proceso que lo tiene
+
+    def add(self, sock, pid):
+        sock.setblocking(False)
+        self.workers[sock] = pid
+        self.outbufs[sock] = bytearray()
+        self.decoders[sock] = FrameDecoder(BUS_MAX_FRAME_SIZE, BUS_KINDS)
+        self.selector.register(sock, selectors.EVENT_READ)
+
+    def remove(self, sock):
+        event(WARNING, 'worker_exit', worker=self.workers[sock])
+        self.selector.unregister(sock)
+        del self.workers[sock], self.outbufs[sock], self.decoders[sock]
+        # Sus nicknames quedan libres
+        self.owners = {nick: owner for nick, owner in self.owners.items() if owner is not sock}
+        sock.close()
+
+    def send(self, sock, data):
+        outbuf = self.outbufs[sock]
+        if not outbuf:
+            self.selector.modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE)
+        outbuf += data
+
+    def flush(self, sock):
+        outbuf = self.outbufs[sock]
+        try:
+            sent = sock.send(outbuf)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self.remove(sock)
+            return
+        del outbuf[:sent]
+        if not outbuf:
+            self.selector.modify(sock, selectors.EVENT_READ)
+
+    def on_frame(self, sock, kind, payload):
+        if kind == PUBLISH:
+            # Reenviar la difusión al resto de procesos
+            frame = bus_frame(PUBLISH, payload)
+            for other in self.workers:
+                if other is not sock:
+                    self.send(other, frame)
+
+        elif kind == CLAIM:
+            nickname = payload[TOKEN.size:].decode('utf-8').lower()
+            granted = nickname not in self.owners
+            if granted:
+                self.owners[nickname] = sock
+            self.send(sock, bus_frame(CLAIM_OK if granted else CLAIM_TAKEN, payload))
+
+        elif kind == DIRECT:
+            # Solo al proceso del destinatario: O(1) con el índice de nicknames
+            _, target, _ = parse_direct(payload)
+            owner = self.owners.get(target.lower())
+            if owner is None:
+                self.send(sock, bus_frame(DIRECT_MISS, payload))
+            else:
+                self.send(owner, bus_frame(DIRECT, payload))
+
+        elif kind == RELEASE:
+            nickname = payload.decode('utf-8').lower()
+            if self.owners.get(nickname) is sock:
+                del self.owners[nickname]
+
+    def serve(self):
+        while self.workers:
+            for key, mask in self.selector.select():
+                sock = key.fileobj
+                if mask & selectors.EVENT_WRITE:
+                    self.flush(sock)
+                if mask & selectors.EVENT_READ and sock in self.workers:
+                    try:
+                        data = sock.recv(server.RECV_SIZE)
+                    except (BlockingIOError, InterruptedError):
+                        continue
+                    except OSError:
+                        data = b''
+                    if not data:
+                        self.remove(sock)
+                        continue
+                    for kind, payload in self.decoders[sock].feed(data):
+                        self.on_frame(sock, kind, payload)
+
+# Proceso del servidor: su propio socket de escucha (SO_REUSEPORT) y su extremo del bus
+def worker(bus_sock, host, port, backlog, metrics_address=None):
+    # El servidor se crea después de fork(): su selector es propio de este proceso
+    chat = server.ChatServer(host, port, backlog, reuse_port=True, metrics_address=metrics_address)
+    chat.bus = Bus(bus_sock, chat)
+    chat.selector.register(bus_sock, selectors.EVENT_READ, chat.bus.on_readable)
+    chat.serve_forever()
+
+# Lanzar los procesos y atender el bus hasta que terminen
+def supervise(workers, host=server.HOST, port=server.PORT, backlog=server.BACKLOG, metrics_address=None):
+    hub = Hub()
+
+    for index in range(workers):
+        # Cada proceso tiene sus propias métricas: puerto consecutivo o ruta con sufijo
+        address = worker_address(metrics_address, index) if metrics_address is not None else None
+        parent_end, child_end = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            parent_end.close()
+            for sock in hub.workers:
+                sock.close()
+            hub.selector.close()
+            try:
+                worker(child_end, host, port, backlog, address)
+            finally:
+                jsonlog.shutdown()
+                os._exit(0)
+        child_end.close()
+        hub.add(parent_end, pid)
+
+    # Al recibir SIGTERM/SIGINT, terminar también los procesos hijos
+    def stop(signum, frame):
+        for pid in hub.workers.values():
+            os.kill(pid, signal.SIGTERM)
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    event(INFO, 'supervise', workers=workers, host=host, port=port)
+    hub.serve()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de chat en varios procesos")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--host', default=server.HOST)
+    parser.add_argument('--port', type=int, default=server.PORT)
+    parser.add_argument('--backlog', type=int, default=server.BACKLOG,
+                        help="Conexiones pendientes de aceptar que guarda el kernel en cada proceso")
+    parser.add_argument('--metrics', type=parse_address, default=None,
+                        help="Métricas de Prometheus: 'host:puerto' (el proceso N usa puerto+N) o socket Unix (ruta.N)")
+    server.add_arguments(parser)
+    jsonlog.add_arguments(parser)
+    args = parser.parse_args()
+    jsonlog.configure_from_args(args)
+    server.configure_from_args(args)
+
+    supervise(args.workers, args.host, args.port, args.backlog, args.metrics)
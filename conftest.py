@@ -0,0 +1,143 @@
+import pytest
+import select
+import socket
+import threading
+import time
+from server import ChatServer
+from protocol import NICK, encode, nick_payload
+
+# Fixture con un servidor aislado para cada prueba
+@pytest.fixture
+def chat_server():
+    """
+    Crea un ChatServer propio de la prueba, sin socket de escucha (las
+    conexiones se crean con `chat` o `listener`), y lo cierra al terminar.
+    """
+    instance = ChatServer(port=0)
+    yield instance
+    instance.close()
+
+# Fixture para conectar clientes al servidor de la prueba
+@pytest.fixture
+def chat(chat_server):
+    """
+    Proporciona una función para conectar clientes ya registrados en el
+    servidor de la prueba mediante pares de sockets.
+    Devuelve el extremo "remoto" de cada cliente para leer lo que recibe.
+    """
+    pairs = []
+
+    def connect(nickname):
+        local, remote = socket.socketpair()
+        chat_server.register(local, nickname)
+        pairs.append((local, remote))
+        return local, remote
+
+    yield connect
+
+    for local, remote in pairs:
+        local.close()
+        remote.close()
+
+# Fixture para un socket de escucha en un puerto libre
+@pytest.fixture
+def listener(chat, chat_server):
+    """
+    Crea un socket de escucha propio de la prueba (puerto elegido por el sistema)
+    para el servidor de la prueba, y una función para conectar clientes.
+    Cada conexión devuelve (socket del cliente, socket aceptado por el servidor).
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen()
+    sock.setblocking(False)  # Como el de create_server(): accept() vacía la cola
+    peers = []
+
+    def connect():
+        peer = socket.create_connection(sock.getsockname())
+        peers.append(peer)
+        before = set(chat_server.connections)
+        chat_server.accept(sock)
+        (accepted,) = set(chat_server.connections) - before
+        return peer, accepted
+
+    yield connect
+
+    for peer in peers:
+        peer.close()
+    sock.close()
+
+def read_all(sock):
+    """Lee todo lo disponible en el socket sin bloquear."""
+    sock.setblocking(False)
+    data = b''
+    while True:
+        try:
+            chunk = sock.recv(65536)
+        except BlockingIOError:
+            return data
+        if not chunk:
+            return data
+        data += chunk
+
+def say(chat_server, local, remote, text):
+    """Envía texto desde un cliente antiguo y deja que el servidor lo procese."""
+    remote.send(text.encode('utf-8'))
+    select.select([local], [], [], 1)
+    assert chat_server.handle(local) is True
+    chat_server.flush_pending()
+
+def join(chat_server, listener, nickname, capabilities=()):
+    """Conecta un cliente con tramas que pide `capabilities` y completa su saludo."""
+    peer, accepted = listener()
+    assert peer.recv(1024) == b'NICK'
+    peer.send(encode(NICK, nick_payload(nickname, capabilities)))
+    select.select([accepted], [], [], 1)
+    assert chat_server.handshake(accepted) is True
+    chat_server.flush_pending()
+    return peer, accepted
+
+def receive(peer):
+    """Espera a que lleguen datos y los lee todos."""
+    select.select([peer], [], [], 1)
+    return read_all(peer)
+
+def serve(chat_server):
+    """Atiende el servidor en un hilo; devuelve el hilo."""
+    thread = threading.Thread(target=chat_server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+def launch():
+    """Arranca un servidor en un puerto libre y atiende en un hilo; devuelve (servidor, hilo)."""
+    chat_server = ChatServer(port=0)
+    chat_server.start()
+    return chat_server, serve(chat_server)
+
+def wait_for(condition):
+    """Espera (como mucho 2 segundos) a que se cumpla `condition`."""
+    deadline = time.monotonic() + 2
+    while not condition():
+        assert time.monotonic() < deadline, "La condición no se cumplió a tiempo"
+        time.sleep(0.01)
+
+def connect(chat_server, nickname, framed=True, capabilities=()):
+    """Conecta un cliente a un servidor en marcha y espera a que lo registre."""
+    sock = socket.create_connection((chat_server.host, chat_server.port))
+    sock.settimeout(2)
+    assert sock.recv(1024) == b'NICK'
+    if framed:
+        sock.sendall(encode(NICK, nick_payload(nickname, capabilities)))
+    else:
+        sock.sendall(nickname.encode('utf-8'))
+    wait_for(lambda: nickname.lower() in chat_server.by_nick)
+    return sock
+
+def receive_until(sock, decoder, frame):
+    """Lee tramas hasta recibir `frame`; devuelve todas las recibidas."""
+    frames = []
+    while frame not in frames:
+        data = sock.recv(65536)
+        assert data, "Conexión cerrada antes de tiempo"
+        frames += decoder.feed(data)
+    return frames
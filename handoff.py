@@ -0,0 +1,270 @@
+"""
+Reinicio sin cortes: el servidor en marcha entrega su socket de escucha y las
+conexiones de sus clientes a un proceso nuevo a través de un socket Unix
+(SCM_RIGHTS), junto con lo necesario para seguir atendiéndolos (nickname,
+salas, datos a medio enviar o a medio recibir, historial de las salas).
+
+Los clientes no ven el cambio: sus conexiones TCP siguen abiertas y lo que
+envían mientras tanto espera en el búfer del kernel hasta que lo lea el
+proceso nuevo. Las conexiones que llegan durante el traspaso esperan en la
+cola del mismo socket de escucha.
+
+Uso:
+    python server.py --handoff /tmp/chat.sock                # proceso actual
+    python server.py --handoff /tmp/chat.sock --takeover     # versión nueva
+
+Secuencia (socket Unix de control, de flujo):
+    nuevo -> se conecta al socket de control del proceso actual
+    actual -> lotes de estado: cabecera (longitud del JSON, número de
+              descriptores) con los descriptores adjuntos y el JSON a
+              continuación; una cabecera (0, 0) cierra la lista
+    nuevo -> ACK cuando ya ha adoptado todas las conexiones
+    actual -> cierra sus copias de los descriptores, vacía su registro de
+              mensajes (ver msglog.py) y envía DONE antes de salir
+
+Si el proceso nuevo falla antes del ACK, el actual sigue atendiendo a sus
+clientes como si nada. El estado de un compresor zlib no se puede traspasar:
+el proceso actual cierra el flujo de cada conexión comprimida (Z_FINISH, ver
+Connection.restart_stream) y el nuevo empieza otro, que el cliente
+descomprime desde cero (ver StreamDecoder).
+"""
+import base64
+import json
+import os
+import selectors
+import socket
+import struct
+
+from jsonlog import INFO, WARNING, event
+from protocol import HEADER, FrameDecoder
+
+# Cabecera de cada lote: longitud del JSON y número de descriptores adjuntos
+BATCH = struct.Struct('!II')
+
+# Descriptores por mensaje (Linux admite como mucho 253 por SCM_RIGHTS)
+MAX_FDS = 250
+
+# Respuestas del proceso nuevo y del actual
+ACK = b'K'
+DONE = b'D'
+
+# Segundos que puede tardar cada paso del traspaso
+HANDOFF_TIMEOUT = 10
+
+class HandoffError(Exception):
+    pass
+
+def encode_bytes(data):
+    return base64.b64encode(data).decode('ascii')
+
+def decode_bytes(text):
+    return base64.b64decode(text)
+
+# Leer exactamente `size` bytes del socket de control
+def receive_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise HandoffError("El otro proceso cerró el socket de control")
+        data += chunk
+    return bytes(data)
+
+# Enviar un lote de estado con sus descriptores
+def send_batch(sock, state, fds):
+    body = json.dumps(state).encode('utf-8')
+    socket.send_fds(sock, [BATCH.pack(len(body), len(fds))], fds)
+    sock.sendall(body)
+
+# Recibir un lote; devuelve (estado, descriptores) o None al final de la lista
+def receive_batch(sock):
+    data, fds, _, _ = socket.recv_fds(sock, BATCH.size, MAX_FDS)
+    if not data:
+        raise HandoffError("El proceso actual cerró el socket de control")
+    data += receive_exactly(sock, BATCH.size - len(data))
+    length, count = BATCH.unpack(data)
+    if len(fds) != count:
+        for fd in fds:
+            os.close(fd)
+        raise HandoffError(f"Se esperaban {count} descriptores y llegaron {len(fds)}")
+    if not length:
+        return None
+    return json.loads(receive_exactly(sock, length)), fds
+
+# Estado de una conexión que el proceso nuevo necesita para seguir atendiéndola
+def describe(chat, client, conn):
+    return {
+        'nickname': chat.nicknames.get(client),
+        'framed': conn.framed,
+        'input': encode_bytes(bytes(conn.decoder.buffer)) if conn.decoder is not None else '',
+        'output': encode_bytes(b''.join(conn.outbuf)),
+        'deferred': [encode_bytes(message) for message in conn.deferred],
+        'rooms': sorted(chat.memberships.get(client, ())),
+        'room': conn.room,
+        'compressed': conn.compressor is not None,
+    }
+
+# Historial de cada sala como (tipo, mensaje), del más antiguo al más reciente
+def describe_histories(histories):
+    return {room: [(HEADER.unpack(head)[1], encode_bytes(message)) for head, message in history.entries]
+            for room, history in histories.rooms.items()}
+
+# Proceso actual: atiende las peticiones de traspaso en un socket Unix
+class Handoff:
+    def __init__(self, chat, path):
+        self.chat = chat
+        self.path = path
+        self.sock = None
+
+    def listen(self):
+        # Un socket de un proceso anterior que ya terminó no impide escuchar
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(1)
+        self.chat.selector.register(self.sock, selectors.EVENT_READ, self.on_request)
+        event(INFO, 'handoff_listen', path=self.path)
+
+    # Dejar de atender peticiones; unlink=False cuando el socket ya es del proceso nuevo
+    def close(self, unlink=True):
+        if self.sock is None:
+            return
+        try:
+            self.chat.selector.unregister(self.sock)
+        except (KeyError, ValueError):
+            pass
+        self.sock.close()
+        self.sock = None
+        if unlink and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    # Un proceso nuevo pide el traspaso
+    def on_request(self):
+        try:
+            control, _ = self.sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        with control:
+            control.settimeout(HANDOFF_TIMEOUT)
+            try:
+                self.give(control)
+            except (OSError, HandoffError) as error:
+                # El proceso nuevo no llegó a quedarse con las conexiones: seguir como antes
+                event(WARNING, 'handoff_failed', error=str(error))
+
+    def give(self, control):
+        chat = self.chat
+
+        # Enviar lo que admitan los sockets: lo que quede viaja en el estado
+        chat.flush_pending()
+
+        # Cerrar los flujos zlib: su final viaja con lo pendiente y el proceso nuevo
+        # empieza otro. Si el traspaso falla, este proceso sigue con el flujo nuevo
+        for conn in chat.connections.values():
+            if conn.compressor is not None:
+                conn.restart_stream()
+
+        send_batch(control, {'listener': True, 'histories': describe_histories(chat.histories)},
+                   [chat.listener.fileno()])
+        clients = list(chat.connections.items())
+        for start in range(0, len(clients), MAX_FDS):
+            batch = clients[start:start + MAX_FDS]
+            send_batch(control, {'connections': [describe(chat, client, conn) for client, conn in batch]},
+                       [client.fileno() for client, _ in batch])
+        control.sendall(BATCH.pack(0, 0))
+
+        if receive_exactly(control, len(ACK)) != ACK:
+            raise HandoffError("Respuesta inesperada del proceso nuevo")
+
+        # Las conexiones ya son del proceso nuevo: soltar las copias de este
+        event(INFO, 'handoff', clients=len(clients))
+        chat.detach()
+        self.close(unlink=False)
+
+        # El registro en disco pasa al proceso nuevo cuando este ya no escribe
+        if chat.message_log is not None:
+            chat.message_log.stop()
+            chat.message_log = None
+        control.sendall(DONE)
+        chat.stop()
+
+# Adoptar una conexión recibida del proceso anterior
+def adopt(chat, sock, state):
+    ip = None  # Sin dirección IP (p. ej. un socket Unix): no cuenta para MAX_PER_IP
+    if sock.family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            ip = sock.getpeername()[0]
+        except OSError:
+            pass  # El cliente ya se fue; se verá al leer
+    conn = chat.watch(sock, ip)
+    conn.framed = state['framed']
+    if conn.framed:
+        conn.decoder = FrameDecoder()
+        conn.decoder.buffer += decode_bytes(state['input'])
+
+    if state['nickname'] is not None:
+        # Registrado: mismas salas y misma sala activa que tenía
+        chat.register(sock, state['nickname'])
+        for room in state['rooms']:
+            chat.join(sock, room)
+        for room in chat.memberships[sock] - set(state['rooms']):
+            chat.part(sock, room)
+        conn.room = state['room']
+    else:
+        # Aún en el saludo: vuelve a tener todo el plazo para enviar su nickname
+        chat.handshakes.add(sock)
+        chat.timers.schedule(sock, conn.deadline)
+
+    output = decode_bytes(state['output'])
+    if output:
+        chat.queue(conn, [memoryview(output)])
+    if state.get('compressed'):  # Sin la clave si el proceso anterior es de una versión previa
+        # Lo anterior ya venía comprimido y termina su flujo; lo que siga, en uno nuevo
+        conn.restart_stream()
+    deferred = [decode_bytes(message) for message in state['deferred']]
+    if deferred and conn.limits is None:
+        # Este proceso no limita la frecuencia: lo aplazado se entrega ya
+        for message in deferred:
+            if not chat.process_deferred(sock, message):
+                break
+    elif deferred:
+        conn.deferred.extend(deferred)
+        chat.throttled.add(sock)
+        chat.update_events(conn)
+
+# Proceso nuevo: quedarse con el socket de escucha y las conexiones del proceso actual
+def take(chat, path):
+    control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    control.settimeout(HANDOFF_TIMEOUT)
+    with control:
+        control.connect(path)
+        adopted = 0
+        while True:
+            batch = receive_batch(control)
+            if batch is None:
+                break
+            state, fds = batch
+            if state.get('listener'):
+                chat.listener = socket.socket(fileno=fds[0])
+                chat.listener.setblocking(False)  # Ver ChatServer.accept()
+                chat.selector.register(chat.listener, selectors.EVENT_READ)
+                chat.host, chat.port = chat.listener.getsockname()[:2]
+                for room, entries in state['histories'].items():
+                    for kind, message in entries:
+                        chat.histories.record(room, kind, decode_bytes(message))
+            else:
+                for fd, connection in zip(fds, state['connections']):
+                    adopt(chat, socket.socket(fileno=fd), connection)
+                adopted += len(fds)
+
+        if chat.listener is None:
+            raise HandoffError("El proceso actual no envió su socket de escucha")
+        control.sendall(ACK)
+
+        # Esperar a que el proceso anterior suelte el registro de mensajes
+        if receive_exactly(control, len(DONE)) != DONE:
+            raise HandoffError("Respuesta inesperada del proceso actual")
+
+    event(INFO, 'takeover', clients=adopted, host=chat.host, port=chat.port)
+    return adopted
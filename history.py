@@ -0,0 +1,80 @@
+"""
+Historial reciente de cada sala: un búfer circular acotado a la vez por número
+de mensajes y por bytes, de modo que la memoria de cada sala es constante por
+mucho tiempo que lleve el servidor en marcha.
+
+Cada entrada guarda la cabecera de la trama ya serializada junto al contenido,
+así que reenviar el historial a un cliente nuevo no codifica nada: son
+referencias a buffers que se envían juntos con una sola escritura.
+"""
+from collections import OrderedDict, deque
+
+from protocol import header
+
+# Mensajes y bytes que se guardan por sala
+HISTORY_SIZE = 50
+HISTORY_BYTES = 64 * 1024
+
+# Salas con historial en memoria; al superarlo se descarta la usada hace más tiempo
+HISTORY_ROOMS = 1024
+
+# Búfer circular de los últimos mensajes de una sala
+class History:
+    __slots__ = ('entries', 'size', 'max_bytes')
+
+    def __init__(self, max_messages=HISTORY_SIZE, max_bytes=HISTORY_BYTES):
+        self.entries = deque(maxlen=max_messages)  # (cabecera, contenido)
+        self.size = 0  # Bytes de contenido guardados
+        self.max_bytes = max_bytes
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, kind, message):
+        # Un mensaje que no cabe entero nunca se guarda
+        if len(message) > self.max_bytes or self.entries.maxlen == 0:
+            return
+        entries = self.entries
+
+        # Al añadir con el búfer lleno, deque descarta el más antiguo
+        if len(entries) == entries.maxlen:
+            self.size -= len(entries[0][1])
+        entries.append((header(kind, len(message)), bytes(message)))
+        self.size += len(message)
+
+        # Descartar los más antiguos hasta volver al límite de bytes
+        while self.size > self.max_bytes:
+            self.size -= len(entries.popleft()[1])
+
+    def buffers(self, framed):
+        """Buffers listos para enviar a un cliente, del más antiguo al más reciente."""
+        if framed:
+            return [memoryview(part) for entry in self.entries for part in entry]
+        return [memoryview(message) for _, message in self.entries]
+
+# Historiales de todas las salas, acotados en número (LRU)
+class Histories:
+    def __init__(self, max_rooms=HISTORY_ROOMS, max_messages=HISTORY_SIZE, max_bytes=HISTORY_BYTES):
+        self.rooms = OrderedDict()  # nombre de sala -> History
+        self.max_rooms = max_rooms
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+
+    def get(self, room):
+        return self.rooms.get(room)
+
+    def record(self, room, kind, message):
+        if not self.max_messages:
+            return
+        history = self.rooms.get(room)
+        if history is None:
+            history = self.rooms[room] = History(self.max_messages, self.max_bytes)
+            if len(self.rooms) > self.max_rooms:
+                self.rooms.popitem(last=False)
+        else:
+            self.rooms.move_to_end(room)
+        history.add(kind, message)
+
+    def buffers(self, room, framed):
+        history = self.rooms.get(room)
+        return history.buffers(framed) if history is not None else []
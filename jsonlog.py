@@ -0,0 +1,145 @@
+"""
+Registro estructurado del servidor: una línea JSON por evento.
+
+Los eventos se filtran por nivel y por muestreo/límite de frecuencia en el
+hilo que los genera, y solo los que pasan se encolan; un hilo en segundo
+plano (QueueListener) hace la escritura real. Así el bucle de eventos nunca
+espera por stdout ni por el disco, y un evento de un nivel desactivado cuesta
+una sola comprobación de `enabled()`.
+
+    from jsonlog import DEBUG, enabled, event
+    if enabled(DEBUG):
+        event(DEBUG, 'fanout', recipients=len(members))
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+from logging import DEBUG, ERROR, INFO, WARNING
+
+logger = logging.getLogger('chat')
+
+# Comprobar si un nivel está activo (cacheado por logging)
+def enabled(level):
+    return logger.isEnabledFor(level)
+
+# Registrar un evento estructurado con campos arbitrarios
+def event(level, name, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, name, extra={'fields': fields})
+
+# Convertir a JSON los valores que json no sabe serializar
+def _default(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode('utf-8', errors='replace')
+    return str(value)
+
+# Formato: una línea JSON por evento
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'event': record.msg,
+            'pid': record.process,
+        }
+        entry.update(getattr(record, 'fields', {}))
+        return json.dumps(entry, ensure_ascii=False, default=_default)
+
+# Muestreo y límite de frecuencia por tipo de evento
+class Sampler(logging.Filter):
+    def __init__(self, rates=None, limits=None):
+        super().__init__()
+        self.rates = rates or {}  # evento -> fracción que se conserva (0..1)
+        self.limits = limits or {}  # evento -> máximo de eventos por segundo
+        self.windows = {}  # evento -> (segundo actual, eventos en ese segundo)
+
+    def filter(self, record):
+        name = record.msg
+
+        rate = self.rates.get(name)
+        if rate is not None and random.random() >= rate:
+            return False
+
+        limit = self.limits.get(name)
+        if limit is not None:
+            second = int(time.monotonic())
+            window, count = self.windows.get(name, (second, 0))
+            if window != second:
+                window, count = second, 0
+            if count >= limit:
+                return False
+            self.windows[name] = (window, count + 1)
+
+        return True
+
+# Listener activo (uno por proceso) y la configuración con la que se creó
+_listener = None
+_config = None
+
+# Configurar el registro: nivel, destino (archivo JSONL o stderr), muestreo y límites
+def configure(level='INFO', path=None, rates=None, limits=None):
+    global _listener, _config
+    _config = (level, path, rates, limits)
+    if _listener is not None:
+        _listener.stop()
+
+    handler = logging.FileHandler(path, mode='a', encoding='utf-8') if path else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter())
+
+    # El hilo que genera el evento solo filtra y encola; el listener escribe
+    records = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(Sampler(rates, limits))
+
+    logger.handlers[:] = [queue_handler]
+    logger.setLevel(level)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+    return _listener
+
+# Vaciar la cola y parar el hilo escritor
+def shutdown():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(shutdown)
+
+# Tras fork() el hilo escritor no existe en el hijo: crear uno nuevo con la misma configuración
+def _after_fork():
+    global _listener
+    if _config is not None:
+        _listener = None
+        configure(*_config)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+# Interpretar 'evento=valor,evento=valor'
+def _parse_pairs(text, cast):
+    pairs = {}
+    for item in filter(None, (text or '').split(',')):
+        name, _, value = item.partition('=')
+        pairs[name.strip()] = cast(value)
+    return pairs
+
+# Opciones de línea de comandos comunes a los servidores
+def add_arguments(parser):
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    parser.add_argument('--log-file', default=None, help="Archivo JSONL (por defecto, stderr)")
+    parser.add_argument('--log-sample', default='', help="Fracción por evento, p. ej. 'message=0.01,fanout=0.01'")
+    parser.add_argument('--log-limit', default='', help="Máximo por segundo por evento, p. ej. 'connect=100'")
+
+def configure_from_args(args):
+    return configure(args.log_level, args.log_file,
+                     _parse_pairs(args.log_sample, float), _parse_pairs(args.log_limit, int))
@@ -0,0 +1,283 @@
+"""
+Métricas del servidor en el formato de texto de Prometheus.
+
+Los contadores y los histogramas se actualizan en el hilo del bucle de
+eventos, el único que los toca: una suma sobre un atributo, sin bloqueos ni
+colas. Los medidores que dependen del estado (clientes conectados, bytes
+pendientes de enviar...) no se actualizan nunca: se calculan al consultarlos.
+
+La consulta la atiende el mismo bucle (ver Endpoint), en HTTP sobre TCP o
+sobre un socket Unix:
+
+    python server.py --metrics 127.0.0.1:9100
+    curl -s http://127.0.0.1:9100/metrics
+
+    python server.py --metrics /tmp/chat-metrics.sock
+    curl -s --unix-socket /tmp/chat-metrics.sock http://localhost/metrics
+
+Los mensajes y bytes por segundo se obtienen en Prometheus con rate() sobre
+los contadores *_total.
+"""
+import functools
+import os
+import selectors
+import socket
+from bisect import bisect_left
+from time import perf_counter
+
+# Límites de los histogramas de duración (segundos)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Fases de una vuelta del bucle de eventos (ver ChatServer.serve_forever)
+SELECT = 'select'  # Esperando a que haya sockets listos
+EVENTS = 'events'  # Atendiendo los sockets listos
+DEFERRED = 'deferred'  # Entregando mensajes aplazados por el límite de frecuencia
+FLUSH = 'flush'  # Enviando lo encolado en la vuelta
+TIMERS = 'timers'  # Clientes lentos, saludos caducados y latidos
+PHASES = (SELECT, EVENTS, DEFERRED, FLUSH, TIMERS)
+
+# Tamaño máximo de una petición HTTP de consulta
+MAX_REQUEST = 8 * 1024
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def format_labels(labels):
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}' if labels else ''
+
+class Counter:
+    __slots__ = ('labels', 'value')
+    kind = 'counter'
+
+    def __init__(self, labels=()):
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name):
+        yield name, self.labels, self.value
+
+# Medidor: un valor fijado con set() o calculado al consultarlo con `function`
+class Gauge:
+    __slots__ = ('labels', 'value', 'function')
+    kind = 'gauge'
+
+    def __init__(self, labels=(), function=None):
+        self.labels = labels
+        self.value = 0
+        self.function = function
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name):
+        yield name, self.labels, self.function() if self.function is not None else self.value
+
+# Histograma: cada observación suma 1 a un solo cubo (búsqueda binaria); los
+# totales acumulados que pide Prometheus se calculan al consultarlo
+class Histogram:
+    __slots__ = ('labels', 'bounds', 'counts', 'sum')
+    kind = 'histogram'
+
+    def __init__(self, labels=(), bounds=LATENCY_BUCKETS):
+        self.labels = labels
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # El último cubo es +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def samples(self, name):
+        total = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            yield f'{name}_bucket', self.labels + (('le', '+Inf' if bound == float('inf') else repr(bound)),), total
+        yield f'{name}_sum', self.labels, self.sum
+        yield f'{name}_count', self.labels, total
+
+# Conjunto de métricas con nombre, en el orden en que se registraron
+class Registry:
+    def __init__(self):
+        self.families = {}  # nombre -> (tipo, ayuda, [métricas con sus etiquetas])
+
+    def add(self, name, help, metric):
+        kind, _, metrics = self.families.setdefault(name, (metric.kind, help, []))
+        if kind != metric.kind:
+            raise ValueError(f"La métrica {name} ya es de tipo {kind}")
+        metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, **labels):
+        return self.add(name, help, Counter(tuple(labels.items())))
+
+    def gauge(self, name, help, function=None, **labels):
+        return self.add(name, help, Gauge(tuple(labels.items()), function))
+
+    def histogram(self, name, help, bounds=LATENCY_BUCKETS, **labels):
+        return self.add(name, help, Histogram(tuple(labels.items()), bounds))
+
+    # Todas las métricas en el formato de texto de Prometheus
+    def render(self):
+        lines = []
+        for name, (kind, help, metrics) in self.families.items():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for metric in metrics:
+                for sample, labels, value in metric.samples(name):
+                    lines.append(f'{sample}{format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+# Métricas de un ChatServer; los medidores leen su estado al consultarlos
+class ChatMetrics(Registry):
+    def __init__(self, chat):
+        super().__init__()
+        self.gauge('chat_clients', "Clientes registrados (con nickname)", lambda: len(chat.clients))
+        self.gauge('chat_handshakes', "Conexiones en el saludo, aún sin nickname", lambda: len(chat.handshakes))
+        self.accepted = self.counter('chat_accepted_total', "Conexiones aceptadas")
+        self.refused = self.counter('chat_refused_total', "Conexiones rechazadas al aceptarlas (servidor lleno, límite por dirección)")
+        self.rejected = self.counter('chat_rejected_total', "Clientes rechazados con un aviso (nickname no válido, límite de frecuencia...)")
+
+        self.messages_in = self.counter('chat_messages_in_total', "Mensajes recibidos de los clientes")
+        self.bytes_in = self.counter('chat_bytes_in_total', "Bytes recibidos de los clientes")
+        self.messages_out = self.counter('chat_messages_out_total', "Mensajes encolados para los clientes (uno por destinatario)")
+        self.bytes_out = self.counter('chat_bytes_out_total', "Bytes enviados a los clientes")
+        self.fanout_seconds = self.histogram('chat_fanout_seconds', "Duración de cada difusión (encolar el mensaje a todos sus destinatarios)")
+
+        self.gauge('chat_outbound_queued_bytes', "Bytes pendientes de enviar, sumando todos los clientes",
+                   lambda: sum(conn.outlen for conn in chat.connections.values()))
+        self.gauge('chat_outbound_queued_bytes_max', "Bytes pendientes de enviar del cliente más atrasado",
+                   lambda: max((conn.outlen for conn in chat.connections.values()), default=0))
+        self.gauge('chat_slow_consumers', "Clientes por encima de HIGH_WATERMARK", lambda: len(chat.slow_consumers))
+        self.gauge('chat_throttled', "Clientes con mensajes aplazados por el límite de frecuencia", lambda: len(chat.throttled))
+        self.send_retries = self.counter('chat_send_retries_total', "Envíos que el socket no admitió enteros (se completan al volver a ser escribible)")
+        self.evictions = {reason: self.counter('chat_evictions_total', "Clientes desconectados por el servidor", reason=reason)
+                          for reason in ('max_buffer', 'slow_consumer', 'idle_timeout', 'rate_limit')}
+
+        self.phases = {phase: self.histogram('chat_loop_phase_seconds', "Tiempo de cada fase de una vuelta del bucle", phase=phase)
+                       for phase in PHASES}
+
+    # Anotar la duración de una fase que empezó en `started`; devuelve el instante
+    # actual, que es donde empieza la fase siguiente
+    def lap(self, phase, started):
+        now = perf_counter()
+        self.phases[phase].observe(now - started)
+        return now
+
+# Interpretar 'host:puerto', ':puerto' o la ruta de un socket Unix
+def parse_address(text):
+    if '/' in text:
+        return text
+    host, _, port = text.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+# Dirección del proceso número `index` del cluster: puerto consecutivo o ruta con sufijo
+def worker_address(address, index):
+    if isinstance(address, str):
+        return f'{address}.{index}'
+    host, port = address
+    return host, port + index
+
+# Servidor HTTP mínimo para las consultas, atendido por el bucle de eventos del
+# servidor de chat: la petición se lee y la respuesta se escribe sin bloquear
+class Endpoint:
+    def __init__(self, selector, registry, address):
+        self.selector = selector
+        self.registry = registry
+        self.address = address  # (host, puerto) o ruta de un socket Unix
+        self.sock = None
+        self.requests = {}  # socket -> bytes recibidos (o respuesta pendiente)
+
+    def listen(self):
+        if isinstance(self.address, str):
+            # Un socket de un proceso anterior que ya terminó no impide escuchar
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(self.address)
+        self.sock.listen()
+        self.sock.setblocking(False)
+        self.selector.register(self.sock, selectors.EVENT_READ, self.on_accept)
+        if not isinstance(self.address, str):
+            self.address = self.sock.getsockname()[:2]
+        return self.address
+
+    def close(self):
+        for client in list(self.requests):
+            self.finish(client)
+        if self.sock is None:
+            return
+        self.selector.unregister(self.sock)
+        self.sock.close()
+        self.sock = None
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def on_accept(self):
+        try:
+            client, _ = self.sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        client.setblocking(False)
+        self.requests[client] = b''
+        self.selector.register(client, selectors.EVENT_READ, functools.partial(self.on_request, client))
+
+    def on_request(self, client):
+        try:
+            data = client.recv(MAX_REQUEST)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.finish(client)
+            return
+
+        request = self.requests[client] + data
+        if b'\r\n\r\n' not in request and len(request) < MAX_REQUEST:
+            self.requests[client] = request
+            return
+
+        # Solo interesa la primera línea: 'GET /metrics HTTP/1.1'
+        method, _, rest = request.partition(b' ')
+        path = rest.partition(b' ')[0]
+        if method != b'GET':
+            response = self.response('405 Method Not Allowed', '')
+        elif path.partition(b'?')[0] in (b'/', b'/metrics'):
+            response = self.response('200 OK', self.registry.render())
+        else:
+            response = self.response('404 Not Found', '')
+
+        self.requests[client] = memoryview(response)
+        self.selector.modify(client, selectors.EVENT_WRITE, functools.partial(self.on_writable, client))
+        self.on_writable(client)
+
+    def on_writable(self, client):
+        pending = self.requests[client]
+        try:
+            sent = client.send(pending)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            sent = len(pending)
+        if sent < len(pending):
+            self.requests[client] = pending[sent:]
+        else:
+            self.finish(client)
+
+    def finish(self, client):
+        del self.requests[client]
+        self.selector.unregister(client)
+        client.close()
+
+    @staticmethod
+    def response(status, body):
+        body = body.encode('utf-8')
+        head = (f'HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n'
+                f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n')
+        return head.encode('ascii') + body
@@ -0,0 +1,352 @@
+"""
+Registro persistente de mensajes: los mensajes difundidos se añaden a archivos
+de segmento (solo añadir) para poder recuperarlos tras reiniciar el servidor.
+
+El bucle de eventos solo encola (nunca espera por el disco); un hilo escritor
+vacía la cola por lotes, escribe cada lote de una vez y hace un único fsync()
+por lote (group commit). Cada segmento tiene un índice disperso de
+(secuencia, instante, posición) que se lee con mmap, así que "desde el
+instante T" o "los últimos N" son una búsqueda binaria en el índice y una
+lectura de un tramo del segmento, no un recorrido completo.
+
+    log = MessageLog('datos/')
+    log.start()
+    log.append(CHAT, b'Ana: hola', 'general')
+    for sequence, timestamp, kind, room, message in log.last(50):
+        ...
+"""
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+
+from jsonlog import INFO, WARNING, event
+
+# Cabecera de cada registro: longitud del mensaje, instante (segundos epoch), tipo, longitud de la sala
+RECORD = struct.Struct('!IdBB')
+
+# Entrada del índice disperso: secuencia, instante y posición del registro en el segmento
+INDEX = struct.Struct('!QdQ')
+
+# Tamaño a partir del cual se abre un segmento nuevo
+SEGMENT_BYTES = 64 * 1024 * 1024
+
+# Una entrada de índice cada tantos bytes de segmento (y siempre para el primer registro)
+INDEX_INTERVAL = 4096
+
+# Registros pendientes de escribir; si la cola se llena se descartan (nunca se bloquea)
+QUEUE_SIZE = 64 * 1024
+
+# Registros que el hilo escritor agrupa como máximo en una sola escritura
+MAX_BATCH = 4096
+
+# Segundos entre dos aplicaciones de la retención por antigüedad sin rotar (ver expire)
+RETAIN_INTERVAL = 60
+
+# Marcas para el hilo escritor: detenerse y aplicar la retención
+_STOP = object()
+_RETAIN = object()
+
+# Un segmento: archivo de registros y su índice disperso
+class Segment:
+    def __init__(self, directory, base):
+        self.base = base  # Secuencia del primer registro
+        self.path = os.path.join(directory, f"{base:020d}.log")
+        self.index_path = os.path.join(directory, f"{base:020d}.idx")
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    # Mapear un archivo en memoria para leerlo (None si está vacío o ya no existe)
+    @staticmethod
+    def _map(path):
+        try:
+            with open(path, 'rb') as file:
+                return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def first_timestamp(self):
+        index = self._map(self.index_path)
+        if index is None:
+            return None
+        with index:
+            return INDEX.unpack_from(index, 0)[1]
+
+    def seek(self, field, value):
+        """Busca en el índice la última entrada con `field` (0: secuencia, 1: instante)
+        menor o igual que `value`; devuelve (secuencia, posición) desde donde leer."""
+        index = self._map(self.index_path)
+        if index is None:
+            return self.base, 0
+        with index:
+            low, high = 0, len(index) // INDEX.size
+            while low < high:
+                middle = (low + high) // 2
+                if INDEX.unpack_from(index, middle * INDEX.size)[field] <= value:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == 0:
+                return self.base, 0
+            sequence, _, position = INDEX.unpack_from(index, (low - 1) * INDEX.size)
+            return sequence, position
+
+    def end(self):
+        """Secuencia siguiente y posición final del último registro completo."""
+        sequence, position = self.seek(0, float('inf'))
+        data = self._map(self.path)
+        if data is None:
+            return sequence, 0
+        with data:
+            # Entrada de índice que apunta más allá de lo escrito (escritura interrumpida)
+            if position > len(data):
+                sequence, position = self.base, 0
+            while len(data) - position >= RECORD.size:
+                length, _, _, room_length = RECORD.unpack_from(data, position)
+                stop = position + RECORD.size + room_length + length
+                if stop > len(data):
+                    break
+                sequence += 1
+                position = stop
+        return sequence, position
+
+    def read(self, sequence, position):
+        """Recorre los registros desde `position` (cuya secuencia es `sequence`)."""
+        data = self._map(self.path)
+        if data is None:
+            return
+        with data:
+            end = len(data)
+            while end - position >= RECORD.size:
+                length, timestamp, kind, room_length = RECORD.unpack_from(data, position)
+                start = position + RECORD.size
+                stop = start + room_length + length
+                if stop > end:
+                    break  # Registro a medio escribir
+                room = data[start:start + room_length].decode('utf-8') or None
+                yield sequence, timestamp, kind, room, data[start + room_length:stop]
+                sequence += 1
+                position = stop
+
+# Registro de mensajes en segmentos con índice disperso
+class MessageLog:
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, retention_bytes=None,
+                 retention_seconds=None, fsync_interval=0.0, index_interval=INDEX_INTERVAL,
+                 queue_size=QUEUE_SIZE):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.retention_bytes = retention_bytes  # Máximo total en disco (None: sin límite)
+        self.retention_seconds = retention_seconds  # Antigüedad máxima (None: sin límite)
+        self.fsync_interval = fsync_interval  # 0: fsync por lote; None: nunca (lo decide el sistema)
+        self.index_interval = index_interval
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0  # Registros descartados por cola llena
+        self.lock = threading.Lock()  # Protege la lista de segmentos
+        self.thread = None
+
+        os.makedirs(directory, exist_ok=True)
+        bases = sorted(int(name[:-4]) for name in os.listdir(directory)
+                       if name.endswith('.log') and name[:-4].isdigit())
+        self.segments = [Segment(directory, base) for base in bases] or [Segment(directory, 0)]
+        self._recover()
+        self._retain()
+
+    # Abrir el último segmento para seguir escribiendo tras un reinicio
+    def _recover(self):
+        segment = self.segments[-1]
+        self.next_sequence, end = segment.end()
+
+        # Recortar un registro a medio escribir y las entradas de índice que apunten más allá
+        self.file = open(segment.path, 'ab', buffering=0)
+        self.file.truncate(end)
+        self.index = open(segment.index_path, 'ab', buffering=0)
+        entries = os.path.getsize(segment.index_path) // INDEX.size
+        self.indexed = -self.index_interval  # Posición de la última entrada de índice
+        with open(segment.index_path, 'rb') as index:
+            data = index.read()
+        while entries:
+            position = INDEX.unpack_from(data, (entries - 1) * INDEX.size)[2]
+            if position < end:
+                self.indexed = position
+                break
+            entries -= 1
+        self.index.truncate(entries * INDEX.size)
+        self.position = end
+
+    # Encolar un mensaje; nunca bloquea el bucle de eventos
+    def append(self, kind, message, room=None):
+        try:
+            self.queue.put_nowait((time.time(), kind, room, bytes(message)))
+        except queue.Full:
+            self.dropped += 1
+            event(WARNING, 'msglog_full', dropped=self.dropped)
+
+    # Pedir al hilo escritor que aplique la retención por antigüedad: sin tráfico no
+    # se rota ningún segmento y los viejos no se borrarían nunca
+    def expire(self):
+        if self.retention_seconds is None:
+            return
+        try:
+            self.queue.put_nowait(_RETAIN)
+        except queue.Full:
+            pass  # Ya hay trabajo pendiente; se intentará en la siguiente
+
+    def start(self):
+        self.thread = threading.Thread(target=self._writer, name='msglog', daemon=True)
+        self.thread.start()
+        return self
+
+    # Vaciar la cola, sincronizar con el disco y parar el hilo escritor
+    def stop(self):
+        if self.thread is not None:
+            self.queue.put(_STOP)
+            self.thread.join()
+            self.thread = None
+        self.file.close()
+        self.index.close()
+
+    # Hilo escritor: agrupa lo encolado, lo escribe de una vez y sincroniza (group commit)
+    def _writer(self):
+        last_sync = time.monotonic()
+        dirty = False
+        while True:
+            timeout = None
+            if dirty and self.fsync_interval:
+                timeout = max(self.fsync_interval - (time.monotonic() - last_sync), 0)
+            try:
+                batch = [self.queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = _STOP in batch
+            records = [record for record in batch if record is not _STOP and record is not _RETAIN]
+            if records:
+                self._write(records)
+                dirty = True
+            if _RETAIN in batch:
+                self._retain()
+
+            if dirty and self.fsync_interval is not None and (
+                    stop or time.monotonic() - last_sync >= self.fsync_interval):
+                self._sync()
+                last_sync = time.monotonic()
+                dirty = False
+            if stop:
+                return
+
+    def _write(self, records):
+        chunks = []
+        entries = []
+        position = self.position
+        for timestamp, kind, room, message in records:
+            # Segmento lleno: escribir lo acumulado y pasar a uno nuevo
+            if position >= self.segment_bytes and position > 0:
+                self._flush(chunks, entries, position)
+                chunks, entries = [], []
+                self._rotate()
+                position = 0
+
+            if position - self.indexed >= self.index_interval:
+                entries.append(INDEX.pack(self.next_sequence, timestamp, position))
+                self.indexed = position
+
+            room = room.encode('utf-8') if room is not None else b''
+            chunks += (RECORD.pack(len(message), timestamp, kind, len(room)), room, message)
+            position += RECORD.size + len(room) + len(message)
+            self.next_sequence += 1
+        self._flush(chunks, entries, position)
+
+    def _flush(self, chunks, entries, position):
+        # El segmento se escribe antes que su índice: una entrada nunca apunta a datos que no existen
+        self.file.write(b''.join(chunks))
+        if entries:
+            self.index.write(b''.join(entries))
+        self.position = position
+
+    def _sync(self):
+        os.fsync(self.file.fileno())
+        os.fsync(self.index.fileno())
+
+    # Cerrar el segmento actual, abrir uno nuevo y aplicar la retención
+    def _rotate(self):
+        self._sync()
+        self.file.close()
+        self.index.close()
+
+        segment = Segment(self.directory, self.next_sequence)
+        self.file = open(segment.path, 'ab', buffering=0)
+        self.index = open(segment.index_path, 'ab', buffering=0)
+        self.indexed = -self.index_interval
+        with self.lock:
+            self.segments.append(segment)
+        event(INFO, 'msglog_rotate', base=segment.base)
+        self._retain()
+
+    # Borrar los segmentos más antiguos que superen los límites de retención
+    def _retain(self):
+        with self.lock:
+            while len(self.segments) > 1:
+                oldest, following = self.segments[0], self.segments[1]
+                total = sum(segment.size() for segment in self.segments)
+                expired = self.retention_seconds is not None and (
+                    (following.first_timestamp() or time.time()) < time.time() - self.retention_seconds)
+                if not expired and (self.retention_bytes is None or total <= self.retention_bytes):
+                    break
+                self.segments.pop(0)
+                for path in (oldest.path, oldest.index_path):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def _read_from(self, segments, field, value):
+        first = True
+        for segment in segments:
+            if first:
+                sequence, position = segment.seek(field, value)
+                first = False
+            else:
+                sequence, position = segment.base, 0
+            yield from segment.read(sequence, position)
+
+    # Instante de los registros más antiguos que se pueden devolver: los borra la retención
+    # al rotar, pero el segmento actual puede tener registros que ya han caducado
+    def _cutoff(self):
+        return time.time() - self.retention_seconds if self.retention_seconds is not None else float('-inf')
+
+    def last(self, count):
+        """Los últimos `count` registros: (secuencia, instante, tipo, sala, mensaje)."""
+        cutoff = self._cutoff()
+        target = self.next_sequence - count
+        with self.lock:
+            segments = list(self.segments)
+        start = [segment for segment in segments if segment.base <= target] or segments[:1]
+        segments = segments[segments.index(start[-1]):]
+        for record in self._read_from(segments, 0, target):
+            if record[0] >= target and record[1] >= cutoff:
+                yield record
+
+    def since(self, timestamp):
+        """Los registros con instante mayor o igual que `timestamp` (segundos epoch)."""
+        timestamp = max(timestamp, self._cutoff())
+        with self.lock:
+            segments = list(self.segments)
+        start = 0
+        for offset, segment in enumerate(segments):
+            first = segment.first_timestamp()
+            if first is not None and first <= timestamp:
+                start = offset
+        for record in self._read_from(segments[start:], 1, timestamp):
+            if record[1] >= timestamp:
+                yield record
@@ -0,0 +1,138 @@
+import struct
+import zlib
+
+# Cabecera de cada trama: longitud del contenido (4 bytes, big-endian) + tipo (1 byte)
+HEADER = struct.Struct('!IB')
+
+# Tamaño máximo del contenido de una trama (64 KiB)
+MAX_FRAME_SIZE = 64 * 1024
+
+# Tipos de trama
+NICK = 1  # Nickname del cliente (primera trama de la conexión)
+CHAT = 2  # Mensaje de chat
+SYSTEM = 3  # Aviso del servidor (entradas, salidas, errores)
+CAPS = 4  # Capacidades aceptadas por el servidor (respuesta al NICK)
+PING = 5  # Latido: quien lo recibe responde con PONG (mismo contenido)
+PONG = 6  # Respuesta a PING
+
+# Capacidades que un cliente puede pedir junto a su nickname
+ZLIB = b'zlib'  # Todo lo que envía el servidor tras CAPS va en un flujo zlib propio de la conexión
+
+# Parámetros del flujo zlib: ventana de 4 KiB y memLevel 5 (unos 32 KiB por
+# conexión en vez de los 256 KiB por defecto), suficiente para mensajes de chat
+ZLIB_LEVEL = 6
+ZLIB_WBITS = 12
+ZLIB_MEMLEVEL = 5
+
+# Error de protocolo: trama demasiado grande o de tipo desconocido
+class ProtocolError(Exception):
+    pass
+
+# Cabecera de una trama de `length` bytes (para enviarla junto al contenido sin concatenar)
+def header(kind, length):
+    if length > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Trama demasiado grande: {length} bytes")
+    return HEADER.pack(length, kind)
+
+# Codificar una trama lista para enviar
+def encode(kind, payload):
+    return header(kind, len(payload)) + payload
+
+# Contenido de la trama NICK: el nickname y, tras un byte nulo, las capacidades pedidas
+def nick_payload(nickname, capabilities=()):
+    payload = nickname.encode('utf-8')
+    if capabilities:
+        payload += b'\x00' + b','.join(capabilities)
+    return payload
+
+# Separar el nickname de las capacidades pedidas en una trama NICK
+def parse_nick(payload):
+    nickname, _, capabilities = payload.partition(b'\x00')
+    return nickname.decode('utf-8', errors='replace').strip(), set(filter(None, capabilities.split(b',')))
+
+# Compresor del flujo de salida de una conexión
+def compressor(level=ZLIB_LEVEL):
+    return zlib.compressobj(level, zlib.DEFLATED, ZLIB_WBITS, ZLIB_MEMLEVEL)
+
+# Descompresor para el extremo que recibe (lee la ventana de la cabecera zlib)
+def decompressor():
+    return zlib.decompressobj(0)
+
+# Detectar si una conexión habla el protocolo con tramas.
+# Como MAX_FRAME_SIZE < 2**24, el primer byte de una trama siempre es 0, algo
+# que nunca ocurre con un nickname en texto plano de un cliente antiguo.
+def is_framed(data):
+    return data[:1] == b'\x00'
+
+# Tipos que puede enviar un cliente o el servidor
+KINDS = (NICK, CHAT, SYSTEM, CAPS, PING, PONG)
+
+# Decodificador incremental: acumula bytes y devuelve todas las tramas completas
+class FrameDecoder:
+    def __init__(self, max_size=MAX_FRAME_SIZE, kinds=KINDS):
+        self.buffer = bytearray()
+        self.max_size = max_size
+        self.kinds = kinds
+
+    def feed(self, data, stop=None):
+        """Añade `data` y devuelve una lista de (tipo, contenido) con las tramas completas.
+        Con `stop`, se detiene tras la primera trama de ese tipo y deja el resto en el búfer."""
+        self.buffer += data
+        frames = []
+        offset = 0
+        end = len(self.buffer)
+
+        # Extraer todas las tramas completas de una sola vez
+        while end - offset >= HEADER.size:
+            length, kind = HEADER.unpack_from(self.buffer, offset)
+            if length > self.max_size:
+                raise ProtocolError(f"Trama demasiado grande: {length} bytes")
+            if kind not in self.kinds:
+                raise ProtocolError(f"Tipo de trama desconocido: {kind}")
+
+            start = offset + HEADER.size
+            if end - start < length:
+                break  # Trama incompleta: esperar más datos
+            frames.append((kind, bytes(self.buffer[start:start + length])))
+            offset = start + length
+            if kind == stop:
+                break
+
+        # Descartar lo consumido (una sola vez por llamada)
+        del self.buffer[:offset]
+        return frames
+
+    def take(self):
+        """Devuelve y vacía los bytes aún sin decodificar."""
+        rest = bytes(self.buffer)
+        self.buffer.clear()
+        return rest
+
+# Decodificador de lo que envía el servidor: tramas, y tras CAPS con 'zlib',
+# tramas dentro del flujo comprimido de la conexión. Si el servidor cierra el
+# flujo (al traspasar la conexión a otro proceso) lo que sigue es otro flujo
+class StreamDecoder:
+    def __init__(self):
+        self.frames = FrameDecoder()
+        self.inflater = None
+
+    def feed(self, data):
+        if self.inflater is not None:
+            return self.frames.feed(self.inflate(data))
+
+        # Lo que sigue a CAPS en la misma lectura ya viene comprimido
+        frames = self.frames.feed(data, stop=CAPS)
+        if frames and frames[-1][0] == CAPS:
+            _, capabilities = frames.pop()
+            if ZLIB in capabilities.split(b','):
+                self.inflater = decompressor()
+                frames += self.frames.feed(self.inflate(self.frames.take()))
+        return frames
+
+    def inflate(self, data):
+        plain = self.inflater.decompress(data)
+        while self.inflater.eof:
+            rest = self.inflater.unused_data
+            self.inflater = decompressor()
+            plain += self.inflater.decompress(rest)
+        return plain
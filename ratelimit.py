@@ -0,0 +1,59 @@
+"""
+Cubos de fichas (token buckets) para limitar lo que envía cada cliente.
+
+Cada cubo se rellena a `rate` fichas por segundo hasta un máximo de `burst`;
+el relleno se calcula al consultarlo, así que un cubo inactivo no cuesta nada.
+"""
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate  # Fichas por segundo
+        self.burst = burst  # Capacidad máxima (ráfaga permitida)
+        self.tokens = burst
+        self.stamp = now  # Instante del último relleno
+
+    def refill(self, now):
+        if now > self.stamp:
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+
+    def take(self, amount, now):
+        """Gasta `amount` fichas si las hay; devuelve False (sin gastar nada) si no."""
+        self.refill(now)
+        # Un coste mayor que la ráfaga nunca cabría: se cobra la ráfaga entera
+        amount = min(amount, self.burst)
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+    def delay(self, amount, now):
+        """Segundos que faltan para poder gastar `amount` fichas."""
+        self.refill(now)
+        missing = min(amount, self.burst) - self.tokens
+        return max(missing / self.rate, 0.0)
+
+# Límites de un cliente: mensajes por segundo y bytes por segundo
+class Limits:
+    __slots__ = ('messages', 'bytes')
+
+    def __init__(self, messages_rate, messages_burst, bytes_rate, bytes_burst, now):
+        self.messages = TokenBucket(messages_rate, messages_burst, now) if messages_rate else None
+        self.bytes = TokenBucket(bytes_rate, bytes_burst, now) if bytes_rate else None
+
+    def admit(self, size, now):
+        """Admite un mensaje de `size` bytes si caben en ambos cubos (o en ninguno se gasta)."""
+        if self.messages is not None and self.messages.delay(1, now) > 0:
+            return False
+        if self.bytes is not None and not self.bytes.take(size, now):
+            return False
+        if self.messages is not None:
+            self.messages.take(1, now)
+        return True
+
+    def delay(self, size, now):
+        """Segundos hasta que se admita un mensaje de `size` bytes."""
+        return max(self.messages.delay(1, now) if self.messages is not None else 0.0,
+                   self.bytes.delay(size, now) if self.bytes is not None else 0.0)
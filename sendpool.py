@@ -0,0 +1,37 @@
+"""
+Envío en paralelo de lo encolado en una vuelta del bucle, para difusiones a
+salas muy grandes.
+
+flush_pending() reparte los clientes con datos pendientes entre N hilos por
+su descriptor (fd % N) y espera a que terminen todos antes de seguir: cada
+cliente está en un solo trozo por vuelta, y su búfer lo vacía un solo hilo,
+en orden, así que cada destinatario recibe sus mensajes en el mismo orden que
+sin hilos. sendmsg() suelta el GIL mientras el kernel copia los datos.
+
+Los hilos solo envían (Connection.send_pending); lo que toca el estado del
+servidor (límites del búfer, selector, métricas, desconexiones) lo hace
+después el hilo del bucle con los resultados.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+class SendPool:
+    def __init__(self, workers):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='send')
+
+    # Vaciar los búferes de `conns` en paralelo; devuelve [(conn, resultado de send_pending())]
+    def send(self, conns):
+        chunks = [[] for _ in range(self.workers)]
+        for conn in conns:
+            chunks[conn.sock.fileno() % self.workers].append(conn)
+        results = []
+        for chunk in self.executor.map(send_chunk, chunks):
+            results += chunk
+        return results
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+# Trabajo de un hilo: sus clientes uno tras otro
+def send_chunk(conns):
+    return [(conn, conn.send_pending()) for conn in conns]
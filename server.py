@@ -1,120 +1,1286 @@
+import argparse
+import errno
+import math
+import os
+import re
 import socket
-import select
+import selectors
+import signal
 import time
+import zlib
+from collections import deque
+from itertools import islice
+
+import handoff
+import jsonlog
+import msglog
+from client import BANNED_NICKS
+from history import HISTORY_BYTES, HISTORY_SIZE, Histories
+from metrics import DEFERRED, EVENTS, FLUSH, SELECT, TIMERS, ChatMetrics, Endpoint, parse_address
+from ratelimit import Limits
+from sendpool import SendPool
+from timerwheel import TimerWheel
+from jsonlog import DEBUG, INFO, WARNING, enabled, event
+from protocol import (CAPS, CHAT, MAX_FRAME_SIZE, NICK, PING, PONG, SYSTEM, ZLIB, ZLIB_LEVEL, FrameDecoder, ProtocolError,
+                      compressor, encode, header, is_framed, parse_nick)
 
 # Configurar las direcciones
 HOST = '127.0.0.1'  # localhost
 PORT = 55559 
 
-# Definir el tipo de conexión y protocolo
-server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-# Configurar el host y puerto para ser reutilizables
-server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-
-# Aplicar configuraciones al servidor e iniciarlo
-server.bind((HOST, PORT))
-server.listen(100)
-
-# Crear listas para clientes/nicknames
-clients = [server]
-nicknames = {}
-
-# Función para eliminar y desconectar clientes
-def remove(client):
-    if client in clients:
-        clients.remove(client)
-    if client in nicknames:
-        print(f"Cliente {nicknames[client]} ha desconectado")
-        del nicknames[client]
-    client.close()
-
-# Difundir mensajes a todos los clientes (anuncio)
-def broadcast(message, sender=None):
-    # Lista de clientes problemáticos
-    clients_to_remove = []
-    
-    for client in clients:
-        if client != sender and client != server:
-            
-            # Intentar enviar un mensaje
-            for attempt in range(3):
-                try:
-                    print(f"Intentando enviar mensaje: {message}")
-                    client.send(message)
+# Conexiones completadas que el kernel guarda hasta que el servidor las acepta
+# (Linux la recorta a net.core.somaxconn)
+BACKLOG = socket.SOMAXCONN
+
+# Crear el socket de escucha del servidor
+def create_server(host=HOST, port=PORT, backlog=BACKLOG, reuse_port=False):
+    # Definir el tipo de conexión y protocolo
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # Configurar el host y puerto para ser reutilizables
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    # Varios procesos pueden escuchar en el mismo puerto; el kernel reparte las conexiones
+    if reuse_port:
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+    # Aplicar configuraciones al servidor e iniciarlo
+    server.bind((host, port))
+    server.listen(backlog)
+    # accept() se repite hasta vaciar la cola: sin bloquear cuando ya no queda ninguna
+    server.setblocking(False)
+    return server
+
+# Límites del búfer de salida de cada cliente (bytes)
+HIGH_WATERMARK = 256 * 1024  # Por encima: se deja de leer al cliente y empieza la cuenta atrás
+LOW_WATERMARK = 64 * 1024  # Por debajo: el cliente vuelve a la normalidad
+MAX_BUFFER = 4 * 1024 * 1024  # Límite duro: se desconecta al instante
+SLOW_CONSUMER_TIMEOUT = 10  # Segundos por encima de HIGH_WATERMARK antes de desconectar
+
+# Bytes leídos por recv(): suficiente para sacar muchas tramas de una sola lectura
+RECV_SIZE = 64 * 1024
+
+# Máximo de buffers por llamada a sendmsg()
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+# Segundos que tiene un cliente para responder al 'NICK' antes de desconectarlo
+HANDSHAKE_TIMEOUT = 10
+
+# Latidos: a un cliente con tramas que lleva IDLE_TIMEOUT segundos sin enviar
+# nada se le manda PING; si en PING_TIMEOUT segundos no responde, se le
+# desconecta (IDLE_TIMEOUT = 0 los desactiva). Los clientes en texto plano no
+# entienden PING: para ellos se activa el keepalive de TCP con los mismos plazos.
+IDLE_TIMEOUT = 60
+PING_TIMEOUT = 20
+
+# Nivel de compresión para los clientes que piden 'zlib' en su NICK (0: no se ofrece)
+COMPRESSION_LEVEL = ZLIB_LEVEL
+
+# Límites por cliente (0: sin límite). Lo que entra por encima del límite se
+# aplaza (se deja de leer al cliente hasta que haya fichas), se descarta o
+# provoca la desconexión, según RATE_POLICY
+RATE_MESSAGES = 20  # Mensajes por segundo
+BURST_MESSAGES = 40
+RATE_BYTES = 64 * 1024  # Bytes por segundo
+BURST_BYTES = 256 * 1024
+DEFER, DROP, DISCONNECT = 'defer', 'drop', 'disconnect'
+RATE_POLICY = DEFER
+
+# Hilos para enviar lo encolado en cada vuelta (0: todo en el hilo del bucle) y
+# clientes con datos pendientes a partir de los cuales compensa repartirlos
+# (ver sendpool.py)
+SEND_WORKERS = 0
+POOL_MIN_CLIENTS = 512
+
+# Entregas (mensaje x destinatario) por vuelta del bucle: al agotarse, el resto
+# de clientes se lee en la vuelta siguiente, para que nadie acapare el bucle (0: sin límite)
+FANOUT_BUDGET = 200_000
+
+# Sala a la que entra todo cliente al registrarse
+DEFAULT_ROOM = 'general'
+
+# Nombres de sala válidos: letras, números, '_' y '-' (se guardan en minúsculas)
+ROOM_NAME = re.compile(r'^[\w-]{1,32}$')
+
+# Caracteres de un comando desconocido que se repiten en la respuesta
+MAX_COMMAND_ECHO = 32
+
+# Salas por página de /list (cada una ocupa como mucho unos 45 bytes, así que
+# una página cabe de sobra en una trama)
+LIST_PAGE_SIZE = 100
+
+# Longitud máxima de un nickname (en caracteres)
+MAX_NICK_LENGTH = 32
+
+# Conexiones aceptadas por cada aviso del socket de escucha: una ráfaga de
+# conexiones se vacía en pocas vueltas sin dejar a los clientes sin atender
+ACCEPT_BATCH = 64
+
+# Segundos sin vigilar el socket de escucha cuando el proceso o el sistema se
+# quedan sin descriptores (EMFILE/ENFILE): las conexiones esperan en la cola
+# del kernel en vez de despertar al bucle en cada vuelta
+ACCEPT_BACKOFF = 0.5
+
+# Límites de admisión (0: sin límite); lo que no cabe se rechaza al aceptarlo,
+# con un aviso en texto plano y sin saludo
+MAX_CONNECTIONS = 0  # Conexiones abiertas en total (también las que están en el saludo)
+MAX_PER_IP = 0  # Conexiones abiertas desde una misma dirección
+
+# Estados de una conexión
+AWAITING_NICK = 'AWAITING_NICK'  # Esperando el nickname
+CLAIMING = 'CLAIMING'  # Nickname enviado al bus del cluster, esperando confirmación
+REGISTERED = 'REGISTERED'  # En el chat (está en clients, nicknames y en alguna sala)
+
+# Estado de cada conexión con un cliente
+class Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.state = AWAITING_NICK
+        self.deadline = time.monotonic() + HANDSHAKE_TIMEOUT  # Límite para el saludo
+        self.last_seen = time.monotonic()  # Último instante en que se recibió algo
+        self.pinged_at = None  # Instante del PING aún sin respuesta
+        self.limits = None  # Cubos de fichas (ver ratelimit.py), al registrarse
+        self.deferred = deque()  # Mensajes aplazados por superar el límite
+        self.dropping = False  # Ya se avisó de que se descartan sus mensajes
+        self.outbuf = deque()  # memoryviews pendientes de enviar (compartidas entre clientes)
+        self.outlen = 0  # Bytes pendientes en outbuf
+        self.over_since = None  # Instante en que superó HIGH_WATERMARK
+        self.events = selectors.EVENT_READ  # Eventos registrados en el selector
+        self.framed = False  # True si el cliente habla el protocolo con tramas
+        self.decoder = None  # FrameDecoder de las conexiones con tramas
+        self.held = []  # Mensajes recibidos mientras el nickname se confirma
+        self.room = None  # Sala activa: a donde van sus mensajes de chat
+        self.compressor = None  # Flujo zlib de salida, si el cliente lo negoció
+        self.unsynced = False  # Hay datos en el compresor que aún no se han volcado
+        self.ip = None  # Dirección del cliente, para MAX_PER_IP (None: sin contar)
+
+    # Encolar buffers para enviar; solo se guardan referencias, nunca se copian
+    # (salvo con compresión: cada conexión comprime en su propio flujo)
+    def write(self, buffers):
+        if self.compressor is not None:
+            buffers = [self.compressor.compress(buffer) for buffer in buffers]
+            self.unsynced = True
+        for buffer in buffers:
+            if buffer:
+                self.outbuf.append(buffer)
+                self.outlen += len(buffer)
+
+    # Volcar el compresor para que el cliente pueda descomprimir todo lo enviado
+    def sync(self):
+        self.unsynced = False
+        data = self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.outbuf.append(memoryview(data))
+        self.outlen += len(data)
+
+    # Cerrar el flujo zlib (Z_FINISH) y empezar otro: lo ya comprimido queda
+    # completo en outbuf y el cliente pasa al flujo nuevo al ver el final del
+    # anterior (ver StreamDecoder). Así otro proceso puede seguir comprimiendo
+    # sin heredar el estado del compresor (ver handoff.py)
+    def restart_stream(self):
+        if self.compressor is not None:
+            data = self.compressor.flush(zlib.Z_FINISH)
+            self.outbuf.append(memoryview(data))
+            self.outlen += len(data)
+        self.compressor = compressor(COMPRESSION_LEVEL or ZLIB_LEVEL)
+        self.unsynced = False
+
+    # Enviar todo lo que el socket acepte sin bloquear: varios buffers por
+    # llamada con sendmsg(), sin concatenarlos. Solo toca esta conexión (se
+    # puede llamar desde los hilos de sendpool.py); devuelve (bytes enviados,
+    # True si el socket no lo admitió todo, error o None)
+    def send_pending(self):
+        # Un solo volcado del compresor por envío: las tramas de la vuelta van juntas
+        if self.unsynced:
+            self.sync()
+
+        outbuf = self.outbuf
+        total = 0
+        while outbuf:
+            buffers = list(islice(outbuf, IOV_MAX))
+            try:
+                sent = self.sock.sendmsg(buffers)
+            except (BlockingIOError, InterruptedError):
+                return total, True, None
+            except socket.error as error:
+                return total, False, error
+
+            self.outlen -= sent
+            total += sent
+            complete = sent == sum(map(len, buffers))
+
+            # Descartar lo enviado; un buffer enviado a medias se recorta sin copiarlo
+            while sent:
+                head = outbuf[0]
+                if len(head) <= sent:
+                    sent -= len(head)
+                    outbuf.popleft()
+                else:
+                    outbuf[0] = head[sent:]
+                    sent = 0
+
+            # El socket no admitió todo: esperar a que vuelva a ser escribible
+            if not complete:
+                return total, True, None
+
+        return total, False, None
+
+# Clave de un nickname en by_nick: 'Ana' y 'ana' son el mismo nickname
+def nick_key(nickname):
+    return nickname.lower()
+
+
+# Activar el keepalive de TCP (el kernel detecta al cliente caído sin ayuda del protocolo)
+def keepalive(client):
+    try:
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, IDLE_TIMEOUT)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(PING_TIMEOUT // 3, 1))
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+    except OSError:
+        pass  # No es un socket TCP (p. ej. un socketpair en las pruebas)
+
+# Servidor de chat: todo su estado vive en la instancia, así que en un mismo
+# proceso pueden convivir varios (p. ej. en las pruebas y los benchmarks) e
+# importar este módulo no abre ningún socket
+class ChatServer:
+    def __init__(self, host=HOST, port=PORT, backlog=BACKLOG, reuse_port=False, message_log=None, bus=None,
+                 metrics_address=None, send_workers=None):
+        self.host = host
+        self.port = port  # 0: el sistema elige un puerto libre (ver start())
+        self.backlog = backlog
+        self.reuse_port = reuse_port
+
+        # Métricas (ver metrics.py); se pueden consultar si hay metrics_address:
+        # (host, puerto) o la ruta de un socket Unix, atendido desde start()
+        self.metrics = ChatMetrics(self)
+        self.metrics_address = metrics_address
+        self.exporter = None
+
+        # Hilos de envío para las vueltas con muchos destinatarios (None: sin hilos)
+        workers = SEND_WORKERS if send_workers is None else send_workers
+        self.pool = SendPool(workers) if workers > 0 else None
+
+        # Socket de escucha (se crea en start())
+        self.listener = None
+
+        # Bus hacia los demás procesos cuando el servidor corre en modo cluster (ver cluster.py)
+        self.bus = bus
+
+        # Registro persistente de los mensajes difundidos (ver msglog.py); None lo desactiva
+        self.message_log = message_log
+        self.retain_at = time.monotonic() + msglog.RETAIN_INTERVAL  # Próxima retención (ver check_retention)
+
+        # Selector del sistema (epoll en Linux, kqueue en BSD/macOS): los sockets se
+        # registran una sola vez y select() solo devuelve los que están listos
+        self.selector = selectors.DefaultSelector()
+
+        # Clientes registrados y sus nicknames
+        self.clients = set()
+        self.nicknames = {}
+        self.by_nick = {}  # nickname en minúsculas -> socket (índice inverso de nicknames, ver nick_key)
+        self.connections = {}  # socket -> Connection (incluye las que aún esperan nickname)
+        self.per_ip = {}  # dirección -> conexiones abiertas desde ella (para MAX_PER_IP)
+
+        # Conexiones que todavía no han enviado su nickname
+        self.handshakes = set()
+
+        # Clientes por encima de HIGH_WATERMARK (candidatos a desconexión)
+        self.slow_consumers = set()
+
+        # Salas: miembros de cada sala y salas de cada cliente
+        self.rooms = {}  # nombre de sala -> set de sockets
+        self.memberships = {}  # socket -> set de nombres de sala
+
+        # Clientes con datos encolados en esta vuelta del bucle (se envían juntos al final)
+        self.pending = set()
+
+        # Clientes con mensajes aplazados por el límite de frecuencia
+        self.throttled = set()
+
+        # Entregas que quedan en esta vuelta del bucle (ver FANOUT_BUDGET)
+        self.budget = FANOUT_BUDGET or math.inf
+
+        # Plazos de cada conexión (saludo, inactividad, respuesta al PING): cada vuelta
+        # del bucle solo procesa los que vencen, sin recorrer todas las conexiones
+        self.timers = TimerWheel(now=time.monotonic())
+
+        # Instante (monotonic) en que se vuelve a vigilar el socket de escucha tras
+        # quedarse sin descriptores; None mientras se vigila (ver pause_accept)
+        self.accept_resume = None
+
+        # Últimos mensajes de cada sala, para ponerse al día al entrar (ver history.py)
+        self.histories = Histories(max_messages=HISTORY_SIZE, max_bytes=HISTORY_BYTES)
+
+        # stop() puede llamarse desde otro hilo: escribe en este par para despertar al selector
+        self.running = False
+        self.waker, self.wakeup = socket.socketpair()
+        self.waker.setblocking(False)
+        self.wakeup.setblocking(False)
+        self.selector.register(self.wakeup, selectors.EVENT_READ, self.on_wakeup)
+
+    # Crear el socket de escucha; devuelve la dirección real (con port=0, el puerto elegido)
+    def start(self):
+        if self.listener is None:
+            self.listener = create_server(self.host, self.port, self.backlog, self.reuse_port)
+            self.selector.register(self.listener, selectors.EVENT_READ)
+            self.host, self.port = self.listener.getsockname()[:2]
+            event(INFO, 'listen', host=self.host, port=self.port)
+        if self.metrics_address is not None and self.exporter is None:
+            self.exporter = Endpoint(self.selector, self.metrics, self.metrics_address)
+            event(INFO, 'metrics', address=self.exporter.listen())
+        return self.host, self.port
+
+    # Pedir que serve_forever() termine (desde cualquier hilo o manejador de señal)
+    def stop(self):
+        self.running = False
+        try:
+            self.waker.send(b'\0')
+        except OSError:
+            pass  # Ya hay un aviso pendiente, o el servidor ya se cerró
+
+    def on_wakeup(self):
+        try:
+            self.wakeup.recv(4096)
+        except OSError:
+            pass
+
+    # Soltar el socket de escucha y las conexiones sin desconectar a nadie: tras
+    # un traspaso (ver handoff.py) las atiende otro proceso con sus propias copias
+    def detach(self):
+        self.close_exporter()
+        for sock in list(self.connections) + [self.listener]:
+            if sock is not None:
+                if sock in self.selector.get_map():  # El de escucha no lo está durante una pausa
+                    self.selector.unregister(sock)
+                sock.close()
+        self.listener = None
+        self.accept_resume = None
+        self.connections.clear()
+        self.per_ip.clear()
+        self.clients.clear()
+        self.nicknames.clear()
+        self.by_nick.clear()
+        self.handshakes.clear()
+        self.slow_consumers.clear()
+        self.rooms.clear()
+        self.memberships.clear()
+        self.pending.clear()
+        self.throttled.clear()
+        self.timers = TimerWheel(now=time.monotonic())
+
+    # Desconectar a todos los clientes y liberar los sockets del servidor
+    def close(self):
+        for client in list(self.connections):
+            self.remove(client)
+        self.close_exporter()
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+        self.selector.close()
+        self.waker.close()
+        self.wakeup.close()
+
+    # Dejar de atender las consultas de métricas (libera su dirección para un proceso nuevo)
+    def close_exporter(self):
+        if self.exporter is not None:
+            self.exporter.close()
+            self.exporter = None
+
+    # Función para eliminar y desconectar clientes
+    def remove(self, client):
+        if client in self.clients:
+            self.clients.remove(client)
+        conn = self.connections.pop(client, None)
+        if conn is not None:
+            # Dejar de vigilar el socket antes de cerrarlo
+            try:
+                self.selector.unregister(client)
+            except (KeyError, ValueError):
+                pass
+            self.forget_ip(conn)
+        self.handshakes.discard(client)
+        self.slow_consumers.discard(client)
+        self.pending.discard(client)
+        self.throttled.discard(client)
+        self.timers.cancel(client)
+        # Salir solo de las salas del cliente: O(salas en las que está)
+        for room in self.memberships.pop(client, ()):
+            members = self.rooms[room]
+            members.discard(client)
+            if not members:
+                del self.rooms[room]
+        if client in self.nicknames:
+            nickname = self.nicknames.pop(client)
+            event(INFO, 'disconnect', nickname=nickname)
+            if self.by_nick.get(nick_key(nickname)) is client:
+                del self.by_nick[nick_key(nickname)]
+            # Liberar el nickname en el resto del cluster
+            if self.bus is not None:
+                self.bus.release(nickname)
+        client.close()
+
+    # Actualizar los eventos vigilados según el estado del búfer
+    def update_events(self, conn):
+        events = 0
+        # Mientras el cliente no vacía su búfer, o tiene mensajes aplazados, no se le lee (contrapresión)
+        if conn.over_since is None and not conn.deferred:
+            events |= selectors.EVENT_READ
+        if conn.outbuf:
+            events |= selectors.EVENT_WRITE
+
+        if events != conn.events:
+            conn.events = events
+            self.selector.modify(conn.sock, events)
+
+    # Enviar lo pendiente de una conexión y aplicar el resultado
+    def flush(self, conn):
+        return self.settle(conn, conn.send_pending())
+
+    # Aplicar el resultado de send_pending() en el hilo del bucle: métricas y
+    # límites del búfer; devuelve False si hay que desconectar al cliente
+    def settle(self, conn, result):
+        sent, retried, error = result
+        self.metrics.bytes_out.inc(sent)
+        if retried:
+            self.metrics.send_retries.inc()
+        if error is not None:
+            event(WARNING, 'send_error', nickname=self.nicknames.get(conn.sock), error=str(error))
+            return False
+        return self.check_watermarks(conn)
+
+    # Aplicar los límites del búfer; devuelve False si hay que desconectar al cliente
+    def check_watermarks(self, conn, now=None):
+        size = conn.outlen
+
+        if size > MAX_BUFFER:
+            event(WARNING, 'evict', nickname=self.nicknames.get(conn.sock), reason='max_buffer', buffered=size)
+            self.metrics.evictions['max_buffer'].inc()
+            return False
+
+        if size > HIGH_WATERMARK and conn.over_since is None:
+            conn.over_since = time.monotonic() if now is None else now
+            self.slow_consumers.add(conn.sock)
+        elif size <= LOW_WATERMARK and conn.over_since is not None:
+            conn.over_since = None
+            self.slow_consumers.discard(conn.sock)
+
+        if conn.over_since is not None:
+            now = time.monotonic() if now is None else now
+            if now - conn.over_since > SLOW_CONSUMER_TIMEOUT:
+                event(WARNING, 'evict', nickname=self.nicknames.get(conn.sock), reason='slow_consumer', buffered=size)
+                self.metrics.evictions['slow_consumer'].inc()
+                return False
+
+        self.update_events(conn)
+        return True
+
+    # Desconectar a los clientes que llevan demasiado tiempo sin vaciar su búfer
+    def check_slow_consumers(self):
+        now = time.monotonic()
+        clients_to_remove = [sock for sock in list(self.slow_consumers) if not self.check_watermarks(self.connections[sock], now)]
+        for client in clients_to_remove:
+            self.drop(client)
+
+    # Encolar buffers para un cliente; se envían en flush_pending()
+    def queue(self, conn, buffers):
+        conn.write(buffers)
+        self.pending.add(conn.sock)
+
+    # Enviar lo encolado en esta vuelta: una sola llamada a sendmsg() por cliente,
+    # con todas sus tramas pendientes juntas
+    def flush_pending(self):
+        while self.pending:
+            conns = [self.connections[sock] for sock in self.pending if sock in self.connections]
+            self.pending.clear()
+
+            # Muchos destinatarios: los envíos se reparten entre los hilos (ver sendpool.py)
+            if self.pool is not None and len(conns) >= POOL_MIN_CLIENTS:
+                results = self.pool.send(conns)
+            else:
+                results = ((conn, conn.send_pending()) for conn in conns)
+            clients_to_remove = [conn.sock for conn, result in results if not self.settle(conn, result)]
+
+            # Eliminar clientes problemáticos (su salida se encola de nuevo en pending)
+            for client in clients_to_remove:
+                self.drop(client)
+
+    # Desconectar un cliente problemático y anunciar su salida
+    def drop(self, client):
+        nickname = self.nicknames.get(client)
+        rooms = self.memberships.get(client, ())
+        self.remove(client)
+        if nickname is not None:
+            self.announce_leave(client, nickname, rooms)
+
+    # Anunciar la salida de un cliente solo en las salas en las que estaba:
+    # O(miembros de esas salas), también en el resto del cluster
+    def announce_leave(self, client, nickname, rooms):
+        message = f"{nickname} salió del chat.".encode('utf-8')
+        for room in list(rooms):
+            self.broadcast(message, client, SYSTEM, room)
+
+    # Difundir mensajes a todos los clientes (anuncio) o a los de una sala
+    def broadcast(self, message, sender=None, kind=None, room=None):
+        # Sin emisor es un aviso del servidor; con emisor, un mensaje de chat
+        if kind is None:
+            kind = SYSTEM if sender is None else CHAT
+
+        # Los mensajes de chat van a la sala activa del emisor
+        if room is None and kind == CHAT and sender in self.connections:
+            room = self.connections[sender].room
+
+        started = time.perf_counter()
+        self.fanout(message, sender, kind, room)
+        self.metrics.fanout_seconds.observe(time.perf_counter() - started)
+
+        # Solo se encola: la escritura a disco la hace el hilo del registro
+        if self.message_log is not None:
+            self.message_log.append(kind, message, room)
+
+        # En modo cluster, los demás procesos lo difunden a sus propios clientes
+        if self.bus is not None:
+            self.bus.publish(kind, message, room)
+
+    # Entregar un mensaje a los clientes de este proceso (room=None: a todos)
+    def fanout(self, message, sender, kind, room=None):
+        # Serializar una sola vez: la cabecera y el contenido son buffers
+        # compartidos por todos los destinatarios
+        payload = memoryview(message)
+        framed = (memoryview(header(kind, len(message))), payload)
+        raw = (payload,)
+
+        # Solo se recorren los miembros de la sala: O(tamaño de la sala)
+        recipients = self.clients if room is None else self.rooms.get(room, ())
+
+        self.budget -= len(recipients)
+
+        # Un solo evento por difusión (nunca por destinatario) y solo si está activo
+        if enabled(DEBUG):
+            event(DEBUG, 'fanout', room=room, kind=kind, size=len(message), recipients=len(recipients))
+
+        for client in recipients:
+            if client != sender:
+                # Encolar el mensaje; se envía al final de la vuelta del bucle
+                conn = self.connections[client]
+                self.queue(conn, framed if conn.framed else raw)
+        self.metrics.messages_out.inc(len(recipients) - (sender in recipients))
+
+        # Guardar los mensajes de sala (también los llegados por el bus del cluster)
+        if room is not None:
+            self.histories.record(room, kind, message)
+
+    # Enviar a un cliente los últimos mensajes de una sala, todos en una sola escritura
+    def replay(self, client, room):
+        conn = self.connections[client]
+        buffers = self.histories.buffers(room, conn.framed)
+        if buffers:
+            self.queue(conn, buffers)
+
+    # Enviar un mensaje a un solo cliente
+    def send_to(self, client, data, kind=CHAT):
+        conn = self.connections[client]
+        self.queue(conn, [memoryview(encode(kind, data) if conn.framed else data)])
+        self.metrics.messages_out.inc()
+
+    # Enviar un aviso del servidor a un solo cliente
+    def reply(self, client, text):
+        self.send_to(client, text.encode('utf-8'), SYSTEM)
+
+    # Mensaje privado: se busca al destinatario en by_nick y se le entrega solo a
+    # él, sin pasar por broadcast() (ni historial, ni registro, ni otras salas)
+    def direct(self, client, target, text):
+        if len(target) > MAX_NICK_LENGTH:
+            self.reply(client, f"No hay nadie conectado con ese nickname (tiene más de {MAX_NICK_LENGTH} caracteres).")
+            return
+        sender = self.nicknames[client]
+        data = f"[privado] {sender}: {text}".encode('utf-8')
+        # Con el prefijo tiene que seguir cabiendo en una trama
+        if len(data) > MAX_FRAME_SIZE:
+            self.reply(client, "El mensaje privado es demasiado largo.")
+            return
+        recipient = self.by_nick.get(nick_key(target))
+        if recipient is not None:
+            self.budget -= 1
+            self.send_to(recipient, data)
+        elif self.bus is not None:
+            # Puede estar en otro proceso: el supervisor sabe en cuál
+            self.bus.direct(sender, target, data)
+        else:
+            self.reply(client, f"No hay nadie conectado con el nickname '{target}'.")
+
+    # Entrar en una sala (pasa a ser la sala activa del cliente)
+    def join(self, client, room):
+        self.rooms.setdefault(room, set()).add(client)
+        self.memberships.setdefault(client, set()).add(room)
+        self.connections[client].room = room
+
+    # Salir de una sala; devuelve False si el cliente no estaba en ella
+    def part(self, client, room):
+        members = self.rooms.get(room)
+        if members is None or client not in members:
+            return False
+
+        members.discard(client)
+        if not members:
+            del self.rooms[room]
+        self.memberships[client].discard(room)
+
+        # Si era la sala activa, pasar a cualquier otra de sus salas
+        conn = self.connections[client]
+        if conn.room == room:
+            conn.room = next(iter(self.memberships[client]), None)
+        return True
+
+    # Ejecutar un comando de chat (/join, /part, /list, /msg)
+    def command(self, client, text):
+        name, _, argument = text[1:].partition(' ')
+        nickname = self.nicknames[client]
+
+        # /msg conserva el texto tal cual; el resto de comandos reciben un nombre de sala
+        if name == 'msg':
+            target, _, body = argument.strip().partition(' ')
+            if not target or not body.strip():
+                self.reply(client, "Uso: /msg <nickname> <mensaje>")
+            else:
+                self.direct(client, target, body.strip())
+            return
+
+        argument = argument.strip().lstrip('#').lower()
+        if name == 'join':
+            if not ROOM_NAME.match(argument):
+                self.reply(client, "Uso: /join <sala> (letras, números, '_' o '-').")
+            elif argument in self.memberships.get(client, ()):
+                self.connections[client].room = argument
+                self.reply(client, f"Ahora hablas en #{argument}.")
+            else:
+                self.join(client, argument)
+                self.replay(client, argument)
+                self.broadcast(f"{nickname} entró en #{argument}.".encode('utf-8'), client, SYSTEM, argument)
+                self.reply(client, f"Entraste en #{argument}.")
+
+        elif name == 'part':
+            room = argument or self.connections[client].room
+            if argument and not ROOM_NAME.match(argument):
+                self.reply(client, "Uso: /part [sala] (letras, números, '_' o '-').")
+            elif room is None or not self.part(client, room):
+                self.reply(client, f"No estás en #{room}.")
+            else:
+                self.broadcast(f"{nickname} salió de #{room}.".encode('utf-8'), client, SYSTEM, room)
+                self.reply(client, f"Saliste de #{room}.")
+
+        elif name == 'list':
+            # Por páginas: con miles de salas la respuesta no cabría en una trama
+            pages = max(math.ceil(len(self.rooms) / LIST_PAGE_SIZE), 1)
+            page = min(int(argument), pages) if argument.isdigit() and int(argument) > 0 else 1
+            start = (page - 1) * LIST_PAGE_SIZE
+            listing = ', '.join(f"#{room} ({len(self.rooms[room])})"
+                                for room in sorted(self.rooms)[start:start + LIST_PAGE_SIZE])
+            if pages == 1:
+                self.reply(client, f"Salas: {listing or 'ninguna'}")
+            elif page < pages:
+                self.reply(client, f"Salas (página {page} de {pages}): {listing}. Usa /list {page + 1} para ver más.")
+            else:
+                self.reply(client, f"Salas (página {page} de {pages}): {listing}")
+
+        else:
+            # Sin repetir entero lo que haya escrito: la respuesta debe caber en una trama
+            shown = name if len(name) <= MAX_COMMAND_ECHO else name[:MAX_COMMAND_ECHO] + '…'
+            self.reply(client, f"Comando desconocido: /{shown}")
+
+    # Procesar un mensaje de un cliente si su límite lo permite; devuelve False si hay que desconectarlo
+    def deliver(self, client, message):
+        self.metrics.messages_in.inc()
+        conn = self.connections.get(client)
+        if conn is None or conn.limits is None:
+            self.process(client, message)
+            return True
+
+        # Detrás de mensajes ya aplazados: respetar el orden
+        if conn.deferred:
+            conn.deferred.append(message)
+            return True
+
+        if conn.limits.admit(len(message), time.monotonic()):
+            conn.dropping = False
+            self.process(client, message)
+            return True
+
+        nickname = self.nicknames.get(client)
+        if RATE_POLICY == DEFER:
+            # Dejar de leerle hasta que pueda enviar de nuevo (release_deferred)
+            conn.deferred.append(message)
+            self.throttled.add(client)
+            self.update_events(conn)
+        elif RATE_POLICY == DROP:
+            if not conn.dropping:
+                conn.dropping = True
+                event(INFO, 'rate_limited', nickname=nickname, policy=RATE_POLICY)
+                self.reply(client, "Estás enviando demasiado rápido: tus mensajes se descartan.")
+        else:
+            event(INFO, 'rate_limited', nickname=nickname, policy=RATE_POLICY)
+            self.metrics.evictions['rate_limit'].inc()
+            self.notify(conn, "Desconectado por enviar demasiados mensajes.")
+            self.announce_leave(client, nickname, self.memberships.get(client, ()))
+            return False
+        return True
+
+    # Entregar los mensajes aplazados que ya caben en el límite; devuelve los
+    # segundos hasta el próximo que quede pendiente (None si no queda ninguno)
+    def release_deferred(self):
+        now = time.monotonic()
+        wait = None
+        for client in list(self.throttled):
+            conn = self.connections[client]
+            while conn.deferred and self.budget > 0 and conn.limits.admit(len(conn.deferred[0]), now):
+                if not self.process_deferred(client, conn.deferred.popleft()):
                     break
-                
-                except socket.error as error:
-                    print(f"Error enviando mensaje a un cliente: {error}\n        Reintentando: {attempt+1}...")
-                    time.sleep(1)  # Esperar antes de reintentar
-            
-            # Si después de 3 intentos aún no funciona
+
+            if client not in self.connections:
+                continue
+            if conn.deferred:
+                delay = conn.limits.delay(len(conn.deferred[0]), now)
+                wait = delay if wait is None else min(wait, delay)
             else:
-                clients_to_remove.append(client)
-    
-    # Eliminar clientes problemáticos
-    for client in clients_to_remove:
-        remove(client)
-        broadcast(f"{nicknames.get(client, 'Desconocido')} salió del chat.".encode('utf-8'))
-
-# Manejar recepción y transmisión de mensajes de un cliente
-def handle(client):
-    for attempt in range(3):
-        
+                # Todo entregado: volver a leerle
+                self.throttled.discard(client)
+                self.update_events(conn)
+        return wait
+
+    # Procesar un mensaje que ya no viene de handle() (aplazado por el límite o traído
+    # de otro proceso): un error solo desconecta a su cliente, como en handle().
+    # Devuelve False si se le desconectó
+    def process_deferred(self, client, message):
+        try:
+            self.process(client, message)
+            return True
+        except ProtocolError as error:
+            event(WARNING, 'protocol_error', nickname=self.nicknames.get(client), error=str(error))
+            self.remove(client)
+            return False
+
+    # Procesar un mensaje de un cliente: comando o mensaje de chat
+    def process(self, client, message):
+        if message.startswith(b'/'):
+            self.command(client, message.decode('utf-8', errors='replace').strip())
+            return
+
+        conn = self.connections.get(client)
+        if conn is not None and conn.room is None:
+            self.reply(client, "No estás en ninguna sala. Usa /join <sala>.")
+            return
+
+        if enabled(DEBUG):
+            event(DEBUG, 'message', nickname=self.nicknames.get(client), size=len(message))
+        self.broadcast(message, client)
+
+    # Difundir las tramas recibidas de un cliente con tramas
+    def dispatch(self, client, frames):
+        for kind, payload in frames:
+            if kind == CHAT:
+                if not self.deliver(client, payload):
+                    return False
+            elif kind == PING:
+                self.queue(self.connections[client], [memoryview(encode(PONG, payload))])
+            elif kind != PONG:
+                event(WARNING, 'protocol_error', nickname=self.nicknames.get(client), error=f"trama inesperada de tipo {kind}")
+                return False
+        return True
+
+    # Manejar recepción y transmisión de mensajes de un cliente
+    def handle(self, client):
         # Intentar recibir un mensaje
         try:
-            message = client.recv(1024)
+            message = client.recv(RECV_SIZE)
             if message:
-                print(f"mensaje recibido intentando difundir: {message}")
-                broadcast(message, client)
-                return True
-            
+                self.metrics.bytes_in.inc(len(message))
+                # Cualquier dato (mensaje, comando o PONG) demuestra que el cliente sigue ahí
+                conn = self.connections.get(client)
+                if conn is not None:
+                    conn.last_seen = time.monotonic()
+
+                # Cliente con tramas: difundir cada trama completa por separado
+                if conn is not None and conn.framed:
+                    return self.dispatch(client, conn.decoder.feed(message))
+
+                # Cliente antiguo (texto plano): difundir lo recibido tal cual
+                return self.deliver(client, message)
+
             else:
                 # Cliente salió limpiamente
-                broadcast(f"{nicknames.get(client, 'Desconocido')} salió del chat.".encode('utf-8'))
+                self.announce_leave(client, self.nicknames.get(client, 'Desconocido'), self.memberships.get(client, ()))
                 return False
-            
+
+        # Socket no bloqueante sin datos todavía
+        except (BlockingIOError, InterruptedError):
+            return True
+
         except socket.error as error:
-            print(f"Error recibiendo datos de un cliente: {error}\n        Reintentando: {attempt+1}...")
-            time.sleep(1)
-            
-    return False
-
-# Aceptar nuevas conexiones
-def accept(server):
-    client, address = server.accept()
-    print(f"Dirección {str(address)} conectada")
-
-    # Solicitar el nickname del cliente
-    client.send('NICK'.encode('utf-8'))
-    nickname = client.recv(1024).decode('utf-8')
-    nicknames[client] = nickname
-    clients.append(client)
-
-    # Anunciar la nueva conexión
-    print(f"El nickname del cliente es '{nickname}'.")
-    broadcast(f"{nickname} se unió al chat".encode('utf-8'), client)
+            event(WARNING, 'recv_error', nickname=self.nicknames.get(client), error=str(error))
 
-if __name__ == "__main__":
+        except ProtocolError as error:
+            event(WARNING, 'protocol_error', nickname=self.nicknames.get(client), error=str(error))
 
-    print(f"-> Servidor escuchando en {HOST}:{PORT}")
+        return False
 
+    # Comprobar un nickname; devuelve el motivo del rechazo o None si es válido
+    def check_nickname(self, nickname):
+        if nickname == "":
+            return "El nickname no puede estar vacío."
+        if len(nickname) > MAX_NICK_LENGTH:
+            return f"El nickname no puede tener más de {MAX_NICK_LENGTH} caracteres."
+        if nickname.lower() in BANNED_NICKS:
+            return f"El nickname '{nickname}' no está permitido."
+        if nick_key(nickname) in self.by_nick:
+            return f"El nickname '{nickname}' ya está en uso."
+        return None
 
-    while True:
-        
-        # Usar select para monitorear sockets
-        read_sockets, write_sockets, exception_sockets = select.select(clients, [], clients)  # lectura, escritura, excepciones (error)
+    # Registrar un cliente con nickname en el servidor
+    def register(self, client, nickname):
+        conn = self.connections.get(client)
+        if conn is None:
+            # Cliente creado fuera de accept()
+            conn = self.watch(client)
 
-        # Para cada socket listo para leer
-        for sock in read_sockets:
+        conn.state = REGISTERED
+        self.handshakes.discard(client)
+        self.nicknames[client] = nickname
+        self.by_nick[nick_key(nickname)] = client
+        self.clients.add(client)
+        self.join(client, DEFAULT_ROOM)
+        if RATE_MESSAGES or RATE_BYTES:
+            conn.limits = Limits(RATE_MESSAGES, BURST_MESSAGES, RATE_BYTES, BURST_BYTES, time.monotonic())
 
-            if sock == server:
-                accept(server)
-            
+        # Vigilar la inactividad: PING para los clientes con tramas, keepalive de TCP para el resto
+        self.timers.cancel(client)
+        if IDLE_TIMEOUT:
+            conn.last_seen = time.monotonic()
+            if conn.framed:
+                self.timers.schedule(client, conn.last_seen + IDLE_TIMEOUT)
             else:
-                # Intentar recibir/transmitir
-                if not handle(sock):
-                    remove(sock)
-        
-        # Para cada socket con errores
-        for sock in exception_sockets:
-            remove(sock)
\ No newline at end of file
+                keepalive(client)
+
+    # Sin descriptores libres la conexión sigue en la cola del kernel y el socket de
+    # escucha seguiría listo en cada vuelta (el selector avisa por nivel): el bucle
+    # giraría sin parar. Se deja de vigilar ACCEPT_BACKOFF segundos, con un solo
+    # aviso en el log por pausa
+    def pause_accept(self, listener, error):
+        event(WARNING, 'accept_paused', error=str(error), seconds=ACCEPT_BACKOFF)
+        if listener in self.selector.get_map():
+            self.selector.unregister(listener)
+        self.accept_resume = time.monotonic() + ACCEPT_BACKOFF
+
+    # Volver a vigilar el socket de escucha al acabar la pausa; devuelve los segundos
+    # que faltan para ello (None si no hay pausa)
+    def resume_accept(self, now):
+        if self.accept_resume is None:
+            return None
+        if now < self.accept_resume:
+            return self.accept_resume - now
+        self.accept_resume = None
+        if self.listener is not None and self.listener not in self.selector.get_map():
+            self.selector.register(self.listener, selectors.EVENT_READ)
+        return None
+
+    # Aceptar las conexiones que esperan en la cola del socket de escucha (no
+    # bloqueante), como mucho ACCEPT_BATCH por vuelta del bucle
+    def accept(self, listener):
+        for _ in range(ACCEPT_BATCH):
+            try:
+                client, address = listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return  # Cola vacía
+            except OSError as error:
+                if error.errno in (errno.EMFILE, errno.ENFILE):
+                    self.pause_accept(listener, error)
+                    return
+                # La conexión se cerró antes de aceptarla (ECONNABORTED...): la siguiente
+                event(WARNING, 'accept_error', error=str(error))
+                continue
+            event(INFO, 'connect', address=f"{address[0]}:{address[1]}")
+            self.metrics.accepted.inc()
+
+            refusal = self.admission(address[0])
+            if refusal is not None:
+                self.refuse(client, address[0], refusal)
+                continue
+
+            # La conexión queda esperando su nickname sin bloquear el bucle
+            conn = self.watch(client, address[0])
+            self.handshakes.add(client)
+            self.timers.schedule(client, conn.deadline)
+
+            # Solicitar el nickname del cliente
+            conn.write([memoryview('NICK'.encode('utf-8'))])
+            if not self.flush(conn):
+                self.remove(client)
+
+    # Motivo por el que no se admite una conexión desde `ip`, o None si cabe
+    def admission(self, ip):
+        if MAX_CONNECTIONS and len(self.connections) >= MAX_CONNECTIONS:
+            return "Servidor lleno; inténtalo más tarde."
+        if MAX_PER_IP and self.per_ip.get(ip, 0) >= MAX_PER_IP:
+            return "Demasiadas conexiones desde tu dirección; inténtalo más tarde."
+        return None
+
+    # Rechazar una conexión recién aceptada: sin Connection ni selector, un solo
+    # send() sin bloquear (si no cabe, el cliente solo ve el cierre) y close()
+    def refuse(self, client, ip, reason):
+        event(INFO, 'refuse', address=ip, reason=reason)
+        self.metrics.refused.inc()
+        try:
+            client.setblocking(False)
+            client.send(reason.encode('utf-8'))
+        except OSError:
+            pass
+        client.close()
+
+    # Empezar a vigilar el socket de un cliente (pasa a no bloqueante); con `ip`
+    # cuenta para MAX_PER_IP
+    def watch(self, client, ip=None):
+        client.setblocking(False)
+        conn = self.connections[client] = Connection(client)
+        self.selector.register(client, selectors.EVENT_READ)
+        if ip is not None:
+            conn.ip = ip
+            self.per_ip[ip] = self.per_ip.get(ip, 0) + 1
+        return conn
+
+    # Descontar una conexión que se cierra de las de su dirección
+    def forget_ip(self, conn):
+        if conn.ip is None:
+            return
+        remaining = self.per_ip[conn.ip] - 1
+        if remaining:
+            self.per_ip[conn.ip] = remaining
+        else:
+            del self.per_ip[conn.ip]
+
+    # Rechazar una conexión durante el saludo enviándole el motivo
+    def reject(self, conn, reason):
+        event(INFO, 'reject', reason=reason)
+        self.metrics.rejected.inc()
+        return self.notify(conn, reason)
+
+    # Enviar un último aviso antes de desconectar (sin pasar por la cola de la vuelta)
+    def notify(self, conn, text):
+        data = text.encode('utf-8')
+        conn.write([memoryview(encode(SYSTEM, data) if conn.framed else data)])
+        self.flush(conn)
+        return False
+
+    # Recibir el nickname de una conexión en AWAITING_NICK
+    def handshake(self, client):
+        try:
+            data = client.recv(RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except socket.error as error:
+            event(WARNING, 'recv_error', error=str(error))
+            return False
+
+        # El cliente se fue sin enviar su nickname
+        if not data:
+            return False
+        self.metrics.bytes_in.inc(len(data))
+
+        conn = self.connections[client]
+
+        # Nickname en confirmación por el cluster: guardar lo que llegue mientras tanto
+        if conn.state == CLAIMING:
+            try:
+                conn.held += conn.decoder.feed(data) if conn.framed else [(CHAT, data)]
+            except ProtocolError as error:
+                event(WARNING, 'protocol_error', error=str(error))
+                return False
+            return True
+
+        # Los primeros bytes deciden el protocolo: tramas o texto plano
+        if conn.decoder is None and is_framed(data):
+            conn.framed = True
+            conn.decoder = FrameDecoder()
+
+        rest = []
+        if conn.framed:
+            try:
+                frames = conn.decoder.feed(data)
+            except ProtocolError as error:
+                return self.reject(conn, str(error))
+            if not frames:
+                return True  # Trama NICK incompleta: esperar más datos
+
+            # La primera trama debe ser el nickname; el resto son mensajes que
+            # el cliente envió a continuación
+            (kind, payload), rest = frames[0], frames[1:]
+            if kind != NICK:
+                return self.reject(conn, "Se esperaba el nickname.")
+            nickname, capabilities = parse_nick(payload)
+
+            # Compresión negociada: CAPS viaja sin comprimir y todo lo demás, ya comprimido
+            if ZLIB in capabilities and COMPRESSION_LEVEL:
+                conn.write([memoryview(encode(CAPS, ZLIB))])
+                conn.compressor = compressor(COMPRESSION_LEVEL)
+        else:
+            nickname = data.decode('utf-8', errors='replace').strip()
+
+        reason = self.check_nickname(nickname)
+        if reason is not None:
+            return self.reject(conn, reason)
+
+        # En modo cluster el nickname debe ser único entre todos los procesos:
+        # se pide al bus y el saludo termina cuando llegue la respuesta
+        if self.bus is not None:
+            conn.state = CLAIMING
+            conn.held = rest
+            self.bus.claim(client, nickname)
+            return True
+
+        return self.complete_handshake(client, nickname, rest)
+
+    # Terminar el saludo: registrar al cliente, anunciarlo y difundir lo que ya envió
+    def complete_handshake(self, client, nickname, rest):
+        self.register(client, nickname)
+        self.replay(client, DEFAULT_ROOM)
+
+        # Anunciar la nueva conexión
+        event(INFO, 'join', nickname=nickname)
+        self.broadcast(f"{nickname} se unió al chat".encode('utf-8'), client, SYSTEM, DEFAULT_ROOM)
+        return self.dispatch(client, rest)
+
+    # Cada RETAIN_INTERVAL segundos, pedir al hilo escritor del registro que borre los
+    # segmentos caducados (el bucle solo encola la petición, nunca toca el disco)
+    def check_retention(self, now):
+        if self.message_log is None or now < self.retain_at:
+            return
+        self.retain_at = now + msglog.RETAIN_INTERVAL
+        self.message_log.expire()
+
+    # Atender los plazos vencidos: saludos caducados, clientes inactivos y PING sin respuesta
+    def check_timers(self):
+        now = time.monotonic()
+        for client in self.timers.advance(now):
+            conn = self.connections.get(client)
+            if conn is None:
+                continue
+
+            # No envió su nickname a tiempo
+            if conn.state != REGISTERED:
+                event(INFO, 'handshake_timeout')
+                self.remove(client)
+
+            # Respondió (o envió algo) desde el PING: vuelve a contar la inactividad
+            elif conn.pinged_at is not None and conn.last_seen >= conn.pinged_at:
+                conn.pinged_at = None
+                self.timers.schedule(client, conn.last_seen + IDLE_TIMEOUT)
+
+            # PING sin respuesta: conexión muerta o medio abierta
+            elif conn.pinged_at is not None:
+                event(INFO, 'idle_timeout', nickname=self.nicknames.get(client), idle=round(now - conn.last_seen, 1))
+                self.metrics.evictions['idle_timeout'].inc()
+                self.drop(client)
+
+            # Hubo actividad desde que se programó: aplazar sin enviar nada
+            elif now - conn.last_seen < IDLE_TIMEOUT:
+                self.timers.schedule(client, conn.last_seen + IDLE_TIMEOUT)
+
+            else:
+                conn.pinged_at = now
+                self.queue(conn, [memoryview(encode(PING, b''))])
+                self.timers.schedule(client, now + PING_TIMEOUT)
+
+    # Bucle principal de eventos: atiende hasta que se llame a stop() y después lo cierra todo
+    def serve_forever(self):
+        self.start()
+        self.running = True
+        wait = None  # Segundos hasta poder entregar el próximo mensaje aplazado
+        resume = None  # Segundos hasta volver a aceptar conexiones (ver pause_accept)
+        metrics = self.metrics
+
+        try:
+            while self.running:
+                self.budget = FANOUT_BUDGET or math.inf
+                mark = time.perf_counter()
+
+                # Esperar solo por los sockets listos (sin recorrer todos los clientes),
+                # despertando a tiempo si hay mensajes aplazados o una pausa que termina
+                ready = self.selector.select(timeout=min(delay for delay in (wait, resume, 1) if delay is not None))
+                mark = metrics.lap(SELECT, mark)
+
+                for key, mask in ready:
+                    sock = key.fileobj
+
+                    if sock == self.listener:
+                        self.accept(self.listener)
+                        continue
+
+                    # Otros sockets vigilados (p. ej. el bus del cluster) traen su manejador
+                    if key.data is not None:
+                        key.data()
+                        continue
+
+                    # El socket pudo cerrarse durante esta misma vuelta (p. ej. en broadcast)
+                    if sock.fileno() == -1:
+                        continue
+
+                    # Vaciar el búfer de salida si el socket vuelve a ser escribible
+                    if mask & selectors.EVENT_WRITE and not self.flush(self.connections[sock]):
+                        self.drop(sock)
+                        continue
+
+                    if not mask & selectors.EVENT_READ:
+                        continue
+
+                    # Conexión aún sin nickname: avanzar el saludo
+                    if self.connections[sock].state != REGISTERED:
+                        if not self.handshake(sock):
+                            self.remove(sock)
+
+                    # Presupuesto de difusión agotado: el socket sigue listo y se lee en la vuelta siguiente
+                    elif self.budget <= 0:
+                        continue
+
+                    # Intentar recibir/transmitir
+                    elif not self.handle(sock):
+                        self.remove(sock)
+
+                mark = metrics.lap(EVENTS, mark)
+
+                wait = self.release_deferred()
+                mark = metrics.lap(DEFERRED, mark)
+                self.flush_pending()
+                mark = metrics.lap(FLUSH, mark)
+                self.check_slow_consumers()
+                self.check_timers()
+                now = time.monotonic()
+                self.check_retention(now)
+                resume = self.resume_accept(now)
+                metrics.lap(TIMERS, mark)
+        finally:
+            self.close()
+
+# Opciones de línea de comandos del servidor (comunes a server.py y cluster.py)
+def add_arguments(parser):
+    parser.add_argument('--history', type=int, default=HISTORY_SIZE,
+                        help="Mensajes de cada sala que se envían al entrar (0 lo desactiva)")
+    parser.add_argument('--history-bytes', type=int, default=HISTORY_BYTES,
+                        help="Bytes máximos del historial de cada sala")
+    parser.add_argument('--idle-timeout', type=int, default=IDLE_TIMEOUT,
+                        help="Segundos sin actividad antes de enviar PING (0: sin latidos)")
+    parser.add_argument('--ping-timeout', type=int, default=PING_TIMEOUT,
+                        help="Segundos para responder al PING antes de desconectar")
+    parser.add_argument('--handshake-timeout', type=int, default=HANDSHAKE_TIMEOUT)
+    parser.add_argument('--rate-messages', type=float, default=RATE_MESSAGES,
+                        help="Mensajes por segundo por cliente (0: sin límite); ráfaga del doble")
+    parser.add_argument('--rate-bytes', type=int, default=RATE_BYTES,
+                        help="Bytes por segundo por cliente (0: sin límite); ráfaga del cuádruple")
+    parser.add_argument('--rate-policy', default=RATE_POLICY, choices=[DEFER, DROP, DISCONNECT],
+                        help="Qué hacer con lo que supera el límite")
+    parser.add_argument('--high-watermark', type=int, default=HIGH_WATERMARK,
+                        help="Bytes pendientes de enviar a partir de los cuales se deja de leer al cliente")
+    parser.add_argument('--low-watermark', type=int, default=LOW_WATERMARK,
+                        help="Bytes pendientes por debajo de los cuales el cliente vuelve a la normalidad")
+    parser.add_argument('--max-buffer', type=int, default=MAX_BUFFER,
+                        help="Bytes pendientes a partir de los cuales se desconecta al cliente al instante")
+    parser.add_argument('--slow-consumer-timeout', type=float, default=SLOW_CONSUMER_TIMEOUT,
+                        help="Segundos por encima de --high-watermark antes de desconectar al cliente")
+    parser.add_argument('--send-workers', type=int, default=SEND_WORKERS,
+                        help="Hilos que envían en paralelo las difusiones a muchos clientes (0: sin hilos)")
+    parser.add_argument('--fanout-budget', type=int, default=FANOUT_BUDGET,
+                        help="Entregas por vuelta del bucle antes de dejar lecturas para la siguiente (0: sin límite)")
+    parser.add_argument('--compression-level', type=int, default=COMPRESSION_LEVEL, choices=range(10),
+                        help="Nivel zlib para los clientes que lo piden (0: no se ofrece compresión)")
+    parser.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS,
+                        help="Conexiones abiertas como máximo; las demás se rechazan al aceptarlas (0: sin límite)")
+    parser.add_argument('--max-per-ip', type=int, default=MAX_PER_IP,
+                        help="Conexiones abiertas como máximo desde una misma dirección (0: sin límite)")
+    parser.add_argument('--accept-batch', type=int, default=ACCEPT_BATCH,
+                        help="Conexiones aceptadas como máximo por vuelta del bucle")
+
+# Aplicar las opciones de add_arguments()
+def configure_from_args(args):
+    global HISTORY_SIZE, HISTORY_BYTES, COMPRESSION_LEVEL, RATE_MESSAGES, BURST_MESSAGES, RATE_BYTES, BURST_BYTES
+    global RATE_POLICY, FANOUT_BUDGET, IDLE_TIMEOUT, PING_TIMEOUT, HANDSHAKE_TIMEOUT
+    global MAX_CONNECTIONS, MAX_PER_IP, ACCEPT_BATCH, SEND_WORKERS
+    global HIGH_WATERMARK, LOW_WATERMARK, MAX_BUFFER, SLOW_CONSUMER_TIMEOUT
+    if not 0 <= args.low_watermark <= args.high_watermark <= args.max_buffer:
+        raise SystemExit("Se necesita 0 <= --low-watermark <= --high-watermark <= --max-buffer")
+    HISTORY_SIZE, HISTORY_BYTES = args.history, args.history_bytes
+    COMPRESSION_LEVEL = args.compression_level
+    RATE_MESSAGES, BURST_MESSAGES = args.rate_messages, args.rate_messages * 2
+    RATE_BYTES, BURST_BYTES = args.rate_bytes, args.rate_bytes * 4
+    RATE_POLICY, FANOUT_BUDGET, SEND_WORKERS = args.rate_policy, args.fanout_budget, args.send_workers
+    IDLE_TIMEOUT, PING_TIMEOUT, HANDSHAKE_TIMEOUT = args.idle_timeout, args.ping_timeout, args.handshake_timeout
+    MAX_CONNECTIONS, MAX_PER_IP, ACCEPT_BATCH = args.max_connections, args.max_per_ip, max(args.accept_batch, 1)
+    HIGH_WATERMARK, LOW_WATERMARK, MAX_BUFFER = args.high_watermark, args.low_watermark, args.max_buffer
+    SLOW_CONSUMER_TIMEOUT = args.slow_consumer_timeout
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de chat")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--backlog', type=int, default=BACKLOG,
+                        help="Conexiones pendientes de aceptar que guarda el kernel")
+    parser.add_argument('--metrics', type=parse_address, default=None,
+                        help="Dónde atender las consultas de métricas de Prometheus: 'host:puerto' o ruta de un socket Unix")
+    add_arguments(parser)
+    parser.add_argument('--store', default=None, help="Directorio del registro persistente de mensajes")
+    parser.add_argument('--store-segment-bytes', type=int, default=msglog.SEGMENT_BYTES)
+    parser.add_argument('--store-retention-bytes', type=int, default=None,
+                        help="Tamaño máximo del registro en disco (por defecto, sin límite)")
+    parser.add_argument('--store-retention-seconds', type=float, default=None,
+                        help="Antigüedad máxima de los mensajes guardados (por defecto, sin límite)")
+    parser.add_argument('--store-fsync', type=float, default=0.0,
+                        help="Segundos entre fsync (0: uno por lote escrito; -1: nunca)")
+    parser.add_argument('--store-replay', type=int, default=1000,
+                        help="Mensajes del registro con los que rellenar el historial al arrancar")
+    parser.add_argument('--handoff', default=None,
+                        help="Socket Unix en el que atender los reinicios sin cortes (ver handoff.py)")
+    parser.add_argument('--takeover', action='store_true',
+                        help="Arrancar quedándose con los clientes del proceso que escucha en --handoff")
+    jsonlog.add_arguments(parser)
+    args = parser.parse_args()
+    if args.takeover and not args.handoff:
+        parser.error("--takeover necesita --handoff")
+    jsonlog.configure_from_args(args)
+    configure_from_args(args)
+
+    chat = ChatServer(args.host, args.port, args.backlog, metrics_address=args.metrics)
+
+    # Versión nueva: quedarse con los clientes del proceso que escucha en --handoff
+    if args.takeover:
+        handoff.take(chat, args.handoff)
+
+    message_log = None
+    if args.store:
+        message_log = msglog.MessageLog(args.store, args.store_segment_bytes, args.store_retention_bytes,
+                                        args.store_retention_seconds,
+                                        args.store_fsync if args.store_fsync >= 0 else None)
+        # Recuperar el historial reciente de las salas tras un reinicio (tras un
+        # traspaso, el historial ya llegó del proceso anterior)
+        if not args.takeover:
+            for _, _, kind, room, message in message_log.last(args.store_replay):
+                if room is not None:
+                    chat.histories.record(room, kind, message)
+        chat.message_log = message_log.start()
+        event(INFO, 'store', directory=args.store, next_sequence=message_log.next_sequence)
+
+    upgrades = None
+    if args.handoff:
+        upgrades = handoff.Handoff(chat, args.handoff)
+        upgrades.listen()
+
+    # SIGTERM termina el bucle limpiamente (cierra las conexiones y vacía el registro)
+    signal.signal(signal.SIGTERM, lambda signum, frame: chat.stop())
+
+    try:
+        chat.serve_forever()
+    finally:
+        if upgrades is not None:
+            upgrades.close()
+        # Escribir lo que quede en la cola del registro antes de salir
+        if message_log is not None:
+            message_log.stop()
@@ -0,0 +1,120 @@
+import os
+import resource
+import select
+import selectors
+import socket
+from unittest.mock import patch
+import pytest
+import server
+
+@pytest.fixture
+def queue_of(chat_server):
+    """
+    Socket de escucha no bloqueante y una función que deja `count` conexiones
+    esperando en su cola sin aceptarlas. Devuelve (socket de escucha, conectar).
+    """
+    sock = server.create_server('127.0.0.1', 0)
+    peers = []
+
+    def connect(count):
+        new = [socket.create_connection(sock.getsockname()) for _ in range(count)]
+        peers.extend(new)
+        select.select([sock], [], [], 1)
+        return new
+
+    yield sock, connect
+
+    for peer in peers:
+        peer.close()
+    sock.close()
+
+def receive_refusal(peer):
+    """Lee el aviso de rechazo hasta que el servidor cierra la conexión."""
+    peer.settimeout(1)
+    data = b''
+    while chunk := peer.recv(1024):
+        data += chunk
+    return data.decode('utf-8')
+
+# Prueba 1: cada aviso del socket de escucha acepta como mucho ACCEPT_BATCH conexiones
+@patch('server.ACCEPT_BATCH', 3)
+def test_accept_drains_in_batches(chat_server, queue_of):
+    sock, connect = queue_of
+    connect(5)
+
+    chat_server.accept(sock)
+    assert len(chat_server.connections) == 3
+    chat_server.accept(sock)
+    assert len(chat_server.connections) == 5
+    assert len(chat_server.handshakes) == 5
+
+    # Con la cola vacía vuelve sin bloquear
+    chat_server.accept(sock)
+    assert len(chat_server.connections) == 5
+
+# Prueba 2: con el servidor lleno la conexión se rechaza al aceptarla, sin saludo
+@patch('server.MAX_CONNECTIONS', 2)
+def test_server_full(chat_server, queue_of):
+    sock, connect = queue_of
+    first, _, third = connect(3)
+
+    chat_server.accept(sock)
+    assert len(chat_server.connections) == 2
+    assert receive_refusal(third) == "Servidor lleno; inténtalo más tarde."
+
+    # Al irse alguien vuelve a haber sitio
+    (accepted,) = [client for client in chat_server.connections
+                   if client.getpeername() == first.getsockname()]
+    chat_server.remove(accepted)
+    connect(1)
+    chat_server.accept(sock)
+    assert len(chat_server.connections) == 2
+
+# Prueba 3: el límite por dirección cuenta las conexiones abiertas y se libera al cerrarlas
+@patch('server.MAX_PER_IP', 2)
+def test_per_ip_limit(chat_server, queue_of):
+    sock, connect = queue_of
+    _, _, third = connect(3)
+
+    chat_server.accept(sock)
+    assert chat_server.per_ip == {'127.0.0.1': 2}
+    assert "Demasiadas conexiones" in receive_refusal(third)
+
+    for client in list(chat_server.connections):
+        chat_server.remove(client)
+    assert chat_server.per_ip == {}
+
+    connect(1)
+    chat_server.accept(sock)
+    assert chat_server.per_ip == {'127.0.0.1': 1}
+
+# Prueba 4: sin descriptores libres (EMFILE) el socket de escucha deja de vigilarse
+# un rato, en vez de despertar al bucle en cada vuelta, y luego se acepta la conexión
+def test_accept_backs_off_without_fds(chat_server, queue_of):
+    sock, connect = queue_of
+    chat_server.listener = sock
+    chat_server.selector.register(sock, selectors.EVENT_READ)
+    connect(1)
+
+    # El límite blando justo por debajo del primer descriptor libre: accept() da EMFILE
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    probe = os.dup(0)
+    os.close(probe)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (probe, hard))
+    try:
+        chat_server.accept(sock)
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    assert chat_server.connections == {}
+    assert sock not in chat_server.selector.get_map()
+
+    # Hasta que acaba la pausa no se vuelve a vigilar
+    paused = chat_server.accept_resume
+    assert 0 < chat_server.resume_accept(paused - server.ACCEPT_BACKOFF / 2) <= server.ACCEPT_BACKOFF
+    assert sock not in chat_server.selector.get_map()
+    assert chat_server.resume_accept(paused) is None
+    assert sock in chat_server.selector.get_map()
+
+    # La conexión seguía en la cola del kernel
+    chat_server.accept(sock)
+    assert len(chat_server.handshakes) == 1
@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+import async_server
+
+async def connect(port, nickname):
+    """Conecta un cliente al servidor asyncio y completa el saludo NICK."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    assert await reader.read(1024) == b'NICK'  # El servidor pide el nickname
+    writer.write(nickname.encode('utf-8'))
+    await writer.drain()
+    return reader, writer
+
+async def wait_for_clients(count):
+    """Espera a que el servidor haya registrado `count` clientes."""
+    for _ in range(100):
+        if len(async_server.clients) == count:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Se esperaban {count} clientes, hay {len(async_server.clients)}")
+
+async def read_until(reader, text):
+    """Lee del socket hasta encontrar `text` (o agota el tiempo)."""
+    received = b''
+    while text.encode('utf-8') not in received:
+        received += await asyncio.wait_for(reader.read(1024), 2)
+    return received.decode('utf-8')
+
+@pytest.fixture
+def run():
+    """Ejecuta una corrutina de prueba con un servidor asyncio en un puerto libre."""
+    def runner(test):
+        async def main():
+            async_server.clients.clear()
+            server = await async_server.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                await test(port)
+            finally:
+                server.close()
+                for client in list(async_server.clients):
+                    async_server.remove(client)
+        asyncio.run(main())
+    return runner
+
+# Prueba 1: un mensaje llega a los demás clientes pero no al emisor
+def test_async_broadcast(run):
+    async def test(port):
+        reader0, writer0 = await connect(port, "Client0")
+        await wait_for_clients(1)
+        reader1, writer1 = await connect(port, "Client1")
+        await wait_for_clients(2)
+
+        assert "Client1 se unió al chat" in await read_until(reader0, "se unió")
+
+        writer1.write(b'Hola desde Client1')
+        await writer1.drain()
+        assert "Hola desde Client1" in await read_until(reader0, "Hola desde Client1")
+
+        writer0.close()
+        writer1.close()
+    run(test)
+
+# Prueba 2: un cliente que no lee se desconecta sin frenar a los demás
+def test_async_slow_consumer(run, monkeypatch):
+    monkeypatch.setattr(async_server, 'QUEUE_SIZE', 4)
+
+    async def test(port):
+        slow_reader, slow_writer = await connect(port, "Lento")
+        await wait_for_clients(1)
+        reader, writer = await connect(port, "Rapido")
+        await wait_for_clients(2)
+        slow = next(client for client in async_server.clients if client.nickname == "Lento")
+
+        # Llenar la cola del cliente lento sin darle tiempo a vaciarse
+        slow.writer_task.cancel()
+        for i in range(10):
+            async_server.broadcast(f"mensaje {i}".encode('utf-8'))
+            await asyncio.sleep(0.01)  # El cliente rápido sí vacía su cola
+
+        assert slow not in async_server.clients
+        assert "mensaje 9" in await read_until(reader, "mensaje 9")
+
+        slow_writer.close()
+        writer.close()
+    run(test)
@@ -0,0 +1,128 @@
+import io
+import socket
+import threading
+from unittest.mock import patch
+import client
+from client import ChatClient, backoff
+from protocol import CHAT, SYSTEM, FrameDecoder, encode, parse_nick
+
+# Socket de escucha que hace de servidor en la prueba
+def fake_server():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen()
+    sock.settimeout(5)
+    return sock
+
+def greet(listener):
+    """Acepta una conexión, pide el nickname y devuelve (socket, nickname, tramas recibidas tras él)."""
+    conn, _ = listener.accept()
+    conn.settimeout(5)
+    conn.sendall(b'NICK')
+    decoder = FrameDecoder()
+    frames = []
+    while not frames:
+        frames = decoder.feed(conn.recv(65536))
+    nickname, _ = parse_nick(frames[0][1])
+    return conn, nickname, decoder, frames[1:]
+
+def start(chat_client):
+    thread = threading.Thread(target=chat_client.run, daemon=True)
+    thread.start()
+    return thread
+
+# Prueba 1: la espera de reconexión crece exponencialmente, con jitter y con tope
+def test_backoff_is_jittered_and_capped():
+    for attempt in range(12):
+        delays = [backoff(attempt) for _ in range(50)]
+        limit = min(client.RECONNECT_MAX, client.RECONNECT_MIN * 2 ** attempt)
+        assert all(0 <= delay <= limit for delay in delays)
+        assert len(set(delays)) > 1  # Cada cliente espera un tiempo distinto
+
+# Prueba 2: modo masivo - se envían todas las líneas de un archivo y el cliente cierra al terminar
+def test_bulk_mode_sends_every_line(tmp_path):
+    path = tmp_path / 'mensajes.txt'
+    path.write_text(''.join(f"linea {number}\n" for number in range(5000)), encoding='utf-8')
+    listener = fake_server()
+
+    with open(path, 'rb') as source:
+        thread = start(ChatClient("Bot", *listener.getsockname(), source=source, output=None, capabilities=()))
+        conn, nickname, decoder, frames = greet(listener)
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                break  # El cliente cerró su mitad tras enviarlo todo
+            frames += decoder.feed(data)
+        conn.close()
+        thread.join(5)
+
+    assert nickname == "Bot"
+    assert not thread.is_alive()
+    assert frames == [(CHAT, f"Bot: linea {number}".encode('utf-8')) for number in range(5000)]
+    listener.close()
+
+# Prueba 3: si el servidor se cae, el cliente se reconecta y envía lo que tenía pendiente
+@patch('client.RECONNECT_MIN', 0.01)
+def test_reconnects_after_server_restart():
+    listener = fake_server()
+    read_end, write_end = socket.socketpair()
+    output = io.StringIO()
+    thread = start(ChatClient("Ana", *listener.getsockname(), source=read_end.makefile('rb'),
+                              output=output, capabilities=()))
+
+    conn, _, _, _ = greet(listener)
+    conn.close()  # El servidor se cae sin avisar
+
+    write_end.sendall(b'sigo aqui\n')
+    conn, nickname, decoder, frames = greet(listener)
+    while not frames:
+        frames = decoder.feed(conn.recv(65536))
+    assert (nickname, frames) == ("Ana", [(CHAT, b'Ana: sigo aqui')])
+    assert "Reintentando" in output.getvalue()
+
+    write_end.close()  # Fin de la entrada: el cliente termina
+    assert conn.recv(65536) == b''
+    conn.close()
+    thread.join(5)
+    assert not thread.is_alive()
+    read_end.close()
+    listener.close()
+
+# Prueba 4: un rechazo del servidor (aviso y cierre tras el nickname) no provoca reconexiones
+def test_rejection_stops_client():
+    listener = fake_server()
+    read_end, write_end = socket.socketpair()
+    output = io.StringIO()
+    thread = start(ChatClient("Ana", *listener.getsockname(), source=read_end.makefile('rb'),
+                              output=output, capabilities=()))
+
+    conn, _, _, _ = greet(listener)
+    conn.sendall(encode(SYSTEM, "El nickname 'Ana' ya está en uso.".encode('utf-8')))
+    conn.close()
+
+    thread.join(5)
+    assert not thread.is_alive()
+    assert "ya está en uso" in output.getvalue()
+    assert "Reintentando" not in output.getvalue()
+    for sock in (read_end, write_end, listener):
+        sock.close()
+
+# Prueba 5: una línea que no cabe en una trama se descarta con un aviso y se envía el resto
+def test_oversized_line_is_skipped(tmp_path):
+    path = tmp_path / 'mensajes.txt'
+    path.write_text("antes\n" + "x" * 70000 + "\ndespues\n", encoding='utf-8')
+    listener = fake_server()
+    output = io.StringIO()
+
+    with open(path, 'rb') as source:
+        thread = start(ChatClient("Bot", *listener.getsockname(), source=source, output=output, capabilities=()))
+        conn, _, decoder, frames = greet(listener)
+        while data := conn.recv(65536):
+            frames += decoder.feed(data)
+        conn.close()
+        thread.join(5)
+
+    assert not thread.is_alive()
+    assert frames == [(CHAT, b'Bot: antes'), (CHAT, b'Bot: despues')]
+    assert "Línea demasiado larga" in output.getvalue()
+    listener.close()
@@ -0,0 +1,84 @@
+import pytest
+import socket
+import subprocess
+import sys
+import time
+from protocol import CHAT, NICK, FrameDecoder, encode
+
+# Fixture para lanzar el cluster en un puerto libre
+@pytest.fixture
+def cluster_port():
+    """
+    Lanza `cluster.py` con 2 procesos en un puerto libre y lo detiene al terminar.
+    Devuelve el puerto en el que escucha.
+    """
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+
+    process = subprocess.Popen([sys.executable, 'cluster.py', '--workers', '2', '--port', str(port)],
+                               stdout=subprocess.DEVNULL)
+    # Esperar a que ambos procesos estén escuchando
+    time.sleep(1)
+    yield port
+    process.terminate()
+    process.wait(5)
+
+def connect(port, nickname):
+    """Conecta un cliente con tramas y envía su nickname."""
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.settimeout(2)
+    assert sock.recv(1024) == b'NICK'
+    sock.sendall(encode(NICK, nickname.encode('utf-8')))
+    return sock
+
+def receive_until(sock, text):
+    """Lee tramas hasta recibir una que contenga `text`; devuelve todas las recibidas."""
+    decoder = FrameDecoder()
+    payloads = []
+    while not any(text in payload for payload in payloads):
+        data = sock.recv(65536)
+        assert data, f"Conexión cerrada antes de recibir {text!r}"
+        payloads += [payload.decode('utf-8') for _, payload in decoder.feed(data)]
+    return payloads
+
+# Prueba 1: todos los clientes reciben los mensajes, estén en el proceso que estén
+def test_cluster_broadcast(cluster_port):
+    clients = [connect(cluster_port, f"Client{i}") for i in range(6)]
+    time.sleep(0.5)  # Dar tiempo a que terminen los saludos
+
+    clients[0].sendall(encode(CHAT, b'Client0: hola cluster'))
+    for client in clients[1:]:
+        assert 'Client0: hola cluster' in receive_until(client, 'hola cluster')
+
+    for client in clients:
+        client.close()
+
+# Prueba 2: un nickname en uso se rechaza aunque el otro cliente esté en otro proceso
+def test_cluster_unique_nicknames(cluster_port):
+    clients = [connect(cluster_port, "Ana")]
+    time.sleep(0.2)
+    # Con varios intentos es prácticamente seguro caer también en el otro proceso
+    for _ in range(6):
+        duplicate = connect(cluster_port, "ana")
+        assert any('ya está en uso' in payload for payload in receive_until(duplicate, 'ya está en uso'))
+        clients.append(duplicate)
+
+    for client in clients:
+        client.close()
+
+# Prueba 3: un mensaje privado llega a su destinatario aunque esté en otro proceso, y solo a él
+def test_cluster_direct_message(cluster_port):
+    clients = [connect(cluster_port, f"Client{i}") for i in range(6)]
+    time.sleep(0.5)
+
+    for i in range(1, 6):
+        clients[0].sendall(encode(CHAT, f'/msg client{i} hola {i}'.encode('utf-8')))
+        assert f'[privado] Client0: hola {i}' in receive_until(clients[i], f'hola {i}')
+
+    clients[0].sendall(encode(CHAT, b'/msg Nadie hola'))
+    assert any('No hay nadie' in payload for payload in receive_until(clients[0], 'No hay nadie'))
+
+    for client in clients:
+        client.close()
@@ -0,0 +1,57 @@
+import zlib
+from unittest.mock import patch
+from protocol import CAPS, CHAT, SYSTEM, ZLIB, FrameDecoder, StreamDecoder, compressor, encode, nick_payload, parse_nick
+from conftest import join, read_all, receive
+
+# Prueba 1: el nickname y las capacidades viajan juntos en la trama NICK
+def test_nick_payload_roundtrip():
+    assert parse_nick(nick_payload("Ana", (ZLIB,))) == ("Ana", {ZLIB})
+    assert parse_nick(nick_payload("Ana")) == ("Ana", set())
+
+    # CAPS y lo que le sigue comprimido pueden llegar en la misma lectura
+    deflater = compressor()
+    data = encode(CAPS, ZLIB) + deflater.compress(encode(CHAT, b'hola')) + deflater.flush(zlib.Z_SYNC_FLUSH)
+    decoder = StreamDecoder()
+    assert decoder.feed(data[:10]) == []
+    assert decoder.feed(data[10:]) == [(CHAT, b'hola')]
+
+    # Al terminar un flujo (traspaso, ver handoff.py) empieza otro, aunque llegue en la misma lectura
+    other = compressor()
+    data = deflater.compress(encode(CHAT, b'uno')) + deflater.flush(zlib.Z_FINISH)
+    data += other.compress(encode(CHAT, b'dos')) + other.flush(zlib.Z_SYNC_FLUSH)
+    assert decoder.feed(data) == [(CHAT, b'uno'), (CHAT, b'dos')]
+
+# Prueba 2: quien negocia zlib recibe un flujo comprimido; los demás, sin comprimir
+def test_negotiated_compression(listener, chat_server):
+    compressed_peer, compressed = join(chat_server, listener, "Ana", (ZLIB,))
+    plain_peer, plain = join(chat_server, listener, "Beto")
+    assert chat_server.connections[compressed].compressor is not None
+    assert chat_server.connections[plain].compressor is None
+
+    decoder = StreamDecoder()
+    read = decoder.feed(receive(compressed_peer))
+    assert read == [(SYSTEM, b'Beto se uni\xc3\xb3 al chat')]
+
+    message = b'Beto: ' + b'mensaje repetido ' * 50
+    for _ in range(3):
+        chat_server.broadcast(message, plain)
+    chat_server.flush_pending()
+
+    data = receive(compressed_peer)
+    assert len(data) < len(message)  # El contexto se comparte entre tramas
+    assert decoder.feed(data) == [(CHAT, message)] * 3
+
+    # Beto solo recibió el historial (en claro); los avisos le llegan también en claro
+    assert FrameDecoder().feed(read_all(plain_peer)) == [(SYSTEM, 'Ana se unió al chat'.encode('utf-8'))]
+    chat_server.broadcast(b'aviso')
+    chat_server.flush_pending()
+    assert FrameDecoder().feed(receive(plain_peer)) == [(SYSTEM, b'aviso')]
+
+# Prueba 3: con el nivel 0 el servidor no ofrece compresión aunque se pida
+def test_compression_disabled(listener, chat_server):
+    with patch('server.COMPRESSION_LEVEL', 0):
+        peer, accepted = join(chat_server, listener, "Ana", (ZLIB,))
+    assert chat_server.connections[accepted].compressor is None
+    chat_server.broadcast(b'aviso')
+    chat_server.flush_pending()
+    assert StreamDecoder().feed(receive(peer)) == [(SYSTEM, b'aviso')]
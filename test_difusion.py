@@ -0,0 +1,92 @@
+import selectors
+from unittest.mock import patch
+from conftest import read_all
+
+# Prueba 1: el mensaje llega a todos menos al emisor
+def test_broadcast_skips_sender(chat, chat_server):
+    sender, sender_remote = chat("Emisor")
+    _, remote1 = chat("Receptor1")
+    _, remote2 = chat("Receptor2")
+
+    chat_server.broadcast(b'Hola a todos', sender)
+    chat_server.flush_pending()
+
+    assert read_all(remote1) == b'Hola a todos'
+    assert read_all(remote2) == b'Hola a todos'
+    assert read_all(sender_remote) == b''
+
+# Prueba 2: un envío parcial deja el resto en el búfer sin truncar el mensaje
+def test_broadcast_partial_send(chat, chat_server):
+    local, remote = chat("Receptor")
+    chunk = b'x' * (32 * 1024)
+    message = chunk * 64
+
+    for _ in range(64):
+        chat_server.broadcast(chunk)
+    chat_server.flush_pending()
+
+    conn = chat_server.connections[local]
+    assert conn.outbuf  # El socket no admitió todo el mensaje de golpe
+    assert conn.events & selectors.EVENT_WRITE  # Se espera a que sea escribible
+
+    # Vaciar el búfer a medida que el receptor lee
+    received = b''
+    while conn.outbuf:
+        received += read_all(remote)
+        assert chat_server.flush(conn)
+    received += read_all(remote)
+
+    assert received == message
+    assert conn.events == selectors.EVENT_READ
+
+# Prueba 3: un cliente que no lee se desconecta tras SLOW_CONSUMER_TIMEOUT
+@patch('server.HIGH_WATERMARK', 1024)
+@patch('server.LOW_WATERMARK', 512)
+@patch('server.SLOW_CONSUMER_TIMEOUT', 5)
+def test_slow_consumer_eviction(chat, chat_server):
+    slow, _ = chat("Lento")
+    fast, fast_remote = chat("Rapido")
+
+    with patch('server.time.monotonic', return_value=100.0):
+        for _ in range(64):
+            chat_server.broadcast(b'y' * (32 * 1024))
+        chat_server.flush_pending()
+
+        # El cliente rápido sí lee y su búfer se vacía
+        fast_conn = chat_server.connections[fast]
+        while fast_conn.outbuf:
+            read_all(fast_remote)
+            chat_server.flush(fast_conn)
+        assert fast_conn.over_since is None
+
+    conn = chat_server.connections[slow]
+    assert conn.over_since == 100.0
+    assert not conn.events & selectors.EVENT_READ  # Se deja de leer al cliente lento
+
+    # Antes del límite sigue conectado; después se desconecta y se anuncia
+    with patch('server.time.monotonic', return_value=104.0):
+        chat_server.check_slow_consumers()
+    assert slow in chat_server.clients
+
+    with patch('server.time.monotonic', return_value=106.0):
+        chat_server.check_slow_consumers()
+        chat_server.flush_pending()
+    assert slow not in chat_server.clients
+    assert "Lento salió del chat." in read_all(fast_remote).decode('utf-8')
+
+# Prueba 4: el mensaje se serializa una vez y todas las conexiones comparten sus buffers
+def test_broadcast_shares_buffers(chat, chat_server):
+    local1, remote1 = chat("Receptor1")
+    local2, remote2 = chat("Receptor2")
+
+    for i in range(3):
+        chat_server.broadcast(f"mensaje {i}".encode('utf-8'))
+
+    conn1, conn2 = chat_server.connections[local1], chat_server.connections[local2]
+    assert len(conn1.outbuf) == 3
+    assert all(view1 is view2 for view1, view2 in zip(conn1.outbuf, conn2.outbuf))
+
+    # Un solo flush envía los tres mensajes pendientes
+    chat_server.flush_pending()
+    assert not conn1.outbuf and conn1.outlen == 0
+    assert read_all(remote1) == read_all(remote2) == b'mensaje 0mensaje 1mensaje 2'
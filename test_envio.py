@@ -0,0 +1,61 @@
+import threading
+from unittest.mock import patch
+from sendpool import SendPool
+from conftest import read_all
+
+class FakeConn:
+    """Conexión de mentira: anota en qué hilo se envió."""
+    def __init__(self, fd):
+        self.sock = self
+        self.fd = fd
+        self.thread = None
+
+    def fileno(self):
+        return self.fd
+
+    def send_pending(self):
+        self.thread = threading.current_thread().name
+        return self.fd, False, None
+
+# Prueba 1: el reparto es por descriptor (fd % hilos) y devuelve el resultado de cada conexión
+def test_pool_partitions_by_fd():
+    pool = SendPool(3)
+    conns = [FakeConn(fd) for fd in range(30)]
+    results = pool.send(conns)
+    pool.shutdown()
+
+    assert sorted((conn.fd, result) for conn, result in results) == [(fd, (fd, False, None)) for fd in range(30)]
+    for residue in range(3):
+        assert len({conn.thread for conn in conns if conn.fd % 3 == residue}) == 1
+
+# Prueba 2: con hilos cada destinatario recibe todos los mensajes y en orden
+@patch('server.POOL_MIN_CLIENTS', 1)
+def test_pooled_broadcast_keeps_order(chat, chat_server):
+    chat_server.pool = SendPool(4)
+    ana, _ = chat("Ana")
+    remotes = [chat(f"Cliente{number}")[1] for number in range(40)]
+
+    expected = b''
+    for batch in range(5):
+        for number in range(10):
+            message = f"Ana: {batch}-{number};".encode('utf-8')
+            chat_server.broadcast(message, ana)
+            expected += message
+        chat_server.flush_pending()
+
+    for remote in remotes:
+        assert read_all(remote) == expected
+
+# Prueba 3: los errores de envío de los hilos los atiende el bucle (desconexión y aviso)
+@patch('server.POOL_MIN_CLIENTS', 1)
+def test_pooled_send_error_drops_client(chat, chat_server):
+    chat_server.pool = SendPool(2)
+    ana, _ = chat("Ana")
+    gone, gone_remote = chat("Beto")
+    _, carla_remote = chat("Carla")
+    gone_remote.close()
+
+    chat_server.broadcast(b'Ana: hola', ana)
+    chat_server.flush_pending()
+    assert gone not in chat_server.connections
+    assert read_all(carla_remote) == 'Ana: holaBeto salió del chat.'.encode('utf-8')
@@ -0,0 +1,61 @@
+import select
+from unittest.mock import patch
+import server
+from history import History, Histories
+from protocol import CHAT, NICK, FrameDecoder, encode
+from conftest import read_all, say
+
+# Prueba 1: el búfer respeta a la vez el límite de mensajes y el de bytes
+def test_history_is_bounded_by_count_and_bytes():
+    history = History(max_messages=3, max_bytes=10)
+    for message in (b'uno', b'dos', b'tres', b'cuatro'):
+        history.add(CHAT, message)
+
+    # 'dos' + 'tres' + 'cuatro' son 13 bytes: se descarta también 'dos'
+    assert [message for _, message in history.entries] == [b'tres', b'cuatro']
+    assert history.size == 10
+
+    history.add(CHAT, b'x' * 11)  # No cabe entero: no se guarda
+    assert len(history) == 2
+
+    # Los historiales de salas usadas hace más tiempo se descartan
+    histories = Histories(max_rooms=2)
+    for room in ('a', 'b', 'c'):
+        histories.record(room, CHAT, room.encode('utf-8'))
+    assert list(histories.rooms) == ['b', 'c']
+
+# Prueba 2: un cliente nuevo recibe los últimos mensajes tras el saludo, en una sola escritura
+def test_new_client_gets_history_after_handshake(chat, listener, chat_server):
+    ana, ana_remote = chat("Ana")
+    say(chat_server, ana, ana_remote, "Ana: hola")
+    say(chat_server, ana, ana_remote, "Ana: ¿hay alguien?")
+
+    peer, accepted = listener()
+    peer.recv(1024)
+    peer.send(encode(NICK, b'Beto'))
+    select.select([accepted], [], [], 1)
+
+    conn = chat_server.connections[accepted]
+    with patch.object(chat_server, 'settle', wraps=chat_server.settle) as settle:
+        assert chat_server.handshake(accepted) is True
+        assert len(conn.outbuf) == 4  # Cabecera y contenido de cada mensaje
+        chat_server.flush_pending()
+    assert [call.args[0] for call in settle.call_args_list].count(conn) == 1
+
+    frames = FrameDecoder().feed(read_all(peer))
+    assert frames == [(CHAT, b'Ana: hola'), (CHAT, 'Ana: ¿hay alguien?'.encode('utf-8'))]
+
+# Prueba 3: al entrar en una sala se recibe su historial, no el de otras
+def test_join_replays_room_history(chat, chat_server):
+    ana, ana_remote = chat("Ana")
+    beto, beto_remote = chat("Beto")
+
+    say(chat_server, ana, ana_remote, "/join python")
+    say(chat_server, ana, ana_remote, "Ana: hola pythonistas")
+    say(chat_server, beto, beto_remote, "Beto: hola general")
+    read_all(beto_remote)
+
+    say(chat_server, beto, beto_remote, "/join python")
+    assert read_all(beto_remote).decode('utf-8') == (
+        "Ana entró en #python.Ana: hola pythonistasEntraste en #python.")
+    assert len(chat_server.histories.get(server.DEFAULT_ROOM)) == 1
@@ -1,30 +1,33 @@
+import asyncio
 import pytest
 import socket
 import threading
 import time
 import select
+import async_server
+from conftest import launch, wait_for
 
 HOST = '127.0.0.1'  # Dirección del host del servidor
-PORT = 55559  # Puerto para la comunicación del servidor
 
 class ClientThread(threading.Thread):
     """
     Representa un cliente en el sistema de chat, que se ejecuta en un subproceso separado.
     Cada cliente se conecta al servidor, envía y recibe mensajes.
     """
-    def __init__(self, nickname, event):
+    def __init__(self, nickname, port):
         super().__init__()
         self.nickname = nickname  # Apodo del cliente
+        self.port = port  # Puerto del servidor de la prueba
         self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # Creación del socket para la comunicación
         self.received_messages = []  # Lista para almacenar los mensajes recibidos por el cliente
         self.running = True  # Bandera para controlar el estado de ejecución del cliente
-        self.event = event  # Evento utilizado para sincronizar cuando el cliente está listo
+        self.event = threading.Event()  # Se activa cuando el cliente ha enviado su apodo
 
     def run(self):
         """Bucle principal donde el cliente se conecta al servidor y escucha mensajes entrantes."""
         try:
             # Conectarse al servidor
-            self.client.connect((HOST, PORT))
+            self.client.connect((HOST, self.port))
             # Esperar a que el servidor solicite un apodo
             self.client.recv(1024)  # Recibir el aviso 'NICK'
             # Enviar el apodo al servidor
@@ -61,19 +64,63 @@ class ClientThread(threading.Thread):
         self.running = False
         self.client.close()
 
+    def received(self):
+        """Todo lo recibido hasta ahora (un mensaje puede llegar repartido en varias lecturas)."""
+        return ''.join(self.received_messages)
+
+def launch_async():
+    """Arranca el servidor asyncio en un puerto libre, con su bucle en un hilo; devuelve (bucle, servidor, hilo)."""
+    loop = asyncio.new_event_loop()
+    async_server.clients.clear()
+    server = loop.run_until_complete(async_server.start(port=0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    return loop, server, thread
+
+def stop_async(loop, server, thread):
+    """Para el bucle del servidor asyncio y cierra, ya desde este hilo, sus clientes y sus corrutinas."""
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    server.close()
+    for client in list(async_server.clients):
+        async_server.remove(client)
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    loop.close()
+
+@pytest.fixture(params=['selectors', 'asyncio'])
+def chat_address(request):
+    """
+    Servidor de la prueba en un puerto libre, en cada uno de los dos modos
+    (server.py y async_server.py). Devuelve (puerto, función que cuenta los
+    clientes registrados).
+    """
+    if request.param == 'selectors':
+        chat_server, thread = launch()
+        yield chat_server.port, lambda: len(chat_server.clients)
+        chat_server.stop()
+        thread.join(5)
+    else:
+        loop, server, thread = launch_async()
+        yield server.sockets[0].getsockname()[1], lambda: len(async_server.clients)
+        stop_async(loop, server, thread)
+
 @pytest.fixture
-def multiple_clients():
+def multiple_clients(chat_address):
     """
     Fixture para iniciar múltiples clientes para pruebas.
-    Inicializa múltiples instancias de `ClientThread` y sincroniza su inicio.
+    Inicializa múltiples instancias de `ClientThread` y espera a que el
+    servidor los haya registrado a todos antes de empezar.
     """
-    event = threading.Event()  # Crear un evento de subproceso para sincronización
-    clients = [ClientThread(f"Client{i}", event) for i in range(3)]  # Crear 3 clientes con diferentes apodos
+    port, registered = chat_address
+    clients = [ClientThread(f"Client{i}", port) for i in range(3)]  # Crear 3 clientes con diferentes apodos
     for client in clients:
         client.start()  # Iniciar cada cliente en un subproceso separado
-
-    # Esperar hasta que todos los clientes estén conectados y listos
-    event.wait()  # Asegurar que todos los clientes están conectados al servidor
+        # Uno tras otro: el apodo debe llegar solo, antes de que otro cliente envíe nada
+        assert client.event.wait(2)
+        wait_for(lambda: registered() == clients.index(client) + 1)
 
     yield clients  # Proporcionar los clientes a la prueba
     for client in clients:
@@ -89,19 +136,13 @@ def test_message_distribution(multiple_clients):
     """
     clients = multiple_clients
 
-    # Crear eventos para sincronización para que los clientes estén listos al mismo tiempo
-    events = [client.event for client in clients]
-    for event in events:
-        event.wait()  # Esperar hasta que todos los clientes estén listos
-
     # Cliente 0 envía un mensaje
     test_message = "Hello from Client0"
     clients[0].send_message(test_message)
-    time.sleep(1)  # Esperar un breve momento para que los clientes reciban el mensaje
 
     # Verificar si los otros clientes recibieron el mensaje
-    for i, client in enumerate(clients[1:], start=1):
-        assert any(test_message in msg for msg in client.received_messages), f"Client{i} did not receive the message."
+    for client in clients[1:]:
+        wait_for(lambda: test_message in client.received())
 
 def test_simultaneous_messaging(multiple_clients):
     """
@@ -111,30 +152,19 @@ def test_simultaneous_messaging(multiple_clients):
     clients = multiple_clients
     messages = [f"Message from {client.nickname}" for client in clients]  # Preparar mensajes para cada cliente
 
-    # Crear eventos para sincronización para asegurar que todos los clientes estén listos para enviar mensajes
-    events = [client.event for client in clients]
-
-    # Esperar a que todos los clientes estén listos
-    for event in events:
-        event.wait()
-
     # Enviar mensajes desde todos los clientes simultáneamente
     for i, client in enumerate(clients):
         client.send_message(messages[i])
 
-    # Dar tiempo a los clientes para recibir mensajes
-    time.sleep(3)
-
     # Verificar que cada cliente reciba mensajes de otros, pero no el suyo
     for i, client in enumerate(clients):
         for j, message in enumerate(messages):
             if i != j:  # El cliente no debe recibir su propio mensaje
-                assert any(message in msg for msg in client.received_messages), f"{client.nickname} did not receive {messages[j]}"
+                wait_for(lambda: message in client.received())
 
     # Asegurar que cada cliente no reciba su propio mensaje
     for i, client in enumerate(clients):
-        own_message = messages[i]
-        assert all(own_message not in msg for msg in client.received_messages), f"{client.nickname} received its own message."
+        assert messages[i] not in client.received(), f"{client.nickname} received its own message."
 
 def test_unexpected_disconnection(multiple_clients):
     """
@@ -145,12 +175,11 @@ def test_unexpected_disconnection(multiple_clients):
 
     # Desconectar el cliente 0 para simular una desconexión inesperada
     clients[0].stop()
-    time.sleep(5)  # Dar tiempo al servidor para procesar la desconexión
+    time.sleep(0.2)  # Dar tiempo al servidor para procesar la desconexión
 
     # Verificar que los clientes restantes puedan seguir enviando y recibiendo mensajes
     test_message = "Message after Client0 disconnect"
     clients[1].send_message(test_message)
 
-    time.sleep(1)  # Dar tiempo a los clientes para recibir el mensaje
-    for i, client in enumerate(clients[2:], start=2):
-        assert any(test_message in msg for msg in client.received_messages), f"Client{i} did not receive the message after the disconnection."
\ No newline at end of file
+    for client in clients[2:]:
+        wait_for(lambda: test_message in client.received())
\ No newline at end of file
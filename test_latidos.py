@@ -0,0 +1,74 @@
+import select
+from unittest.mock import patch
+import server
+from timerwheel import TimerWheel
+from protocol import PING, PONG, SYSTEM, FrameDecoder, encode
+from conftest import join, read_all, receive
+
+def at(chat_server, moment):
+    """Ejecuta check_timers() como si fuera el instante `moment` y envía lo encolado."""
+    with patch('server.time.monotonic', return_value=moment):
+        chat_server.check_timers()
+    chat_server.flush_pending()
+
+# Prueba 1: la rueda solo devuelve los plazos vencidos, con reprogramación y cancelación
+def test_timer_wheel():
+    wheel = TimerWheel(tick=1.0, size=8, now=0.0)
+    wheel.schedule('a', 2.5)
+    wheel.schedule('b', 3.0)
+    wheel.schedule('c', 20.0)  # Más de una vuelta de la rueda
+    wheel.schedule('d', 4.0)
+    wheel.schedule('b', 6.0)  # Sustituye al plazo anterior
+    wheel.cancel('d')
+
+    assert wheel.advance(2.9) == []
+    assert wheel.advance(3.0) == ['a']
+    assert wheel.advance(5.0) == []
+    assert wheel.advance(6.0) == ['b']
+    assert wheel.advance(12.0) == []  # 'c' está en una ranura visitada, pero no vence
+    assert 'c' in wheel and len(wheel) == 1
+    assert wheel.advance(100.0) == ['c']  # Tras un salto largo se visita cada ranura una vez
+    assert len(wheel) == 0
+
+# Prueba 2: un cliente inactivo recibe PING; si responde sigue conectado
+def test_idle_client_answers_ping(chat, listener, chat_server):
+    peer, accepted = join(chat_server, listener, "Ana")
+    start = chat_server.connections[accepted].last_seen
+
+    at(chat_server, start + server.IDLE_TIMEOUT + 1)
+    assert FrameDecoder().feed(receive(peer)) == [(PING, b'')]
+
+    peer.send(encode(PONG, b''))
+    select.select([accepted], [], [], 1)
+    with patch('server.time.monotonic', return_value=start + server.IDLE_TIMEOUT + 2):
+        assert chat_server.handle(accepted) is True
+
+    at(chat_server, start + server.IDLE_TIMEOUT + server.PING_TIMEOUT + 2)
+    assert accepted in chat_server.clients
+    assert chat_server.connections[accepted].pinged_at is None
+
+# Prueba 3: un cliente que no responde al PING se elimina y los demás reciben su salida
+def test_dead_client_is_reaped(chat, listener, chat_server):
+    dead_peer, dead = join(chat_server, listener, "Ana")
+    alive_peer, alive = join(chat_server, listener, "Beto")
+    read_all(dead_peer)
+    start = chat_server.connections[dead].last_seen
+
+    at(chat_server, start + server.IDLE_TIMEOUT + 1)
+    # Beto responde al PING (cualquier dato cuenta como respuesta)
+    chat_server.connections[alive].last_seen = start + server.IDLE_TIMEOUT + 1
+    read_all(alive_peer)
+
+    at(chat_server, start + server.IDLE_TIMEOUT + server.PING_TIMEOUT + 2)
+    assert dead not in chat_server.connections
+    assert alive in chat_server.clients
+    assert (SYSTEM, 'Ana salió del chat.'.encode('utf-8')) in FrameDecoder().feed(receive(alive_peer))
+
+# Prueba 4: el servidor responde al PING de un cliente
+def test_server_answers_ping(chat, listener, chat_server):
+    peer, accepted = join(chat_server, listener, "Ana")
+    peer.send(encode(PING, b'42'))
+    select.select([accepted], [], [], 1)
+    assert chat_server.handle(accepted) is True
+    chat_server.flush_pending()
+    assert FrameDecoder().feed(receive(peer)) == [(PONG, b'42')]
@@ -0,0 +1,109 @@
+import select
+import selectors
+from unittest.mock import patch
+import server
+from ratelimit import Limits, TokenBucket
+from protocol import CHAT, FrameDecoder, ProtocolError, encode
+from conftest import read_all
+
+def flood(chat_server, local, remote, count):
+    """Envía `count` tramas de golpe desde un cliente con tramas y deja que el servidor las procese."""
+    conn = chat_server.connections[local]
+    conn.framed = True
+    conn.decoder = FrameDecoder()
+    remote.send(b''.join(encode(CHAT, f"Ana: {number}".encode('utf-8')) for number in range(count)))
+    select.select([local], [], [], 1)
+    result = chat_server.handle(local)
+    chat_server.flush_pending()
+    return result
+
+# Prueba 1: el cubo permite una ráfaga y luego se rellena al ritmo configurado
+def test_token_bucket():
+    bucket = TokenBucket(rate=2, burst=3, now=0.0)
+    assert [bucket.take(1, 0.0) for _ in range(4)] == [True, True, True, False]
+    assert bucket.delay(1, 0.0) == 0.5
+    assert bucket.take(1, 0.5) is True
+
+    # Ambos límites: un mensaje grande agota los bytes aunque queden mensajes
+    limits = Limits(10, 10, 100, 100, now=0.0)
+    assert limits.admit(80, 0.0) is True
+    assert limits.admit(80, 0.0) is False
+    assert limits.messages.tokens == 9  # El rechazo no gasta fichas de mensajes
+    assert limits.delay(80, 0.0) == 0.6
+
+# Prueba 2: con la política 'defer' lo que sobra se aplaza en orden y se deja de leer al cliente
+@patch('server.RATE_MESSAGES', 2)
+@patch('server.BURST_MESSAGES', 2)
+def test_defer_policy(chat, chat_server):
+    ana, ana_remote = chat("Ana")
+    _, beto_remote = chat("Beto")
+    start = chat_server.connections[ana].limits.messages.stamp
+
+    with patch('server.time.monotonic', return_value=start):
+        assert flood(chat_server, ana, ana_remote, 5) is True
+    assert read_all(beto_remote) == b'Ana: 0Ana: 1'
+    assert len(chat_server.connections[ana].deferred) == 3
+    assert ana in chat_server.throttled
+    assert not chat_server.connections[ana].events & selectors.EVENT_READ
+
+    # Pasado un segundo caben dos más; el resto espera
+    with patch('server.time.monotonic', return_value=start + 1):
+        assert chat_server.release_deferred() == 0.5
+    chat_server.flush_pending()
+    assert read_all(beto_remote) == b'Ana: 2Ana: 3'
+
+    with patch('server.time.monotonic', return_value=start + 2):
+        assert chat_server.release_deferred() is None
+    chat_server.flush_pending()
+    assert read_all(beto_remote) == b'Ana: 4'
+    assert ana not in chat_server.throttled
+    assert chat_server.connections[ana].events & selectors.EVENT_READ
+
+# Prueba 3: con la política 'drop' lo que sobra se descarta y se avisa una sola vez
+@patch('server.RATE_MESSAGES', 2)
+@patch('server.BURST_MESSAGES', 2)
+@patch('server.RATE_POLICY', server.DROP)
+def test_drop_policy(chat, chat_server):
+    ana, ana_remote = chat("Ana")
+    _, beto_remote = chat("Beto")
+
+    assert flood(chat_server, ana, ana_remote, 5) is True
+    assert read_all(beto_remote) == b'Ana: 0Ana: 1'
+    notices = FrameDecoder().feed(read_all(ana_remote))
+    assert len(notices) == 1 and b'demasiado' in notices[0][1]
+    assert not chat_server.connections[ana].deferred
+
+# Prueba 4: con la política 'disconnect' el cliente se desconecta y los demás reciben su salida
+@patch('server.RATE_MESSAGES', 2)
+@patch('server.BURST_MESSAGES', 2)
+@patch('server.RATE_POLICY', server.DISCONNECT)
+def test_disconnect_policy(chat, chat_server):
+    ana, ana_remote = chat("Ana")
+    _, beto_remote = chat("Beto")
+
+    assert flood(chat_server, ana, ana_remote, 5) is False
+    chat_server.remove(ana)
+    chat_server.flush_pending()
+    assert read_all(beto_remote) == 'Ana: 0Ana: 1Ana salió del chat.'.encode('utf-8')
+    # Cuenta como expulsión, no como rechazo en el saludo
+    assert chat_server.metrics.evictions['rate_limit'].value == 1
+    assert chat_server.metrics.rejected.value == 0
+
+# Prueba 5: un error al procesar un mensaje aplazado desconecta solo a su cliente
+@patch('server.RATE_MESSAGES', 2)
+@patch('server.BURST_MESSAGES', 2)
+def test_deferred_error_drops_only_sender(chat, chat_server):
+    ana, ana_remote = chat("Ana")
+    _, beto_remote = chat("Beto")
+    start = chat_server.connections[ana].limits.messages.stamp
+
+    with patch('server.time.monotonic', return_value=start):
+        assert flood(chat_server, ana, ana_remote, 3) is True
+    chat_server.connections[ana].deferred.appendleft(b'/roto')
+    read_all(beto_remote)
+
+    with patch('server.time.monotonic', return_value=start + 2), \
+         patch.object(chat_server, 'command', side_effect=ProtocolError("Trama demasiado grande")):
+        assert chat_server.release_deferred() is None
+    assert ana not in chat_server.connections and ana not in chat_server.throttled
+    assert chat_server.nicknames == {chat_server.by_nick['beto']: "Beto"}
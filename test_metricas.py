@@ -0,0 +1,123 @@
+import http.client
+import socket
+import threading
+from metrics import Registry, parse_address, worker_address
+from server import ChatServer
+from conftest import read_all
+
+def samples(text):
+    """Convierte la salida en formato Prometheus en {muestra con etiquetas: valor}."""
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, _, value = line.rpartition(' ')
+            values[name] = float(value)
+    return values
+
+def scrape(chat_server):
+    """Consulta las métricas por HTTP mientras el servidor atiende en otro hilo."""
+    host, port = chat_server.exporter.address
+    connection = http.client.HTTPConnection(host, port, timeout=2)
+    connection.request('GET', '/metrics')
+    response = connection.getresponse()
+    body = response.read().decode('utf-8')
+    connection.close()
+    return response.status, response.getheader('Content-Type'), body
+
+# Prueba 1: formato de texto de Prometheus, con histogramas acumulados y familias con etiquetas
+def test_render_format():
+    registry = Registry()
+    registry.counter('demo_total', "Un contador").inc(3)
+    registry.gauge('demo_size', "Un medidor calculado", lambda: 7)
+    for reason in ('a', 'b'):
+        registry.counter('demo_reasons_total', "Con etiquetas", reason=reason).inc()
+    histogram = registry.histogram('demo_seconds', "Un histograma", bounds=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    text = registry.render()
+    assert text.count('# TYPE demo_reasons_total counter') == 1
+    assert samples(text) == {
+        'demo_total': 3,
+        'demo_size': 7,
+        'demo_reasons_total{reason="a"}': 1,
+        'demo_reasons_total{reason="b"}': 1,
+        'demo_seconds_bucket{le="0.1"}': 2,
+        'demo_seconds_bucket{le="1.0"}': 3,
+        'demo_seconds_bucket{le="+Inf"}': 4,
+        'demo_seconds_sum': 2.65,
+        'demo_seconds_count': 4,
+    }
+
+# Prueba 2: una difusión cuenta lo recibido, lo entregado y su duración
+def test_broadcast_counters(chat, chat_server):
+    ana, ana_remote = chat("Ana")
+    _, beto_remote = chat("Beto")
+    _, carla_remote = chat("Carla")
+    metrics = chat_server.metrics
+    fanouts = sum(metrics.fanout_seconds.counts)
+
+    ana_remote.send(b'Ana: hola')
+    assert chat_server.handle(ana) is True
+    chat_server.flush_pending()
+    assert read_all(beto_remote) == read_all(carla_remote) == b'Ana: hola'
+
+    values = samples(metrics.render())
+    assert values['chat_clients'] == 3
+    assert values['chat_messages_in_total'] == 1
+    assert values['chat_bytes_in_total'] == len(b'Ana: hola')
+    assert values['chat_messages_out_total'] >= 2
+    assert values['chat_bytes_out_total'] >= 2 * len(b'Ana: hola')
+    assert sum(metrics.fanout_seconds.counts) == fanouts + 1
+
+# Prueba 3: el servidor atiende las consultas en su propio bucle, con las fases medidas
+def test_http_endpoint():
+    chat_server = ChatServer(port=0, metrics_address=('127.0.0.1', 0))
+    chat_server.start()
+    thread = threading.Thread(target=chat_server.serve_forever, daemon=True)
+    thread.start()
+
+    client = socket.create_connection((chat_server.host, chat_server.port))
+    assert client.recv(1024) == b'NICK'
+    status, content_type, body = scrape(chat_server)
+    assert status == 200 and content_type.startswith('text/plain; version=0.0.4')
+    values = samples(body)
+    assert values['chat_accepted_total'] == 1
+    assert values['chat_handshakes'] == 1
+    assert values['chat_loop_phase_seconds_count{phase="select"}'] >= 1
+
+    client.close()
+    chat_server.stop()
+    thread.join(2)
+    assert chat_server.exporter is None
+
+# Prueba 4: también por un socket Unix; las rutas desconocidas devuelven 404
+def test_unix_endpoint(tmp_path):
+    path = str(tmp_path / 'metricas.sock')
+    chat_server = ChatServer(port=0, metrics_address=path)
+    chat_server.start()
+    thread = threading.Thread(target=chat_server.serve_forever, daemon=True)
+    thread.start()
+
+    for target, expected in (('/metrics', b'200 OK'), ('/otra', b'404 Not Found')):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(2)
+        sock.connect(path)
+        sock.sendall(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode('ascii'))
+        response = b''
+        while chunk := sock.recv(65536):
+            response += chunk
+        sock.close()
+        assert response.split(b'\r\n')[0] == b'HTTP/1.1 ' + expected
+
+    chat_server.stop()
+    thread.join(2)
+    assert not (tmp_path / 'metricas.sock').exists()
+
+# Prueba 5: direcciones de la línea de comandos y de cada proceso del cluster
+def test_addresses():
+    assert parse_address('0.0.0.0:9100') == ('0.0.0.0', 9100)
+    assert parse_address(':9100') == ('127.0.0.1', 9100)
+    assert parse_address('/tmp/metricas.sock') == '/tmp/metricas.sock'
+    assert worker_address(('127.0.0.1', 9100), 2) == ('127.0.0.1', 9102)
+    assert worker_address('/tmp/metricas.sock', 2) == '/tmp/metricas.sock.2'
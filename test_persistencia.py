@@ -0,0 +1,109 @@
+import os
+import time
+import select
+from unittest.mock import patch
+import server
+from msglog import MessageLog
+from protocol import CHAT, SYSTEM
+from conftest import wait_for
+
+def records(log, count):
+    """Los últimos `count` registros como (secuencia, sala, mensaje)."""
+    return [(sequence, room, bytes(message)) for sequence, _, _, room, message in log.last(count)]
+
+# Prueba 1: los mensajes sobreviven a un reinicio y se leen por posición o por instante
+def test_log_survives_restart(tmp_path):
+    log = MessageLog(str(tmp_path), segment_bytes=1024, index_interval=128).start()
+    for number in range(100):
+        log.append(CHAT, b'mensaje %d' % number, 'general')
+    log.stop()
+
+    # Se rotó a varios segmentos, cada uno con su índice
+    names = os.listdir(tmp_path)
+    assert sum(name.endswith('.log') for name in names) > 2
+    assert sum(name.endswith('.idx') for name in names) == sum(name.endswith('.log') for name in names)
+
+    log = MessageLog(str(tmp_path), segment_bytes=1024, index_interval=128)
+    assert log.next_sequence == 100
+    assert records(log, 2) == [(98, 'general', b'mensaje 98'), (99, 'general', b'mensaje 99')]
+
+    timestamps = [timestamp for _, timestamp, *_ in log.last(100)]
+    assert [sequence for sequence, *_ in log.since(timestamps[60])][0] <= 60
+    assert all(timestamp >= timestamps[60] for _, timestamp, *_ in log.since(timestamps[60]))
+
+    # Se sigue escribiendo a continuación
+    log.start()
+    log.append(SYSTEM, b'aviso')
+    log.stop()
+    assert records(MessageLog(str(tmp_path)), 1) == [(100, None, b'aviso')]
+
+# Prueba 2: un registro a medio escribir se descarta al recuperar y la retención borra segmentos viejos
+def test_recovery_and_retention(tmp_path):
+    log = MessageLog(str(tmp_path), segment_bytes=512, retention_bytes=2048).start()
+    for number in range(200):
+        log.append(CHAT, b'x' * 20, 'general')
+    log.stop()
+
+    assert sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path) if name.endswith('.log')) <= 2048 + 512
+    assert log.segments[0].base > 0
+
+    # Simular una caída a mitad de un registro
+    last = log.segments[-1]
+    with open(last.path, 'ab') as file:
+        file.write(b'\x00\x00\x00\x10basura')
+
+    log = MessageLog(str(tmp_path))
+    assert log.next_sequence == 200
+    log.start()
+    log.append(CHAT, b'tras la caida', 'general')
+    log.stop()
+    assert records(MessageLog(str(tmp_path)), 1) == [(200, 'general', b'tras la caida')]
+
+# Prueba 3: broadcast() solo encola en el registro, aunque el escritor esté parado
+def test_broadcast_only_queues(chat, tmp_path, chat_server):
+    ana, ana_remote = chat("Ana")
+    chat("Beto")
+    log = MessageLog(str(tmp_path), queue_size=1)  # Sin hilo escritor
+
+    with patch.object(chat_server, 'message_log', log):
+        for text in (b'Ana: hola', b'Ana: sigo aqui'):
+            ana_remote.send(text)
+            select.select([ana], [], [], 1)
+            assert chat_server.handle(ana) is True
+            chat_server.flush_pending()
+
+    # El primero queda encolado; el segundo se descarta en vez de esperar
+    assert log.queue.get_nowait()[1:] == (CHAT, server.DEFAULT_ROOM, b'Ana: hola')
+    assert log.dropped == 1
+    log.stop()
+
+# Prueba 4: la retención por antigüedad se aplica sin rotar: al abrir el registro, al
+# pedirla con expire() y al leer (el segmento actual puede tener registros caducados)
+def test_retention_without_rotation(tmp_path, chat_server):
+    aged = time.time() - 3600
+    with patch('msglog.time.time', return_value=aged):
+        log = MessageLog(str(tmp_path), segment_bytes=512).start()
+        for number in range(60):
+            log.append(CHAT, b'viejo %d' % number, 'general')
+        log.stop()
+    assert len(log.segments) > 2
+
+    # Al abrirlo solo queda el último segmento, y sus registros ya no se devuelven
+    log = MessageLog(str(tmp_path), segment_bytes=512, retention_seconds=60)
+    assert len(log.segments) == 1
+    assert records(log, 100) == [] and list(log.since(0)) == []
+
+    # Con el escritor en marcha, expire() borra lo que caduca aunque no se rote
+    log.start()
+    with patch('msglog.time.time', return_value=aged):
+        for number in range(60):
+            log.append(CHAT, b'viejo %d' % number, 'general')
+        wait_for(lambda: log.next_sequence == 120)
+    assert len(log.segments) > 2
+
+    chat_server.message_log = log
+    chat_server.check_retention(chat_server.retain_at)
+    log.stop()
+    chat_server.message_log = None
+    assert len(log.segments) == 1
+    assert sorted(name[-4:] for name in os.listdir(tmp_path)) == ['.idx', '.log']
@@ -0,0 +1,99 @@
+import select
+from unittest.mock import Mock
+import server
+from protocol import CHAT, MAX_FRAME_SIZE, NICK, SYSTEM, FrameDecoder, encode
+from conftest import read_all, say
+
+def greet(chat_server, listener, nickname):
+    """Conecta un cliente con tramas, envía su nickname y devuelve (cliente, socket aceptado, resultado)."""
+    peer, accepted = listener()
+    peer.recv(1024)
+    peer.send(encode(NICK, nickname.encode('utf-8')))
+    select.select([accepted], [], [], 1)
+    result = chat_server.handshake(accepted)
+    chat_server.flush_pending()
+    return peer, accepted, result
+
+def send_largest(chat_server, peer, accepted, prefix, expected):
+    """Envía `prefix` relleno hasta MAX_FRAME_SIZE y atiende al cliente hasta recibir `expected`."""
+    peer.sendall(encode(CHAT, prefix + b'x' * (MAX_FRAME_SIZE - len(prefix))))
+    data = b''
+    while expected not in data:
+        select.select([accepted], [peer], [], 1)
+        assert chat_server.handle(accepted) is True
+        chat_server.flush_pending()
+        select.select([peer], [], [], 0.05)
+        data += read_all(peer)
+    return data
+
+# Prueba 1: el servidor rechaza un nickname en uso, sin distinguir mayúsculas
+def test_duplicate_nickname_is_rejected(chat, listener, chat_server):
+    _, ana, result = greet(chat_server, listener, "Ana")
+    assert result is True
+
+    peer, _, result = greet(chat_server, listener, "ANA")
+    assert result is False
+    select.select([peer], [], [], 1)
+    assert (SYSTEM, "El nickname 'ANA' ya está en uso.".encode('utf-8')) in FrameDecoder().feed(read_all(peer))
+    assert chat_server.by_nick == {"ana": ana}
+
+    # Al salir Ana su nickname queda libre
+    chat_server.remove(ana)
+    _, again, result = greet(chat_server, listener, "ana")
+    assert result is True and chat_server.by_nick["ana"] is again
+
+# Prueba 2: /msg entrega solo al destinatario, con tramas o en texto plano
+def test_direct_message_reaches_only_recipient(chat, listener, chat_server):
+    ana, ana_remote = chat("Ana")
+    _, beto_remote = chat("Beto")
+    carla_peer, _, _ = greet(chat_server, listener, "Carla")
+    read_all(ana_remote), read_all(beto_remote)
+    select.select([carla_peer], [], [], 1)
+    read_all(carla_peer)
+
+    say(chat_server, ana, ana_remote, "/msg beto hola, ¿qué tal?")
+    assert read_all(beto_remote) == '[privado] Ana: hola, ¿qué tal?'.encode('utf-8')
+
+    say(chat_server, ana, ana_remote, "/msg CARLA hola")
+    select.select([carla_peer], [], [], 1)
+    assert FrameDecoder().feed(read_all(carla_peer)) == [(CHAT, b'[privado] Ana: hola')]
+    assert read_all(ana_remote) == b''
+    assert read_all(beto_remote) == b''
+    # Los privados no quedan en el historial de la sala
+    assert b'privado' not in b''.join(chat_server.histories.buffers(server.DEFAULT_ROOM, False))
+
+# Prueba 3: destinatario desconocido o uso incorrecto
+def test_direct_message_errors(chat, chat_server):
+    ana, ana_remote = chat("Ana")
+
+    say(chat_server, ana, ana_remote, "/msg Nadie hola")
+    assert read_all(ana_remote) == "No hay nadie conectado con el nickname 'Nadie'.".encode('utf-8')
+
+    say(chat_server, ana, ana_remote, "/msg Nadie")
+    assert read_all(ana_remote) == b'Uso: /msg <nickname> <mensaje>'
+
+# Prueba 4: un destinatario demasiado largo o un mensaje que no cabría en una trama se rechazan
+# con un aviso, sin desconectar al remitente ni llegar al bus del cluster
+def test_direct_message_limits(chat, listener, chat_server):
+    ana, ana_remote = chat("Ana")
+    chat("Beto")
+    carla_peer, carla, _ = greet(chat_server, listener, "Carla")
+    chat_server.bus = Mock()  # Después del saludo: con bus, el nickname se confirmaría en el cluster
+    read_all(ana_remote)
+
+    say(chat_server, ana, ana_remote, f"/msg {'x' * 300} hola")
+    assert b'No hay nadie conectado con ese nickname' in read_all(ana_remote)
+
+    send_largest(chat_server, carla_peer, carla, b'/msg beto ', b'demasiado largo')
+    assert carla in chat_server.clients
+    chat_server.bus.direct.assert_not_called()
+
+# Prueba 5: /part y los comandos desconocidos no repiten entero un argumento enorme
+# (la respuesta no cabría en una trama y se desconectaría al remitente)
+def test_command_replies_fit_in_a_frame(chat, listener, chat_server):
+    chat("Ana")
+    carla_peer, carla, _ = greet(chat_server, listener, "Carla")
+
+    send_largest(chat_server, carla_peer, carla, b'/part ', "Uso: /part".encode('utf-8'))
+    send_largest(chat_server, carla_peer, carla, b'/', "Comando desconocido: /xxx".encode('utf-8'))
+    assert carla in chat_server.clients
@@ -0,0 +1,85 @@
+import pytest
+import select
+from protocol import CHAT, NICK, SYSTEM, FrameDecoder, ProtocolError, encode, MAX_FRAME_SIZE
+from conftest import read_all
+
+def make_framed(chat_server, sock):
+    """Marca una conexión ya registrada como cliente con tramas."""
+    conn = chat_server.connections[sock]
+    conn.framed = True
+    conn.decoder = FrameDecoder()
+
+# Prueba 1: una sola lectura con varias tramas devuelve todas las completas
+def test_decoder_multiple_frames():
+    decoder = FrameDecoder()
+    data = encode(CHAT, b'uno') + encode(CHAT, b'dos') + encode(SYSTEM, b'tres')
+
+    assert decoder.feed(data) == [(CHAT, b'uno'), (CHAT, b'dos'), (SYSTEM, b'tres')]
+    assert decoder.buffer == bytearray()
+
+# Prueba 2: una trama partida en varias lecturas se reconstruye entera
+def test_decoder_split_frame():
+    decoder = FrameDecoder()
+    data = encode(CHAT, b'x' * 5000)
+
+    assert decoder.feed(data[:3]) == []
+    assert decoder.feed(data[3:2000]) == []
+    assert decoder.feed(data[2000:]) == [(CHAT, b'x' * 5000)]
+
+# Prueba 3: tramas demasiado grandes o de tipo desconocido son un error
+def test_decoder_rejects_invalid_frames():
+    with pytest.raises(ProtocolError):
+        FrameDecoder().feed(b'\x00\x10\x00\x00\x02')  # Longitud 1 MiB
+    with pytest.raises(ProtocolError):
+        FrameDecoder().feed(b'\x00\x00\x00\x01\x09x')  # Tipo 9
+    with pytest.raises(ProtocolError):
+        encode(CHAT, b'x' * (MAX_FRAME_SIZE + 1))
+
+# Prueba 4: mensajes seguidos llegan como tramas separadas a un cliente con tramas
+def test_framed_messages_keep_boundaries(chat, chat_server):
+    sender, sender_remote = chat("Emisor")
+    receiver, receiver_remote = chat("Receptor")
+    make_framed(chat_server, sender)
+    make_framed(chat_server, receiver)
+
+    sender_remote.send(encode(CHAT, b'Emisor: hola') + encode(CHAT, b'Emisor: adios'))
+    select.select([sender], [], [], 1)
+    assert chat_server.handle(sender) is True
+    chat_server.flush_pending()
+
+    frames = FrameDecoder().feed(read_all(receiver_remote))
+    assert frames == [(CHAT, b'Emisor: hola'), (CHAT, b'Emisor: adios')]
+
+# Prueba 5: un mismo broadcast llega en tramas o en texto plano según el cliente
+def test_broadcast_mixed_protocols(chat, chat_server):
+    framed, framed_remote = chat("Nuevo")
+    _, legacy_remote = chat("Antiguo")
+    make_framed(chat_server, framed)
+
+    chat_server.broadcast(b'Aviso del servidor')
+    chat_server.broadcast(b'Otro aviso')
+    chat_server.flush_pending()
+
+    assert FrameDecoder().feed(read_all(framed_remote)) == [(SYSTEM, b'Aviso del servidor'), (SYSTEM, b'Otro aviso')]
+    assert read_all(legacy_remote) == b'Aviso del servidorOtro aviso'
+
+# Prueba 6: el nickname en trama y los mensajes enviados justo después no se mezclan
+def test_framed_handshake(listener, chat_server):
+    # Un cliente antiguo ya conectado que observa lo que llega al chat
+    watcher_peer, watcher = listener()
+    watcher_peer.recv(1024)
+    watcher_peer.send(b'Observador')
+    select.select([watcher], [], [], 1)
+    assert chat_server.handshake(watcher) is True
+
+    # El cliente con tramas envía su nickname y un mensaje en el mismo paquete
+    peer, accepted = listener()
+    assert peer.recv(1024) == b'NICK'
+    peer.send(encode(NICK, b'Ana') + encode(CHAT, b'Ana: primer mensaje'))
+    select.select([accepted], [], [], 1)
+    assert chat_server.handshake(accepted) is True
+    chat_server.flush_pending()
+
+    assert chat_server.nicknames[accepted] == "Ana"
+    assert chat_server.connections[accepted].framed
+    assert read_all(watcher_peer) == "Ana se unió al chat".encode('utf-8') + b'Ana: primer mensaje'
@@ -0,0 +1,62 @@
+import json
+import logging
+import pytest
+from unittest.mock import patch
+import jsonlog
+from jsonlog import DEBUG, INFO, Sampler, event
+
+def record(name):
+    """Crea un registro de logging para el evento `name`."""
+    return logging.LogRecord('chat', INFO, __file__, 0, name, None, None)
+
+# Fixture para dejar el registro sin configurar después de cada prueba
+@pytest.fixture
+def restore_logger():
+    yield
+    jsonlog.shutdown()
+    jsonlog.logger.handlers[:] = []
+    jsonlog.logger.setLevel(logging.NOTSET)
+    jsonlog.logger.propagate = True
+
+# Prueba 1: los eventos se escriben como líneas JSON en el archivo configurado
+def test_events_are_written_as_json_lines(tmp_path, restore_logger):
+    path = tmp_path / 'server.jsonl'
+    jsonlog.configure('INFO', str(path))
+
+    event(INFO, 'join', nickname="Ana")
+    event(INFO, 'message', nickname="Ana", text=b'hola')
+    event(DEBUG, 'fanout', recipients=3)  # Nivel desactivado: no se escribe
+    jsonlog.shutdown()
+
+    lines = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert [line['event'] for line in lines] == ['join', 'message']
+    assert lines[0]['nickname'] == "Ana" and lines[0]['level'] == 'INFO'
+    assert lines[1]['text'] == 'hola'
+
+# Prueba 2: un evento de un nivel desactivado no llega al manejador
+def test_disabled_level_is_not_queued(restore_logger):
+    jsonlog.configure('INFO')
+
+    with patch.object(jsonlog.logger.handlers[0], 'handle') as handle:
+        event(DEBUG, 'fanout', recipients=1000)
+        handle.assert_not_called()
+
+        event(INFO, 'join', nickname="Ana")
+        handle.assert_called_once()
+
+# Prueba 3: el muestreo conserva solo una fracción de cada tipo de evento
+def test_sampler_rate():
+    sampler = Sampler(rates={'message': 0.0, 'join': 1.0})
+
+    assert not sampler.filter(record('message'))
+    assert sampler.filter(record('join'))
+    assert sampler.filter(record('connect'))  # Sin regla: siempre pasa
+
+# Prueba 4: el límite de frecuencia corta al superar el máximo por segundo
+def test_sampler_rate_limit():
+    sampler = Sampler(limits={'connect': 2})
+
+    with patch('jsonlog.time.monotonic', return_value=10.2):
+        assert [sampler.filter(record('connect')) for _ in range(3)] == [True, True, False]
+    with patch('jsonlog.time.monotonic', return_value=11.0):
+        assert sampler.filter(record('connect'))  # Nuevo segundo: vuelve a pasar
@@ -0,0 +1,90 @@
+import server
+from protocol import MAX_FRAME_SIZE
+from conftest import read_all, say
+
+# Prueba 1: todos empiezan en la sala por defecto
+def test_register_joins_default_room(chat, chat_server):
+    ana, _ = chat("Ana")
+    beto, _ = chat("Beto")
+
+    assert chat_server.rooms[server.DEFAULT_ROOM] == {ana, beto}
+    assert chat_server.memberships[ana] == {server.DEFAULT_ROOM}
+    assert chat_server.connections[ana].room == server.DEFAULT_ROOM
+    assert chat_server.by_nick["ana"] is ana
+
+# Prueba 2: los mensajes solo llegan a los miembros de la sala activa
+def test_message_reaches_only_room_members(chat, chat_server):
+    ana, ana_remote = chat("Ana")
+    beto, beto_remote = chat("Beto")
+    _, carla_remote = chat("Carla")
+
+    say(chat_server, ana, ana_remote, "/join python")
+    say(chat_server, beto, beto_remote, "/join python")
+    read_all(ana_remote), read_all(beto_remote), read_all(carla_remote)
+
+    say(chat_server, ana, ana_remote, "Ana: hola pythonistas")
+
+    assert read_all(beto_remote) == b'Ana: hola pythonistas'
+    assert read_all(carla_remote) == b''  # Carla sigue solo en #general
+
+# Prueba 3: /part devuelve al cliente a otra de sus salas y /list muestra las salas
+def test_part_and_list(chat, chat_server):
+    ana, ana_remote = chat("Ana")
+    chat("Beto")
+
+    say(chat_server, ana, ana_remote, "/join python")
+    say(chat_server, ana, ana_remote, "/part")
+    assert chat_server.connections[ana].room == server.DEFAULT_ROOM
+    assert "python" not in chat_server.rooms  # Las salas vacías desaparecen
+    read_all(ana_remote)
+
+    say(chat_server, ana, ana_remote, "/list")
+    assert read_all(ana_remote) == b'Salas: #general (2)'
+
+    say(chat_server, ana, ana_remote, "/part general")
+    say(chat_server, ana, ana_remote, "Ana: hay alguien?")
+    assert b'No est' in read_all(ana_remote)
+
+# Prueba 4: al eliminar un cliente se limpian sus salas y su nickname
+def test_remove_cleans_indexes(chat, chat_server):
+    ana, ana_remote = chat("Ana")
+    beto, _ = chat("Beto")
+    say(chat_server, ana, ana_remote, "/join python")
+
+    chat_server.remove(ana)
+
+    assert ana not in chat_server.memberships
+    assert "python" not in chat_server.rooms
+    assert chat_server.rooms[server.DEFAULT_ROOM] == {beto}
+    assert "ana" not in chat_server.by_nick
+
+# Prueba 5: con miles de salas /list responde por páginas que caben en una trama
+def test_list_is_paginated(chat, chat_server):
+    ana, ana_remote = chat("Ana")
+    for number in range(5000):
+        chat_server.rooms[f"sala{number:04}"] = {ana}
+    read_all(ana_remote)
+
+    say(chat_server, ana, ana_remote, "/list")
+    first = read_all(ana_remote).decode('utf-8')
+    assert first.startswith("Salas (página 1 de 51): #general (1), #sala0000 (1)")
+    assert first.endswith("Usa /list 2 para ver más.")
+    assert len(first.encode('utf-8')) < MAX_FRAME_SIZE
+
+    say(chat_server, ana, ana_remote, "/list 51")
+    assert read_all(ana_remote) == b'Salas (p\xc3\xa1gina 51 de 51): #sala4999 (1)'
+
+# Prueba 6: la salida de un cliente solo se anuncia en sus salas
+def test_leave_is_announced_in_own_rooms(chat, chat_server):
+    ana, ana_remote = chat("Ana")
+    beto, beto_remote = chat("Beto")
+    _, carla_remote = chat("Carla")
+    say(chat_server, ana, ana_remote, "/join python")
+    say(chat_server, beto, beto_remote, "/join python")
+    say(chat_server, ana, ana_remote, "/part general")
+    read_all(beto_remote), read_all(carla_remote)
+
+    chat_server.drop(ana)
+    chat_server.flush_pending()
+    assert read_all(beto_remote) == 'Ana salió del chat.'.encode('utf-8')
+    assert read_all(carla_remote) == b''
@@ -0,0 +1,52 @@
+import select
+from unittest.mock import patch
+from conftest import read_all
+
+def send_nickname(peer, accepted, nickname):
+    """Envía el nickname y espera a que el servidor pueda leerlo."""
+    peer.send(nickname.encode('utf-8'))
+    select.select([accepted], [], [], 1)
+
+# Prueba 1: saludo completo - el cliente queda registrado tras enviar su nickname
+def test_handshake_registers_client(listener, chat_server):
+    peer, accepted = listener()
+
+    # Tras accept() el cliente recibe 'NICK' pero aún no está en el chat
+    assert peer.recv(1024) == b'NICK'
+    assert accepted in chat_server.handshakes
+    assert accepted not in chat_server.clients
+
+    send_nickname(peer, accepted, "Ana")
+    assert chat_server.handshake(accepted) is True
+
+    assert accepted in chat_server.clients
+    assert chat_server.nicknames[accepted] == "Ana"
+    assert accepted not in chat_server.handshakes
+
+# Prueba 2: el servidor rechaza los nicknames prohibidos
+def test_handshake_banned_nickname(listener, chat_server):
+    peer, accepted = listener()
+    peer.recv(1024)
+
+    send_nickname(peer, accepted, "Admin")
+    assert chat_server.handshake(accepted) is False
+    assert accepted not in chat_server.clients
+    assert "no está permitido" in read_all(peer).decode('utf-8')
+
+# Prueba 3: un cliente mudo no frena a los demás y caduca al agotar su plazo
+def test_silent_client_does_not_block(listener, chat_server):
+    silent_peer, silent = listener()
+    peer, accepted = listener()
+
+    send_nickname(peer, accepted, "Beto")
+    assert chat_server.handshake(accepted) is True
+    assert accepted in chat_server.clients
+    assert silent in chat_server.handshakes
+
+    deadline = chat_server.connections[silent].deadline
+    with patch('server.time.monotonic', return_value=deadline + 1):
+        chat_server.check_timers()
+
+    assert silent not in chat_server.connections
+    assert silent_peer.recv(1024) == b'NICK'
+    assert silent_peer.recv(1024) == b''  # El servidor cerró la conexión
@@ -0,0 +1,76 @@
+import argparse
+from unittest.mock import patch
+import pytest
+import server
+from server import ChatServer
+from protocol import CHAT, SYSTEM, FrameDecoder, encode
+from conftest import connect, launch, receive_until
+
+# Prueba 1: crear el servidor no abre ningún socket; start() elige un puerto libre
+def test_start_binds_ephemeral_port():
+    chat_server = ChatServer(port=0)
+    assert chat_server.listener is None
+
+    host, port = chat_server.start()
+    assert port != 0 and (host, port) == chat_server.listener.getsockname()
+    assert chat_server.start() == (host, port)  # Arrancar dos veces no crea otro socket
+    chat_server.close()
+
+# Prueba 2: dos servidores en el mismo proceso no comparten clientes ni mensajes
+def test_servers_are_isolated():
+    first, first_thread = launch()
+    second, second_thread = launch()
+    ana, beto = connect(first, "Ana"), connect(first, "Beto")
+    carla = connect(second, "Carla")
+    decoders = {sock: FrameDecoder() for sock in (ana, beto, carla)}
+
+    ana.sendall(encode(CHAT, b'Ana: hola'))
+    receive_until(beto, decoders[beto], (CHAT, b'Ana: hola'))
+
+    carla.sendall(encode(CHAT, b'Carla: hola'))
+    ana.sendall(encode(CHAT, b'Ana: sigo'))
+    assert receive_until(beto, decoders[beto], (CHAT, b'Ana: sigo')) == [(CHAT, b'Ana: sigo')]
+    assert len(first.clients) == 2 and len(second.clients) == 1
+
+    # En el segundo servidor el nickname de Ana está libre
+    ana_again = connect(second, "Ana")
+    frames = receive_until(carla, decoders[carla], (SYSTEM, 'Ana se unió al chat'.encode('utf-8')))
+    assert (CHAT, b'Ana: hola') not in frames
+
+    for chat_server, thread in ((first, first_thread), (second, second_thread)):
+        chat_server.stop()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert chat_server.listener is None
+    for sock in (ana, beto, carla, ana_again):
+        sock.close()
+
+# Prueba 3: stop() desconecta a los clientes y libera el puerto
+def test_stop_closes_connections():
+    chat_server, thread = launch()
+    address = (chat_server.host, chat_server.port)
+    ana = connect(chat_server, "Ana")
+
+    chat_server.stop()
+    thread.join(5)
+    assert ana.recv(1024) == b''
+    ana.close()
+
+    # El puerto queda libre para otro servidor
+    again = ChatServer(*address)
+    assert again.start() == address
+    again.close()
+
+# Prueba 4: los límites del búfer de salida se configuran desde la línea de comandos
+@patch.multiple('server', HIGH_WATERMARK=server.HIGH_WATERMARK, LOW_WATERMARK=server.LOW_WATERMARK,
+                MAX_BUFFER=server.MAX_BUFFER, SLOW_CONSUMER_TIMEOUT=server.SLOW_CONSUMER_TIMEOUT)
+def test_watermark_options():
+    parser = argparse.ArgumentParser()
+    server.add_arguments(parser)
+    server.configure_from_args(parser.parse_args(['--high-watermark', '2048', '--low-watermark', '1024',
+                                                  '--max-buffer', '8192', '--slow-consumer-timeout', '2.5']))
+    assert (server.HIGH_WATERMARK, server.LOW_WATERMARK, server.MAX_BUFFER) == (2048, 1024, 8192)
+    assert server.SLOW_CONSUMER_TIMEOUT == 2.5
+
+    with pytest.raises(SystemExit):
+        server.configure_from_args(parser.parse_args(['--high-watermark', '1024', '--low-watermark', '2048']))
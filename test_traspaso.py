@@ -0,0 +1,143 @@
+import socket
+import time
+from unittest.mock import patch
+from handoff import Handoff, adopt, encode_bytes, receive_batch, take
+from server import ChatServer
+from protocol import CHAT, SYSTEM, ZLIB, FrameDecoder, StreamDecoder, encode
+from conftest import connect, read_all, receive_until, serve, wait_for
+
+def launch_handoff(path):
+    """Arranca un servidor que atiende traspasos en `path`; devuelve (servidor, hilo)."""
+    chat_server = ChatServer(port=0)
+    chat_server.start()
+    Handoff(chat_server, path).listen()
+    return chat_server, serve(chat_server)
+
+def receive_text(sock, text):
+    """Lee de un cliente en texto plano hasta recibir `text`; devuelve todo lo recibido."""
+    data = b''
+    while text not in data:
+        chunk = sock.recv(65536)
+        assert chunk, "Conexión cerrada antes de tiempo"
+        data += chunk
+    return data
+
+# Prueba 1: el proceso nuevo se queda con los clientes, sus salas y lo que estaba a medio llegar
+def test_takeover_keeps_clients(tmp_path):
+    path = str(tmp_path / 'traspaso.sock')
+    old, old_thread = launch_handoff(path)
+    ana, beto = connect(old, "Ana"), connect(old, "Beto", framed=False)
+    decoder = FrameDecoder()
+
+    ana.sendall(encode(CHAT, b'/join python'))
+    receive_until(ana, decoder, (SYSTEM, 'Entraste en #python.'.encode('utf-8')))
+    ana.sendall(encode(CHAT, b'/join general'))
+    receive_until(ana, decoder, (SYSTEM, b'Ahora hablas en #general.'))
+
+    # Media trama antes del traspaso: el resto llega al proceso nuevo
+    frame = encode(CHAT, b'Ana: sin cortes')
+    ana.sendall(frame[:5])
+    time.sleep(0.1)
+
+    new = ChatServer()
+    assert take(new, path) == 2
+    old_thread.join(5)
+    assert not old_thread.is_alive()
+    assert (new.host, new.port) == (old.host, old.port)
+    assert new.memberships[new.by_nick["ana"]] == {"general", "python"}
+    assert new.connections[new.by_nick["ana"]].room == "general"
+    assert len(new.histories.get("general")) == 2  # Las entradas de Ana y de Beto
+
+    new_thread = serve(new)
+    ana.sendall(frame[5:])
+    assert receive_text(beto, b'Ana: sin cortes').endswith(b'Ana: sin cortes')
+
+    # Las conexiones nuevas llegan al socket de escucha heredado
+    carla = connect(new, "Carla")
+    beto.sendall(b'Beto: hola Carla')
+    receive_until(carla, FrameDecoder(), (CHAT, b'Beto: hola Carla'))
+
+    new.stop()
+    new_thread.join(5)
+    for sock in (ana, beto, carla):
+        sock.close()
+
+# Prueba 2: si el proceso nuevo se cae a mitad, el actual sigue atendiendo a sus clientes
+def test_failed_takeover_keeps_serving(tmp_path):
+    path = str(tmp_path / 'traspaso.sock')
+    old, old_thread = launch_handoff(path)
+    ana, beto = connect(old, "Ana"), connect(old, "Beto")
+
+    control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    control.settimeout(2)
+    control.connect(path)
+    while receive_batch(control) is not None:
+        pass
+    control.close()  # Sin ACK
+
+    ana.sendall(encode(CHAT, b'Ana: sigo aqui'))
+    receive_until(beto, FrameDecoder(), (CHAT, b'Ana: sigo aqui'))
+    assert old_thread.is_alive() and len(old.clients) == 2
+
+    old.stop()
+    old_thread.join(5)
+    for sock in (ana, beto):
+        sock.close()
+
+# Prueba 3: los clientes con compresión siguen conectados: el flujo zlib del proceso
+# actual se cierra y el nuevo empieza otro
+def test_compressed_clients_survive(tmp_path):
+    path = str(tmp_path / 'traspaso.sock')
+    old, old_thread = launch_handoff(path)
+    zipped = connect(old, "Ana", capabilities=(ZLIB,))
+    plain = connect(old, "Beto")
+    decoder = StreamDecoder()
+
+    plain.sendall(encode(CHAT, b'Beto: antes'))
+    receive_until(zipped, decoder, (CHAT, b'Beto: antes'))
+
+    new = ChatServer()
+    assert take(new, path) == 2
+    old_thread.join(5)
+    assert new.connections[new.by_nick["ana"]].compressor is not None
+
+    new_thread = serve(new)
+    plain.sendall(encode(CHAT, b'Beto: despues'))
+    receive_until(zipped, decoder, (CHAT, b'Beto: despues'))
+    zipped.sendall(encode(CHAT, b'Ana: sigo aqui'))
+    receive_until(plain, FrameDecoder(), (CHAT, b'Ana: sigo aqui'))
+
+    new.stop()
+    new_thread.join(5)
+    for sock in (zipped, plain):
+        sock.close()
+
+# Prueba 4: tras soltar los sockets (detach) el servidor sigue pudiendo despertar y parar su bucle
+def test_stop_after_detach():
+    chat_server = ChatServer(port=0, metrics_address=('127.0.0.1', 0))
+    chat_server.start()
+    chat_server.detach()
+    assert chat_server.exporter is None and chat_server.listener is None
+
+    thread = serve(chat_server)
+    wait_for(lambda: chat_server.running)
+    chat_server.stop()
+    thread.join(2)
+    assert not thread.is_alive()
+
+# Prueba 5: si el proceso nuevo no limita la frecuencia, los mensajes aplazados se entregan al adoptarlos
+@patch('server.RATE_MESSAGES', 0)
+@patch('server.RATE_BYTES', 0)
+def test_adopt_deferred_without_limits(chat, chat_server):
+    _, beto_remote = chat("Beto")
+    read_all(beto_remote)
+    local, remote = socket.socketpair()
+    state = {'nickname': "Ana", 'framed': False, 'input': '', 'output': '', 'room': 'general', 'rooms': ['general'],
+             'deferred': [encode_bytes(b'Ana: uno'), encode_bytes(b'Ana: dos')]}
+
+    adopt(chat_server, local, state)
+    assert local not in chat_server.throttled
+    assert chat_server.release_deferred() is None
+    chat_server.flush_pending()
+    assert read_all(beto_remote) == b'Ana: unoAna: dos'
+    remote.close()
@@ -0,0 +1,58 @@
+"""
+Rueda de temporizadores (hashed timer wheel) para los plazos de las conexiones.
+
+Cada plazo cae en la ranura `tick % size` de su instante; avanzar la rueda solo
+visita las ranuras de los ticks transcurridos y, dentro de ellas, las entradas
+que vencen ahí (o que dan más vueltas y se dejan donde están). Así el coste por
+vuelta del bucle es O(ticks transcurridos + plazos vencidos), nunca O(conexiones).
+
+Cada clave tiene como mucho un plazo: programarla de nuevo sustituye al
+anterior, y cancelarla es O(1).
+"""
+import math
+
+class TimerWheel:
+    def __init__(self, tick=1.0, size=64, now=0.0):
+        self.tick = tick  # Resolución en segundos (los plazos pueden vencer hasta un tick tarde)
+        self.slots = [{} for _ in range(size)]  # clave -> plazo
+        self.where = {}  # clave -> ranura en la que está
+        self.current = int(now // tick)  # Último tick procesado
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, key):
+        return key in self.where
+
+    def schedule(self, key, deadline):
+        self.cancel(key)
+        # Nunca en un tick ya procesado: como pronto, en el siguiente
+        tick = max(math.ceil(deadline / self.tick), self.current + 1)
+        slot = self.slots[tick % len(self.slots)]
+        slot[key] = deadline
+        self.where[key] = slot
+
+    def cancel(self, key):
+        slot = self.where.pop(key, None)
+        if slot is not None:
+            del slot[key]
+
+    def advance(self, now):
+        """Avanza hasta `now` y devuelve las claves cuyo plazo ha vencido."""
+        target = int(now // self.tick)
+        if target <= self.current:
+            return []
+
+        # Tras más de una vuelta completa basta con visitar cada ranura una vez
+        first = max(self.current + 1, target - len(self.slots) + 1)
+        self.current = target
+
+        expired = []
+        for tick in range(first, target + 1):
+            slot = self.slots[tick % len(self.slots)]
+            due = [key for key, deadline in slot.items() if deadline <= now]
+            for key in due:
+                del slot[key]
+                del self.where[key]
+            expired += due
+        return expired